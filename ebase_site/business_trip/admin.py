@@ -1,13 +1,10 @@
-import re
-import time
 from decimal import Decimal
 
 from django.contrib import admin
-from django.db.models import DecimalField, Max, Sum, Value
+from django.db.models import DecimalField, Sum, Value
 from django.db.models.functions import Coalesce
 from django.utils.html import mark_safe
 
-from business_trip.docx_create import create_trip_order
 from business_trip.forms import BusinessTripForm
 from business_trip.models import (
     BusinessTrip,
@@ -15,9 +12,14 @@ from business_trip.models import (
     BusinessTripExpense,
     BusinessTripPhoto,
     ExpenseType,
+    trip_numbers,
 )
+from documents.admin import document_field
+from documents.archive import documents_zip_response
+from documents.models import DocumentJob
 from users.models import CompanyUser
 from utils import MainModelAdmin
+from utils.list_filters import CachedChoicesFilter
 
 
 @admin.register(ExpenseType)
@@ -82,13 +84,14 @@ class BusinessTripPhotoInline(admin.StackedInline):
         return "Нет изображения"
 
 
-class EmployeeUsedInTripsFilter(admin.SimpleListFilter):
+class EmployeeUsedInTripsFilter(CachedChoicesFilter):
     """Фильтр по сотруднику: только те, кто фигурирует в карточках командировок."""
 
     title = "Сотрудник"
     parameter_name = "employee"
+    choices_models = (BusinessTrip, CompanyUser)
 
-    def lookups(self, request, model_admin):
+    def load_choices(self):
         employees = (
             CompanyUser.objects.filter(business_trip_employee__isnull=False)
             .distinct()
@@ -104,6 +107,7 @@ class EmployeeUsedInTripsFilter(admin.SimpleListFilter):
 
 @admin.register(BusinessTrip)
 class BusinessTripAdmin(MainModelAdmin):
+    actions = MainModelAdmin.actions + ["download_orders_zip"]
     date_hierarchy = "beg_dt"
     list_filter = (EmployeeUsedInTripsFilter, "service_type")
     search_fields = (
@@ -173,22 +177,9 @@ class BusinessTripAdmin(MainModelAdmin):
 
     @admin.display(description="Приказ о направлении в командировку")
     def order_trip_url(self, obj):
-        if obj.order_trip:
-            url = re.sub(r".*/docs", "/media/docs", obj.order_trip)
-            file_name = obj.order_trip.split("/")[-1]
-            time_version = int(time.time())
-            return mark_safe(
-                f'<span class="akt-span">'
-                f'<a href="{url}?v={time_version}">{file_name}</a>'
-                f"</span>"
-                f'<input type="button" id="order-trip-btn" value="Обновить">'
-            )
-        if obj.pk:
-            return mark_safe(
-                f'<span class="akt-span">Приказ не создан</span>'
-                f'<input type="button" id="order-trip-btn" value="Создать">'
-            )
-        return mark_safe('<span class="akt-span">-------</span>')
+        return document_field(
+            obj, DocumentJob.Kind.ORDER_TRIP, "order-trip-btn", "Приказ не создан"
+        )
 
     list_display = (
         "doc_number",
@@ -228,31 +219,25 @@ class BusinessTripAdmin(MainModelAdmin):
         )
 
     def get_form(self, request, obj=None, **kwargs):
-        """Перехват GET-параметра ``order_trip=create`` для формирования приказа.
-
-        Кнопка «Создать»/«Обновить» в разделе «Документы» через JS добавляет
-        в URL ``?order_trip=create`` и перезагружает страницу. Здесь мы
-        отрабатываем этот параметр — генерируем приказ и сохраняем путь в
-        ``obj.order_trip``.
-        """
-        if request.GET.get("order_trip") and obj:
-            doc_number = create_trip_order(obj)
-            self.message_user(
-                request,
-                message=f"Приказ о направлении в командировку №{doc_number} сформирован.",
-            )
         form = super().get_form(request, obj, **kwargs)
         if obj is None:
             if "employee" in form.base_fields:
                 form.base_fields["employee"].initial = request.user.id
             if "doc_number" in form.base_fields:
-                max_num = (
-                    BusinessTrip.objects.aggregate(max_num=Max("doc_number"))["max_num"]
-                    or 0
-                )
-                form.base_fields["doc_number"].initial = max_num + 1
+                # Номер только подсказывается: пустое поле получит номер
+                # из счётчика при сохранении, без гонки между пользователями
+                field = form.base_fields["doc_number"]
+                field.widget.attrs["placeholder"] = trip_numbers.peek()
+                field.help_text = "Оставьте пустым — номер будет присвоен при сохранении"
         return form
 
+    @admin.action(description="Скачать приказы архивом (ZIP)")
+    def download_orders_zip(self, request, queryset):
+        """Приказы выбранных командировок одним архивом; недостающие формируются."""
+        return documents_zip_response(
+            queryset, (DocumentJob.Kind.ORDER_TRIP,), prefix="trip_orders"
+        )
+
     def save_model(self, request, obj, form, change):
         if not change:
             obj.user = request.user
@@ -4,9 +4,9 @@ import os
 from pathlib import Path
 
 from django.conf import settings
-from docx import Document
 from docx.text.paragraph import Paragraph
 
+from documents.docx_template import fingerprint, is_current, render_template
 from .models import BusinessTrip
 
 
@@ -45,19 +45,36 @@ def _replace_placeholders_in_paragraph(paragraph: Paragraph, replacements: dict)
         run.font.name = font_name
 
 
-def _iter_all_paragraphs(doc):
-    """Итерация по всем абзацам документа: основные + в ячейках таблиц."""
-    for paragraph in doc.paragraphs:
-        yield paragraph
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    yield paragraph
+class TripOrder:
+    """Данные приказа: путь файла и отпечаток; документ формирует ``render()``.
 
+    Объект можно передать в другой процесс (pickle): для формирования
+    файла обращения к БД не нужны.
+    """
+
+    def __init__(self, template_path, replacements: dict, rest_line: str, save_file_path: str):
+        self.template_path = template_path
+        self.replacements = replacements
+        self.rest_line = rest_line
+        self.save_file_path = save_file_path
+        self.fingerprint = fingerprint(
+            template_path, {"replacements": replacements, "rest_line": rest_line}
+        )
+
+    def is_current(self) -> bool:
+        """Файл уже сформирован из тех же данных и той же версии шаблона."""
+        return is_current(self.save_file_path, self.fingerprint)
+
+    def render(self):
+        """Формирует файл приказа."""
+        _render_trip_order(
+            self.template_path, self.replacements, self.rest_line,
+            self.save_file_path, self.fingerprint,
+        )
 
-def create_trip_order(obj: BusinessTrip):
-    """Создание приказа о направлении работника в командировку.
+
+def trip_order(obj: BusinessTrip) -> TripOrder:
+    """Данные приказа о направлении работника в командировку.
 
     Шаблон: ``MEDIA_ROOT/docs/trips/order_trip.docx``
     Сохранение: ``MEDIA_ROOT/docs/trips/trip<doc_number>/Приказ_о_направлении_в_командировку_<doc_number>.docx``
@@ -73,10 +90,8 @@ def create_trip_order(obj: BusinessTrip):
         ``{{ DAYS_COUNT }}``    — количество дней командировки
 
     :param obj: объект командировки
-    :return: номер документа командировки
     """
     template_path = Path(settings.MEDIA_ROOT, "docs", "trips", "order_trip.docx")
-    doc = Document(str(template_path))
 
     # --- ФИО сотрудника ---
     emp = obj.employee
@@ -119,15 +134,44 @@ def create_trip_order(obj: BusinessTrip):
         "{{ DAYS_COUNT }}": str(obj.days_count or ""),
     }
 
-    # Запоминаем индекс абзаца с местом назначения — до замены
-    depart_par_idx = None
-    for i, paragraph in enumerate(doc.paragraphs):
-        if "{{ DEPART_CITY }}" in paragraph.text:
-            depart_par_idx = i
-            break
+    trip_doc_number = f"trip{obj.doc_number}"
+    save_dir = Path(settings.MEDIA_ROOT, "docs", "trips", trip_doc_number)
+    save_file_name = f"Приказ_о_направлении_в_командировку_{obj.doc_number}.docx"
+    save_path = str(Path(save_dir, save_file_name))
+
+    return TripOrder(template_path, replacements, rest_line, save_path)
+
 
-    # Заменяем плейсхолдеры во всех абзацах (включая таблицы)
-    for paragraph in _iter_all_paragraphs(doc):
+def create_trip_order(obj: BusinessTrip):
+    """Создание приказа о направлении работника в командировку (см. trip_order).
+
+    :param obj: объект командировки
+    :return: номер документа командировки
+    """
+    order = trip_order(obj)
+    # Данные и шаблон не менялись — готовый файл не формируется заново
+    if not order.is_current():
+        order.render()
+
+    if obj.order_trip != order.save_file_path:
+        obj.order_trip = order.save_file_path
+        # Без save(): он пересчитал бы номер, суточные и запустил сигналы командировки
+        BusinessTrip.objects.filter(pk=obj.pk).update(order_trip=order.save_file_path)
+
+    return obj.doc_number
+
+
+def _render_trip_order(template_path, replacements, rest_line, save_path, order_fingerprint):
+    """Заполняет шаблон приказа и сохраняет файл с отпечатком данных."""
+    template = render_template(template_path)
+    doc = template.document
+
+    # Индекс абзаца с местом назначения — из индекса шаблона
+    depart_locations = template.locations("{{ DEPART_CITY }}", body=True)
+    depart_par_idx = depart_locations[0].paragraph if depart_locations else None
+
+    # Заменяем плейсхолдеры только в абзацах, где они есть (включая таблицы)
+    for paragraph in template.paragraphs(*replacements):
         _replace_placeholders_in_paragraph(paragraph, replacements)
 
     # --- Перенос оставшихся пунктов на строку P15 ---
@@ -148,16 +192,7 @@ def create_trip_order(obj: BusinessTrip):
                     run.font.name = src.font.name
 
     # --- Сохранение ---
-    trip_doc_number = f"trip{obj.doc_number}"
-    save_dir = Path(settings.MEDIA_ROOT, "docs", "trips", trip_doc_number)
+    save_dir = os.path.dirname(save_path)
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
-
-    save_file_name = f"Приказ_о_направлении_в_командировку_{obj.doc_number}.docx"
-    save_path = str(Path(save_dir, save_file_name))
-    doc.save(save_path)
-
-    obj.order_trip = save_path
-    obj.save()
-
-    return obj.doc_number
+    template.save(save_path, order_fingerprint)
@@ -1,9 +1,11 @@
 from decimal import Decimal
 
+from django.contrib.contenttypes.fields import GenericRelation
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
+from documents.numbering import DocumentNumbering
 from ebase.models import EbaseModel
 
 company = '"medsil"'  # название схемы для таблиц
@@ -109,6 +111,8 @@ class BusinessTrip(EbaseModel):
         verbose_name="Приказ о направлении в командировку",
         db_comment="Путь к файлу приказа о направлении работника в командировку",
     )
+    # Задания на формирование приказа и их статусы (documents.DocumentJob)
+    document_jobs = GenericRelation("documents.DocumentJob")
 
     class Meta:
         db_table = f'{company}."business_trip"'
@@ -138,17 +142,20 @@ class BusinessTrip(EbaseModel):
             return Decimal("0")
         return Decimal(days) * Decimal(DAILY_ALLOWANCE_RATE)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Номер из БД: повторное сохранение с ним счётчик не трогает
+        instance._loaded_doc_number = instance.__dict__.get("doc_number")
+        return instance
+
     def _assign_doc_number(self):
-        # max+1 без блокировки: допустимо для внутренней админки с единичными
-        # одновременными пользователями; уникальность гарантирует constraint.
+        # Номер берётся из счётчика (documents.numbering) в транзакции
+        # сохранения; введённый вручную номер сдвигает счётчик вперёд.
         if self.doc_number is None:
-            max_num = (
-                BusinessTrip.objects.aggregate(max_num=models.Max("doc_number"))[
-                    "max_num"
-                ]
-                or 0
-            )
-            self.doc_number = max_num + 1
+            self.doc_number = trip_numbers.reserve()
+        elif self.doc_number != getattr(self, "_loaded_doc_number", None):
+            trip_numbers.commit(self.doc_number)
 
     def clean(self):
         from django.core.exceptions import ValidationError
@@ -157,7 +164,6 @@ class BusinessTrip(EbaseModel):
             raise ValidationError({"end_dt": "Дата возвращения раньше даты выезда."})
 
     def save(self, *args, **kwargs):
-        self._assign_doc_number()
         self.allowance_amount = self._calc_allowance()
         update_fields = kwargs.get("update_fields")
         if update_fields is not None:
@@ -165,7 +171,13 @@ class BusinessTrip(EbaseModel):
                 "doc_number",
                 "allowance_amount",
             }
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            self._assign_doc_number()
+            super().save(*args, **kwargs)
+        self._loaded_doc_number = self.doc_number
+
+
+trip_numbers = DocumentNumbering("business_trip", BusinessTrip, "doc_number")
 
 
 class BusinessTripDestination(EbaseModel):
@@ -7,7 +7,8 @@ from decimal import Decimal, ROUND_DOWN
 
 from django.db.models import Sum
 
-from .models import BusinessTripContractExpense
+from utils.deferred import CoalescingScheduler
+from .models import BusinessTrip, BusinessTripContractExpense
 
 TWO_PLACES = Decimal("0.01")
 
@@ -75,9 +76,38 @@ def recalc_trip_contract_shares(trip):
 
 def sync_trip_contract_shares(trip):
     """Пересчитывает доли командировки и обновляет затраты затронутых контрактов."""
-    from contracts.models import Contract
-    from contracts.signals import recalc_contract
+    _sync_scheduled([trip])
 
-    affected_ids = recalc_trip_contract_shares(trip)
-    for contract in Contract.objects.filter(pk__in=affected_ids):
-        recalc_contract(contract)
+
+def _sync_scheduled(trips):
+    """Пересчёт долей запланированных командировок: объекты — на месте,
+    ID — с загрузкой одним запросом. Затронутые контракты всех командировок
+    пересчитываются вместе, одним проходом."""
+    from contracts.services import schedule_contract_recalc
+
+    trip_ids = {trip for trip in trips if not isinstance(trip, BusinessTrip)}
+    trips = [trip for trip in trips if isinstance(trip, BusinessTrip)]
+    if trip_ids:
+        # Удалённые за время batch командировки просто не найдутся
+        trips += BusinessTrip.objects.filter(pk__in=trip_ids)
+
+    affected_ids = set()
+    for trip in trips:
+        affected_ids |= recalc_trip_contract_shares(trip)
+    schedule_contract_recalc(*affected_ids)
+
+
+# Сигналы затрат, пунктов, контрактов и самой командировки планируют
+# пересчёт долей здесь: внутри deferred_batch() (сохранение из админки
+# с инлайнами) каждая командировка пересчитывается один раз после коммита,
+# вне его — сразу. Сколько повторных пересчётов поглощено — в
+# trip_share_sync.stats()["coalesced"].
+trip_share_sync = CoalescingScheduler("trip_share_sync", _sync_scheduled)
+
+
+def schedule_trip_share_sync(*trips):
+    """Планирует пересчёт долей командировок (объекты BusinessTrip или ID)."""
+    if trip_share_sync.active:
+        # В batch копятся только ID, чтобы повторы схлопывались
+        trips = [getattr(trip, "pk", trip) for trip in trips]
+    trip_share_sync.schedule(*trips)
@@ -20,7 +20,7 @@ from .models import (
     BusinessTripDestination,
     BusinessTripExpense,
 )
-from .services import sync_trip_contract_shares
+from .services import schedule_trip_share_sync
 
 
 @receiver(m2m_changed, sender=BusinessTrip.contract.through)
@@ -28,12 +28,12 @@ def trip_contracts_changed(sender, instance, action, reverse, **kwargs):
     """Изменился список контрактов командировки."""
     if reverse or action not in ("post_add", "post_remove", "post_clear"):
         return
-    sync_trip_contract_shares(instance)
+    schedule_trip_share_sync(instance)
 
 
 @receiver(post_save, sender=BusinessTripExpense)
 def trip_expense_saved(sender, instance, **kwargs):
-    sync_trip_contract_shares(instance.business_trip)
+    schedule_trip_share_sync(instance.business_trip)
 
 
 @receiver(post_delete, sender=BusinessTripExpense)
@@ -43,12 +43,12 @@ def trip_expense_deleted(sender, instance, **kwargs):
     except BusinessTrip.DoesNotExist:
         # Затрата удалена каскадом вместе с командировкой — пересчёт не нужен
         return
-    sync_trip_contract_shares(trip)
+    schedule_trip_share_sync(trip)
 
 
 @receiver(post_save, sender=BusinessTripDestination)
 def trip_destination_saved(sender, instance, **kwargs):
-    sync_trip_contract_shares(instance.business_trip)
+    schedule_trip_share_sync(instance.business_trip)
 
 
 @receiver(post_delete, sender=BusinessTripDestination)
@@ -57,13 +57,13 @@ def trip_destination_deleted(sender, instance, **kwargs):
         trip = instance.business_trip
     except BusinessTrip.DoesNotExist:
         return
-    sync_trip_contract_shares(trip)
+    schedule_trip_share_sync(trip)
 
 
 @receiver(post_save, sender=BusinessTrip)
 def trip_saved(sender, instance, **kwargs):
     """Даты командировки влияют на суточные, значит и на доли контрактов."""
-    sync_trip_contract_shares(instance)
+    schedule_trip_share_sync(instance)
 
 
 @receiver(pre_delete, sender=BusinessTrip)
@@ -76,12 +76,9 @@ def trip_pre_delete(sender, instance, **kwargs):
 
 @receiver(post_delete, sender=BusinessTrip)
 def trip_post_delete(sender, instance, **kwargs):
-    from contracts.signals import recalc_contract
+    from contracts.services import schedule_contract_recalc
 
-    for contract in Contract.objects.filter(
-        pk__in=getattr(instance, "_expense_contract_ids", [])
-    ):
-        recalc_contract(contract)
+    schedule_contract_recalc(*getattr(instance, "_expense_contract_ids", []))
 
 
 @receiver(pre_save, sender=Contract)
@@ -102,5 +99,4 @@ def contract_post_save(sender, instance, **kwargs):
     """При смене клиента контракта пересчитываем доли всех его командировок."""
     if instance.client_id == getattr(instance, "_old_client_id", None):
         return
-    for trip in instance.business_trip.all():
-        sync_trip_contract_shares(trip)
+    schedule_trip_share_sync(*instance.business_trip.all())
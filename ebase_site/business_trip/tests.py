@@ -2,12 +2,13 @@ import tempfile
 from datetime import date
 from decimal import Decimal
 
+from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db import IntegrityError
 from django.db.models import Sum
-from django.test import TestCase, override_settings
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
 
 from business_trip.models import (
@@ -18,8 +19,12 @@ from business_trip.models import (
     ExpenseType,
 )
 from clients.models import Client, Department
+from business_trip.services import trip_share_sync
 from contracts.models import Contract
+from contracts.services import contract_recalc
 from directory.models import City
+from utils.deferred import deferred_batch
+from utils.list_filters import filter_choices
 
 User = get_user_model()
 
@@ -398,6 +403,79 @@ class BusinessTripContractExpenseTests(TestCase):
         self.assertEqual(self.contract1.expenses_amount, Decimal("0"))
 
 
+class BusinessTripShareSyncBatchTests(TestCase):
+    """Пересчёт долей откладывается до коммита и выполняется один раз."""
+
+    def setUp(self):
+        self.employee = User.objects.create_user(username="ivanov", password="pass")
+        city, _ = City.objects.get_or_create(name="Москва", defaults={"region": None})
+        client = Client.objects.create(name="Клиент 1", city=city, inn="111111111111")
+        self.departments = [
+            Department.objects.create(
+                name=f"Отделение {n}", client=client, city=city, address=f"ул. Ленина, {n}"
+            )
+            for n in range(1, 4)
+        ]
+        self.contract = Contract.objects.create(
+            client=client,
+            contract_number="CNT-001",
+            conclusion_date=date(2026, 1, 10),
+            contract_amount=Decimal("100000"),
+        )
+        self.expense_type = ExpenseType.objects.create(name="Такси")
+        self.trip = BusinessTrip.objects.create(
+            employee=self.employee, beg_dt=date(2026, 3, 26), end_dt=date(2026, 3, 26)
+        )
+        self.trip.contract.add(self.contract)
+        trip_share_sync.reset_stats()
+        contract_recalc.reset_stats()
+
+    def test_trip_synced_once_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with deferred_batch():
+                for department in self.departments:
+                    BusinessTripDestination.objects.create(
+                        business_trip=self.trip,
+                        department=department,
+                        beg_dt=date(2026, 3, 26),
+                        end_dt=date(2026, 3, 26),
+                    )
+                for _ in range(8):
+                    BusinessTripExpense.objects.create(
+                        business_trip=self.trip,
+                        expense_type=self.expense_type,
+                        date=date(2026, 3, 26),
+                        amount=Decimal("100.00"),
+                    )
+                self.trip.save()
+
+        self.assertEqual(
+            trip_share_sync.stats(), {"scheduled": 12, "coalesced": 11, "flushes": 1}
+        )
+        self.assertEqual(contract_recalc.stats()["flushes"], 1)
+        self.contract.refresh_from_db()
+        # 8 × 100 (затраты) + 700 (суточные)
+        self.assertEqual(self.contract.expenses_amount, Decimal("1500.00"))
+
+    def test_sync_is_immediate_outside_batch(self):
+        BusinessTripDestination.objects.create(
+            business_trip=self.trip,
+            department=self.departments[0],
+            beg_dt=date(2026, 3, 26),
+            end_dt=date(2026, 3, 26),
+        )
+        BusinessTripExpense.objects.create(
+            business_trip=self.trip,
+            expense_type=self.expense_type,
+            date=date(2026, 3, 26),
+            amount=Decimal("300.00"),
+        )
+
+        self.assertEqual(trip_share_sync.stats()["flushes"], 2)
+        self.contract.refresh_from_db()
+        self.assertEqual(self.contract.expenses_amount, Decimal("1000.00"))
+
+
 class BusinessTripExpensesTotalTests(TestCase):
     """Тесты расчёта итоговых затрат (командировочные + затраты на поездку)."""
 
@@ -489,3 +567,40 @@ class BusinessTripAdminSmokeTests(TestCase):
             reverse("admin:business_trip_expensetype_changelist")
         )
         self.assertEqual(response.status_code, 200)
+
+
+class EmployeeUsedInTripsFilterTests(TestCase):
+    def setUp(self):
+        from business_trip.admin import EmployeeUsedInTripsFilter
+
+        self.filter_class = EmployeeUsedInTripsFilter
+        filter_choices.clear()
+        self.ivanov = User.objects.create_user(
+            username="ivanov", password="pass", first_name="Иван", last_name="Иванов"
+        )
+        self.petrov = User.objects.create_user(
+            username="petrov", password="pass", first_name="Пётр", last_name="Петров"
+        )
+        BusinessTrip.objects.create(
+            employee=self.ivanov, beg_dt=date(2026, 3, 16), end_dt=date(2026, 3, 19)
+        )
+
+    def lookups(self):
+        model_admin = admin.site._registry[BusinessTrip]
+        request = RequestFactory().get("/admin/business_trip/businesstrip/")
+        return self.filter_class(request, {}, BusinessTrip, model_admin).lookup_choices
+
+    def test_choices_are_cached_until_trips_change(self):
+        self.assertEqual([pk for pk, _ in self.lookups()], [self.ivanov.pk])
+        with self.assertNumQueries(0):
+            self.lookups()
+
+        BusinessTrip.objects.create(
+            employee=self.petrov, beg_dt=date(2026, 4, 1), end_dt=date(2026, 4, 3)
+        )
+        self.assertEqual(
+            [pk for pk, _ in self.lookups()], [self.ivanov.pk, self.petrov.pk]
+        )
+        key = self.filter_class.choices_key()
+        self.assertEqual(filter_choices.stats()[key], {"hits": 1, "misses": 2})
+
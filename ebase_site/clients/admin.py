@@ -3,6 +3,7 @@ from django.contrib import admin
 from clients.models import Client, Department, DeptContactPers
 from directory.models import Position
 from utils import MainModelAdmin
+from utils.search import FullTextSearchMixin
 
 
 @admin.register(Client)
@@ -27,9 +28,10 @@ class ClientAdmin(MainModelAdmin):
 
 
 @admin.register(Department)
-class DepartmentAdmin(MainModelAdmin):
+class DepartmentAdmin(FullTextSearchMixin, MainModelAdmin):
     list_display = ('name', 'client_name', 'city_name', 'address', 'create_dt')
     search_fields = ('name', 'client__name')
+    search_similarity_field = 'name'
     search_help_text = 'Поиск по подразделению или клиенту'
     ordering = ('name',)
 
@@ -5,3 +5,6 @@ class ClientsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "clients"
     verbose_name = "Клиенты"
+
+    def ready(self):
+        import clients.signals
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:16
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# GIN-индексы поиска: pg_trgm под ILIKE по search_fields админки (Django
+# строит icontains как UPPER(col::text) LIKE UPPER(...)), и по tsvector-документу
+SEARCH_INDEXES = (
+    ("department_name_trgm", "department", '(UPPER("name"::text)) gin_trgm_ops'),
+    ("client_name_trgm", "client", '(UPPER("name"::text)) gin_trgm_ops'),
+    ("department_search_doc", "department", '"search_document"'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='department',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(db_comment='tsvector для поиска: подразделение, клиент, адрес', editable=False, null=True, verbose_name='Поисковый документ'),
+        ),
+    ] + [
+        migrations.RunSQL(
+            f'CREATE INDEX IF NOT EXISTS {name} ON "medsil"."{table}" USING gin ({expr})',
+            reverse_sql=f'DROP INDEX IF EXISTS "medsil".{name}',
+        )
+        for name, table, expr in SEARCH_INDEXES
+    ]
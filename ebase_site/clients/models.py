@@ -1,5 +1,6 @@
 import uuid
 
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
 from ebase.models import EbaseModel
@@ -79,6 +80,13 @@ class Department(EbaseModel):
         db_comment='ID Города подразделения',
         help_text='Города в котором расположено подразделение',
     )
+    search_document = SearchVectorField(
+        null=True, editable=False, verbose_name='Поисковый документ',
+        db_comment='tsvector для поиска: подразделение, клиент, адрес',
+    )
+
+    # Связи для поискового документа (см. utils.search)
+    search_select_related = ('client',)
 
     class Meta:
         db_table = f'{company}."department"'
@@ -101,6 +109,13 @@ class Department(EbaseModel):
     def __repr__(self):
         return f"<Department {self.name=!r}"
 
+    def search_document_parts(self):
+        return [
+            (self.name, 'A'),
+            (self.client.name if self.client else None, 'B'),
+            (self.address, 'C'),
+        ]
+
 
 class DeptContactPers(EbaseModel):
     """Контактные лица подразделения"""
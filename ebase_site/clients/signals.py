@@ -0,0 +1,17 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from utils.search import refresh_search_documents
+from .models import Client, Department
+
+
+@receiver(post_save, sender=Department)
+def department_search_document(sender, instance, **kwargs):
+    refresh_search_documents(Department.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Client)
+def client_search_document(sender, instance, created, **kwargs):
+    """Наименование клиента входит в документы его подразделений."""
+    if not created:
+        refresh_search_documents(Department.objects.filter(client=instance))
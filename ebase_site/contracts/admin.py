@@ -75,6 +75,10 @@ class ContractAdmin(MainModelAdmin):
         "payment_status_colored",
     )
     list_filter = ("payment_status",)
+    export_fields = {
+        "client_display": "client__name",
+        "payment_status_colored": "payment_status",
+    }
     search_fields = (
         "contract_number",
         "order_number_1c",
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from contracts.services import recalc_contracts
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает суммы оплат, затраты, долг, прибыль и статус оплаты "
+        "контрактов (сверка реестра)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int, help="ID контрактов")
+        parser.add_argument(
+            "--all", action="store_true", help="Пересчитать весь реестр контрактов"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Сколько контрактов записывать одним bulk_update",
+        )
+
+    def handle(self, *args, **options):
+        if not options["all"] and not options["ids"]:
+            raise CommandError("Укажите ID контрактов или --all")
+        started = time.monotonic()
+        updated = recalc_contracts(
+            None if options["all"] else options["ids"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Обновлено контрактов: {updated} за {time.monotonic() - started:.1f} с"
+            )
+        )
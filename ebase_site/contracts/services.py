@@ -0,0 +1,148 @@
+"""Пересчёт итогов контрактов."""
+from django.db.models import (
+    DecimalField,
+    ExpressionWrapper,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+
+from utils.deferred import CoalescingScheduler
+from .models import Contract
+
+
+# Слагаемые итогов: (обратная связь контракта, путь к сумме)
+_PAYMENT_PARTS = (("payments", "amount"),)
+_EXPENSE_PARTS = (
+    ("spare_part_shipments", "shipment_m2m__sum"),
+    ("expenses", "sum"),
+    # Доли расходов командировок, отнесённые на контракт (авто, business_trip)
+    ("business_trip_expenses", "amount"),
+)
+RECALC_FIELDS = ["payment_amount", "expenses_amount", "debt", "profit", "payment_status"]
+
+_MONEY = DecimalField(max_digits=15, decimal_places=2)
+
+
+def _sum_subquery(relation, value_path):
+    """Сумма по связанным записям контракта одним коррелированным подзапросом."""
+    remote_field = Contract._meta.get_field(relation).field
+    related = (
+        remote_field.model.objects.filter(**{remote_field.name: OuterRef("pk")})
+        .order_by()
+        .values(remote_field.name)
+        .annotate(total=Sum(value_path))
+        .values("total")
+    )
+    return Coalesce(Subquery(related, output_field=_MONEY), Value(0), output_field=_MONEY)
+
+
+def _add(parts):
+    expression = None
+    for relation, value_path in parts:
+        subquery = _sum_subquery(relation, value_path)
+        expression = subquery if expression is None else expression + subquery
+    return ExpressionWrapper(expression, output_field=_MONEY)
+
+
+def with_totals(queryset):
+    """Аннотирует контракты актуальными суммами оплат и затрат."""
+    return queryset.annotate(
+        calc_payment_amount=_add(_PAYMENT_PARTS),
+        calc_expenses_amount=_add(_EXPENSE_PARTS),
+    )
+
+
+def _apply_totals(contract, payment_amount, expenses_amount) -> bool:
+    """Записывает итоги в объект; True, если что-то изменилось."""
+    before = [getattr(contract, field) for field in RECALC_FIELDS]
+    contract.payment_amount = payment_amount
+    contract.expenses_amount = expenses_amount
+    contract.debt = contract.contract_amount - payment_amount
+    contract.profit = payment_amount - expenses_amount
+    contract.update_payment_status()
+    return before != [getattr(contract, field) for field in RECALC_FIELDS]
+
+
+def recalc_contract(contract):
+    """Пересчитывает payment_amount, expenses_amount, debt, profit и статус оплаты."""
+    if contract is None:
+        return
+
+    totals = (
+        with_totals(Contract.objects.filter(pk=contract.pk))
+        .values_list("calc_payment_amount", "calc_expenses_amount")
+        .first()
+    )
+    if totals is None:
+        return
+    _apply_totals(contract, *totals)
+    contract.save(update_fields=RECALC_FIELDS)
+
+
+def recalc_contracts(contract_ids=None, batch_size=1000) -> int:
+    """Пересчитывает итоги многих контрактов (всех, если contract_ids=None).
+
+    Суммы считаются в БД подзапросами по группам, изменившиеся контракты
+    записываются через bulk_update порциями по batch_size. Сигналы
+    сохранения Contract не вызываются. Возвращает число обновлённых контрактов.
+    """
+    queryset = Contract.objects.all()
+    if contract_ids is not None:
+        queryset = queryset.filter(pk__in=list(contract_ids))
+    queryset = with_totals(queryset.order_by("pk"))
+
+    updated = 0
+    changed = []
+    for contract in queryset.iterator(chunk_size=batch_size):
+        if _apply_totals(
+            contract, contract.calc_payment_amount, contract.calc_expenses_amount
+        ):
+            changed.append(contract)
+        if len(changed) >= batch_size:
+            updated += Contract.objects.bulk_update(changed, RECALC_FIELDS)
+            changed = []
+    if changed:
+        updated += Contract.objects.bulk_update(changed, RECALC_FIELDS)
+    return updated
+
+
+def _recalc_scheduled(contracts):
+    """Пересчёт запланированных контрактов: объекты — на месте, ID — с загрузкой."""
+    contract_ids = set()
+    for contract in contracts:
+        if isinstance(contract, Contract):
+            recalc_contract(contract)
+        else:
+            contract_ids.add(contract)
+    if contract_ids:
+        recalc_contracts(contract_ids)
+
+
+# Сигналы платежей, расходов, отгрузок и ремонтов планируют пересчёт здесь:
+# внутри contract_recalc_batch() каждый контракт пересчитывается один раз
+# после коммита, вне его — сразу.
+contract_recalc = CoalescingScheduler("contract_recalc", _recalc_scheduled)
+
+
+def contract_ref(instance):
+    """Контракт записи для schedule_contract_recalc: сам объект, если он
+    уже загружен (тогда его поля обновятся на месте), иначе ID."""
+    if type(instance)._meta.get_field("contract").is_cached(instance):
+        return instance.contract
+    return instance.contract_id
+
+
+def schedule_contract_recalc(*contracts):
+    """Планирует пересчёт контрактов (объекты Contract или ID)."""
+    if contract_recalc.active:
+        # В batch копятся только ID, чтобы повторы схлопывались
+        contracts = [getattr(contract, "pk", contract) for contract in contracts]
+    contract_recalc.schedule(*contracts)
+
+
+def contract_recalc_batch():
+    """Контекстный менеджер для массовых операций с платежами/отгрузками."""
+    return contract_recalc.batch()
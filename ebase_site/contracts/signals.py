@@ -2,76 +2,36 @@
 
 Recalculates contract totals on Payment and ContractExpense changes,
 including spare part shipments and business trip expense shares.
+Recalculation goes through contracts.services.schedule_contract_recalc,
+so repeated changes inside contract_recalc_batch() are coalesced.
 """
 
-from django.db.models import Sum
 from django.dispatch import receiver
 from django.db.models.signals import post_save, post_delete, pre_save
 
-from .models import Contract, Payment, ContractExpense
+from .models import Payment, ContractExpense
+from .services import contract_ref, recalc_contract, schedule_contract_recalc  # noqa: F401
 from spare_part.models import SparePartShipmentV2, SparePartShipmentM2M
 
 
-def recalc_contract(contract):
-    """Пересчитывает payment_amount, expenses_amount, debt, profit и статус оплаты."""
-    if contract is None:
-        return
-
-    payment_amount = contract.payments.aggregate(s=Sum("amount"))["s"] or 0
-
-    shipment_expenses = (
-        contract.spare_part_shipments.aggregate(s=Sum("shipment_m2m__sum"))["s"] or 0
-    )
-
-    manual_expenses = contract.expenses.aggregate(s=Sum("sum"))["s"] or 0
-
-    # Доли расходов командировок, отнесённые на контракт (авто, business_trip)
-    trip_expenses = contract.business_trip_expenses.aggregate(s=Sum("amount"))["s"] or 0
-
-    expenses_amount = shipment_expenses + manual_expenses + trip_expenses
-
-    contract.payment_amount = payment_amount
-    contract.expenses_amount = expenses_amount
-    contract.debt = contract.contract_amount - payment_amount
-    contract.profit = payment_amount - expenses_amount
-    contract.update_payment_status()
-    contract.save(
-        update_fields=[
-            "payment_amount",
-            "expenses_amount",
-            "debt",
-            "profit",
-            "payment_status",
-        ]
-    )
-
-
 @receiver(post_save, sender=Payment)
 def payment_post_save(sender, instance, **kwargs):
-    recalc_contract(instance.contract)
+    schedule_contract_recalc(contract_ref(instance))
 
 
 @receiver(post_delete, sender=Payment)
 def payment_post_delete(sender, instance, **kwargs):
-    try:
-        contract = Contract.objects.get(pk=instance.contract_id)
-    except Contract.DoesNotExist:
-        return
-    recalc_contract(contract)
+    schedule_contract_recalc(instance.contract_id)
 
 
 @receiver(post_save, sender=ContractExpense)
 def contract_expense_post_save(sender, instance, **kwargs):
-    recalc_contract(instance.contract)
+    schedule_contract_recalc(contract_ref(instance))
 
 
 @receiver(post_delete, sender=ContractExpense)
 def contract_expense_post_delete(sender, instance, **kwargs):
-    try:
-        contract = Contract.objects.get(pk=instance.contract_id)
-    except Contract.DoesNotExist:
-        return
-    recalc_contract(contract)
+    schedule_contract_recalc(instance.contract_id)
 
 
 @receiver(pre_save, sender=SparePartShipmentV2)
@@ -89,52 +49,33 @@ def shipment_pre_save(sender, instance, **kwargs):
 
 @receiver(post_save, sender=SparePartShipmentV2)
 def shipment_post_save(sender, instance, **kwargs):
-    if instance.contract_id:
-        recalc_contract(instance.contract)
-
     old_contract_id = getattr(instance, "_old_contract_id", None)
-    if old_contract_id and old_contract_id != instance.contract_id:
-        try:
-            old_contract = Contract.objects.get(pk=old_contract_id)
-            recalc_contract(old_contract)
-        except Contract.DoesNotExist:
-            pass
+    if old_contract_id == instance.contract_id:
+        old_contract_id = None
+    schedule_contract_recalc(contract_ref(instance), old_contract_id)
 
 
 @receiver(post_delete, sender=SparePartShipmentV2)
 def shipment_post_delete(sender, instance, **kwargs):
-    if instance.contract_id:
-        try:
-            contract = Contract.objects.get(pk=instance.contract_id)
-            recalc_contract(contract)
-        except Contract.DoesNotExist:
-            pass
+    schedule_contract_recalc(instance.contract_id)
+
+
+def _shipment_contract_id(instance):
+    if not instance.shipment_id:
+        return None
+    return getattr(instance.shipment, "contract_id", None)
 
 
 @receiver(post_save, sender=SparePartShipmentM2M)
 def shipment_m2m_post_save(sender, instance, **kwargs):
-    contract_id = instance.shipment_id and getattr(
-        instance.shipment, "contract_id", None
-    )
-    if contract_id:
-        try:
-            contract = Contract.objects.get(pk=contract_id)
-            recalc_contract(contract)
-        except Contract.DoesNotExist:
-            pass
+    schedule_contract_recalc(_shipment_contract_id(instance))
 
 
 @receiver(post_delete, sender=SparePartShipmentM2M)
 def shipment_m2m_post_delete(sender, instance, **kwargs):
-    contract_id = (
-        getattr(instance.shipment, "contract_id", None)
-        if instance.shipment_id
-        else None
-    )
-    if contract_id:
-        try:
-            contract = Contract.objects.filter(pk=contract_id).first()
-            if contract:
-                recalc_contract(contract)
-        except Exception:
-            pass
+    try:
+        contract_id = _shipment_contract_id(instance)
+    except SparePartShipmentV2.DoesNotExist:
+        # Отгрузка уже удалена — контракт пересчитает её сигнал удаления
+        return
+    schedule_contract_recalc(contract_id)
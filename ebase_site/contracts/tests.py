@@ -1,16 +1,19 @@
 from datetime import date
 from decimal import Decimal
+from io import StringIO
 
 from django.test import RequestFactory, SimpleTestCase, TestCase
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
 from django.urls import reverse
 
 from clients.models import Client
 from directory.models import City
 from contracts.admin import ClientNameOnlyAutocompleteSelect, ContractAdmin
 from contracts.models import Contract, Payment, ContractExpense
+from contracts.services import contract_recalc, contract_recalc_batch, recalc_contracts
 
 
 User = get_user_model()
@@ -405,3 +408,87 @@ class ContractAdminBusinessTripSectionTests(TestCase):
             reverse("admin:business_trip_businesstrip_change", args=[trip.pk]),
             content,
         )
+
+
+class ContractRecalcBatchTests(TestCase):
+    def setUp(self):
+        city, _ = City.objects.get_or_create(name="Москва", region=None)
+        client = Client.objects.create(name="Клиент", city=city, inn="123456789001")
+        self.contract = Contract.objects.create(
+            client=client,
+            contract_number="CNT-100",
+            conclusion_date="2026-01-15",
+            contract_amount=100000,
+        )
+        contract_recalc.reset_stats()
+
+    def test_batch_recalculates_each_contract_once_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with contract_recalc_batch():
+                for amount in (10000, 20000, 30000):
+                    Payment.objects.create(
+                        contract=self.contract, date="2026-01-20", amount=amount
+                    )
+                ContractExpense.objects.create(
+                    contract=self.contract, expense_type="other", cost=5000
+                )
+                self.contract.refresh_from_db()
+                self.assertEqual(self.contract.payment_amount, 0)
+
+        self.contract.refresh_from_db()
+        self.assertEqual(self.contract.payment_amount, 60000)
+        self.assertEqual(self.contract.profit, 55000)
+        self.assertEqual(
+            contract_recalc.stats(), {"scheduled": 4, "coalesced": 3, "flushes": 1}
+        )
+
+    def test_recalc_is_immediate_outside_batch(self):
+        Payment.objects.create(contract=self.contract, date="2026-01-20", amount=10000)
+        Payment.objects.create(contract=self.contract, date="2026-01-21", amount=10000)
+
+        self.contract.refresh_from_db()
+        self.assertEqual(self.contract.payment_amount, 20000)
+        self.assertEqual(contract_recalc.stats()["flushes"], 2)
+
+
+class RecalcContractsTests(TestCase):
+    def setUp(self):
+        city, _ = City.objects.get_or_create(name="Москва", region=None)
+        client = Client.objects.create(name="Клиент", city=city, inn="123456789001")
+        self.contracts = [
+            Contract.objects.create(
+                client=client,
+                contract_number=f"CNT-{i}",
+                conclusion_date="2026-01-15",
+                contract_amount=100000,
+            )
+            for i in range(3)
+        ]
+        for contract in self.contracts:
+            Payment.objects.create(contract=contract, date="2026-01-20", amount=40000)
+            ContractExpense.objects.create(
+                contract=contract, expense_type="other", quantity=2, cost=1000
+            )
+        # Итоги «разъехались», например после правки данных в обход сигналов
+        Contract.objects.update(payment_amount=0, expenses_amount=0, debt=0, profit=0)
+
+    def test_recalculates_all_contracts_with_constant_queries(self):
+        with self.assertNumQueries(2):
+            updated = recalc_contracts()
+
+        self.assertEqual(updated, 3)
+        for contract in Contract.objects.all():
+            self.assertEqual(contract.payment_amount, 40000)
+            self.assertEqual(contract.expenses_amount, 2000)
+            self.assertEqual(contract.debt, 60000)
+            self.assertEqual(contract.profit, 38000)
+            self.assertEqual(contract.payment_status, "partial")
+
+    def test_unchanged_contracts_are_not_written(self):
+        recalc_contracts()
+        self.assertEqual(recalc_contracts([self.contracts[0].pk]), 0)
+
+    def test_command_recalculates_whole_registry(self):
+        out = StringIO()
+        call_command("recalc_contracts", "--all", stdout=out)
+        self.assertIn("Обновлено контрактов: 3", out.getvalue())
@@ -5,3 +5,6 @@ class DirectoryConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "directory"
     verbose_name = "Справочники"
+
+    def ready(self):
+        import directory.signals
@@ -0,0 +1,67 @@
+"""Процессный кэш небольших справочников.
+
+Таблицы справочников (виды работ, статусы, направления, единицы
+измерения, города, страны, должности) меняются редко и читаются
+почти в каждом запросе: значения по умолчанию полей, фильтры админки,
+поиск вида работ «Тех. обслуживание». Кэш загружает таблицу целиком
+одним запросом при первом обращении и дальше отвечает из памяти.
+
+Таблица сбрасывается сигналами post_save/post_delete (directory.signals)
+в том процессе, где запись изменили. Другие воркеры gunicorn увидят
+изменение не позже чем через ``settings.DIRECTORY_CACHE_TTL`` секунд.
+"""
+import copy
+
+from utils.ttl_cache import TTLCache
+
+
+class DirectoryCache:
+    def __init__(self):
+        self._tables = TTLCache('DIRECTORY_CACHE_TTL')
+
+    @staticmethod
+    def _label(model):
+        return model._meta.label
+
+    def _rows(self, model):
+        return self._tables.get(
+            self._label(model), lambda: tuple(model._default_manager.all())
+        )
+
+    def all(self, model) -> list:
+        """Все записи справочника (копии, их можно менять)."""
+        return [copy.copy(obj) for obj in self._rows(model)]
+
+    def filter(self, model, **lookups) -> list:
+        """Записи с точным совпадением полей: ``filter(Unit, short_name='шт.')``."""
+        return [
+            copy.copy(obj)
+            for obj in self._rows(model)
+            if all(getattr(obj, field) == value for field, value in lookups.items())
+        ]
+
+    def get(self, model, **lookups):
+        """Как ``Model.objects.get``, но без запроса к БД."""
+        found = self.filter(model, **lookups)
+        if not found:
+            raise model.DoesNotExist(
+                f'{model._meta.object_name} matching {lookups} does not exist.'
+            )
+        if len(found) > 1:
+            raise model.MultipleObjectsReturned(
+                f'get() returned more than one {model._meta.object_name}: {lookups}'
+            )
+        return found[0]
+
+    def invalidate(self, model):
+        self._tables.invalidate(self._label(model))
+
+    def clear(self):
+        self._tables.clear()
+
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов по таблицам."""
+        return self._tables.stats()
+
+
+directory_cache = DirectoryCache()
@@ -4,6 +4,8 @@ from enum import Enum
 from django.db import models
 from django.utils.text import slugify
 
+from .cache import directory_cache
+
 company = '"medsil"'  # название схемы для таблиц
 
 
@@ -16,19 +18,19 @@ class PositionType(Enum):
 def get_instance_city():
     """Возвращает экземпляр модели City."""
     # return None  # расскомментировать перед миграцией
-    return City.objects.get(name='Не указан')
+    return directory_cache.get(City, name='Не указан')
 
 
 def get_instance_country():
     """Возвращает экземпляр модели Country."""
     # return None  # расскомментировать перед миграцией
-    return Country.objects.get(name='Россия')
+    return directory_cache.get(Country, name='Россия')
 
 
 def get_instance_unit():
     """Возвращает экземпляр модели Unit штука."""
     # return None  # расскомментировать перед миграцией
-    return Unit.objects.get(short_name='шт.')
+    return directory_cache.get(Unit, short_name='шт.')
 
 
 class City(models.Model):
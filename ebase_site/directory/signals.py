@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+
+from .cache import directory_cache
+from .models import City, Country, EquipmentStatus, MedDirection, Position, ServiceType, Unit
+
+# Справочники, которые читаются через directory_cache
+CACHED_MODELS = (ServiceType, EquipmentStatus, MedDirection, Unit, City, Country, Position)
+
+
+def invalidate_directory_cache(sender, **kwargs):
+    directory_cache.invalidate(sender)
+
+
+for model in CACHED_MODELS:
+    post_save.connect(invalidate_directory_cache, sender=model)
+    post_delete.connect(invalidate_directory_cache, sender=model)
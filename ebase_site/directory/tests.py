@@ -1,3 +1,29 @@
 from django.test import TestCase
 
-# Create your tests here.
+from .cache import directory_cache
+from .models import ServiceType, Unit, get_instance_unit
+
+
+class DirectoryCacheTests(TestCase):
+    def setUp(self):
+        directory_cache.clear()
+        self.unit = Unit.objects.create(short_name='шт.', full_name='штука')
+
+    def test_repeated_lookup_does_not_query(self):
+        self.assertEqual(get_instance_unit().pk, self.unit.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_instance_unit().pk, self.unit.pk)
+        self.assertEqual(directory_cache.stats()['directory.Unit'], {'hits': 1, 'misses': 1})
+
+    def test_save_and_delete_invalidate_table(self):
+        directory_cache.all(ServiceType)
+        service_type = ServiceType.objects.create(name='Ремонт')
+        self.assertEqual(directory_cache.get(ServiceType, name='Ремонт').pk, service_type.pk)
+
+        service_type.delete()
+        with self.assertRaises(ServiceType.DoesNotExist):
+            directory_cache.get(ServiceType, name='Ремонт')
+
+    def test_returned_objects_are_copies(self):
+        directory_cache.get(Unit, short_name='шт.').full_name = 'изменено'
+        self.assertEqual(directory_cache.get(Unit, short_name='шт.').full_name, 'штука')
@@ -0,0 +1,107 @@
+import time
+
+from django.contrib import admin
+from django.utils.html import format_html
+
+from .models import DocumentJob
+from .services import document_url, latest_jobs
+
+
+def document_field(obj, kind, tag_id, empty_text):
+    """Поле карточки с документом: ссылка на файл или статус формирования
+    и кнопка «Создать»/«Обновить» (обрабатывается document_jobs.js).
+
+    :param obj: владелец документа (Service, BusinessTrip)
+    :param kind: вид документа — DocumentJob.Kind, совпадает с полем пути к файлу
+    :param tag_id: id кнопки (стили карточки)
+    :param empty_text: текст, пока документ не сформирован
+    """
+    if not obj.pk:
+        # При создании новой записи направит сюда
+        return format_html('<span class="akt-span">-------</span>')
+
+    file_path = getattr(obj, kind)
+    job = latest_jobs(obj).get(kind)
+    if job is not None and job.is_active:
+        content = format_html("{}…", job.get_status_display())
+    elif job is not None and job.status == DocumentJob.Status.FAILED:
+        content = format_html("Ошибка: {}", job.error)
+    elif file_path:
+        content = format_html(
+            '<a href="{}?v={}">{}</a>',
+            document_url(file_path),
+            int(time.time()),
+            file_path.split("/")[-1],
+        )
+    else:
+        content = empty_text
+    return format_html(
+        '<span class="akt-span document-job" data-kind="{kind}" data-job-id="{job_id}">'
+        "{content}</span>"
+        '<input type="button" id="{tag_id}" class="document-job-btn" '
+        'data-kind="{kind}" data-object-id="{object_id}" value="{value}"{disabled}>',
+        kind=kind,
+        job_id=job.pk if job is not None and job.is_active else "",
+        content=content,
+        tag_id=tag_id,
+        object_id=obj.pk,
+        value="Обновить" if file_path else "Создать",
+        disabled=" disabled" if job is not None and job.is_active else "",
+    )
+
+
+@admin.register(DocumentJob)
+class DocumentJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "__str__",
+        "kind",
+        "status",
+        "duration_display",
+        "user",
+        "create_dt",
+        "download_link",
+    )
+    list_filter = ("status", "kind")
+    list_per_page = 20
+    list_select_related = ("content_type", "user")
+    fields = (
+        "kind",
+        "content_type",
+        "object_id",
+        "user",
+        "status",
+        "create_dt",
+        "started_dt",
+        "finished_dt",
+        "download_link",
+        "error",
+    )
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(user=request.user)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Длительность")
+    def duration_display(self, obj):
+        if obj.duration is None:
+            return "--"
+        return f"{obj.duration.total_seconds():.1f} с"
+
+    @admin.display(description="Файл")
+    def download_link(self, obj):
+        if obj.status != DocumentJob.Status.DONE or not obj.file_path:
+            return "--"
+        return format_html(
+            '<a href="{}" download>{}</a>',
+            document_url(obj.file_path),
+            obj.file_path.split("/")[-1],
+        )
@@ -0,0 +1,150 @@
+"""Выгрузка документов выбранных записей одним ZIP-архивом.
+
+Архив отдаётся потоково (``StreamingHttpResponse``): файлы документов
+читаются с диска порциями и сразу уходят клиенту, временных файлов нет.
+
+Для каждого документа в запросе собираются его данные и отпечаток
+(``DOCUMENT_FILES``). Файлы, сформированные из тех же данных и той же
+версии шаблона, уходят в архив сразу. Недостающие и устаревшие
+формируются здесь же — параллельно, в пуле из не более чем
+``DOCUMENT_ARCHIVE_PROCESSES`` процессов — и дописываются в архив
+по мере готовности. Очередь ``DocumentJob`` и ``run_document_worker``
+для архива не нужны. Документы, которые не удалось сформировать,
+перечисляются в файле «Ошибки.txt» внутри архива.
+"""
+import logging
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from utils.export_to_xlsx import ZipStream
+from .models import DocumentJob
+from .services import DOCUMENT_FILES
+
+logger = logging.getLogger("documents")
+
+# Сколько байт файла читать с диска за раз
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+
+
+def render_document(document) -> str:
+    """Формирует файл документа (в т.ч. в процессе пула); возвращает путь."""
+    document.render()
+    return document.save_file_path
+
+
+def prepare_documents(queryset, kinds):
+    """Собирает данные документов ``kinds`` записей ``queryset``.
+
+    :return: (документы — [(запись, вид, документ)], ошибки — [текст])
+    """
+    documents, errors = [], []
+    objects = list(queryset)
+    for kind in kinds:
+        prepare = DOCUMENT_FILES[kind]
+        for obj in objects:
+            try:
+                documents.append((obj, kind, prepare(obj)))
+            except Exception as e:
+                logger.exception("Ошибка подготовки документа %s для %s", kind, obj.pk)
+                errors.append(_error(obj, kind, e))
+    return documents, errors
+
+
+def _error(obj, kind, reason) -> str:
+    return f"{obj}: {DocumentJob.Kind(kind).label} — {reason}"
+
+
+def _render_all(stale):
+    """Формирует документы ``stale``; отдаёт (запись, вид, документ, ошибка) по готовности."""
+    processes = min(settings.DOCUMENT_ARCHIVE_PROCESSES, len(stale))
+    if processes <= 1:
+        for obj, kind, document in stale:
+            try:
+                render_document(document)
+            except Exception as e:
+                yield obj, kind, document, e
+            else:
+                yield obj, kind, document, None
+        return
+
+    # Данные документов уже собраны: дочерние процессы не обращаются к БД
+    # и только заполняют шаблоны.
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        futures = {pool.submit(render_document, item[2]): item for item in stale}
+        for future in as_completed(futures):
+            yield (*futures[future], future.exception())
+
+
+def _remember_path(obj, kind, path):
+    """Запоминает путь к файлу в поле записи ``kind`` (без save() и сигналов)."""
+    if getattr(obj, kind) != path:
+        setattr(obj, kind, path)
+        type(obj)._default_manager.filter(pk=obj.pk).update(**{kind: path})
+
+
+def _arcname(names: set, kind, path) -> str:
+    """Имя файла в архиве: папка по виду документа, без совпадений имён."""
+    folder = DocumentJob.Kind(kind).label
+    stem, ext = os.path.splitext(os.path.basename(path))
+    name, n = f"{folder}/{stem}{ext}", 1
+    while name in names:
+        n += 1
+        name = f"{folder}/{stem}_{n}{ext}"
+    names.add(name)
+    return name
+
+
+def _write_file(archive, stream, arcname, path):
+    with archive.open(arcname, "w", force_zip64=True) as dest, open(path, "rb") as src:
+        while chunk := src.read(ARCHIVE_CHUNK_SIZE):
+            dest.write(chunk)
+            yield stream.drain()
+    yield stream.drain()
+
+
+def iter_documents_zip(queryset, kinds):
+    """Генерирует байты ZIP-архива с документами ``kinds`` записей ``queryset``."""
+    documents, errors = prepare_documents(queryset, kinds)
+
+    stream = ZipStream()
+    names, stale = set(), []
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+        for obj, kind, document in documents:
+            if not document.is_current():
+                stale.append((obj, kind, document))
+                continue
+            _remember_path(obj, kind, document.save_file_path)
+            path = document.save_file_path
+            yield from _write_file(archive, stream, _arcname(names, kind, path), path)
+
+        for obj, kind, document, error in _render_all(stale):
+            if error is not None:
+                logger.error(
+                    "Ошибка формирования документа %s для %s", kind, obj.pk, exc_info=error
+                )
+                errors.append(_error(obj, kind, error))
+                continue
+            _remember_path(obj, kind, document.save_file_path)
+            path = document.save_file_path
+            yield from _write_file(archive, stream, _arcname(names, kind, path), path)
+
+        if errors:
+            archive.writestr("Ошибки.txt", "\n".join(errors))
+    yield stream.drain()
+
+
+def documents_zip_response(queryset, kinds, prefix="documents"):
+    """Ответ с потоковым ZIP-архивом документов выбранных записей."""
+    response = StreamingHttpResponse(
+        iter_documents_zip(queryset, kinds), content_type="application/zip"
+    )
+    file_name = f"{prefix}_{timezone.localtime():%Y%m%d_%H%M}.zip"
+    response["Content-Disposition"] = f'attachment; filename="{file_name}"'
+    return response
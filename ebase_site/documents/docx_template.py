@@ -0,0 +1,180 @@
+"""Скомпилированные шаблоны Word с индексом плейсхолдеров.
+
+Шаблон .docx разбирается один раз на процесс: ``compile_template`` держит
+разобранный документ и индекс — где в нём стоит каждый плейсхолдер
+``{{ NAME }}``. Изменённый на диске шаблон (другой mtime) компилируется
+заново. Формирование документа копирует готовое дерево (``deepcopy``)
+и правит только абзацы из индекса, не обходя весь документ, поэтому
+время подстановки не зависит от размера шаблона.
+
+Индексируются те же абзацы, что обходили функции формирования: абзацы
+тела документа и абзацы ячеек таблиц верхнего уровня.
+
+Отпечаток документа (``fingerprint``) — хэш входных данных и содержимого
+шаблона. Он записывается в свойства файла (core properties, identifier),
+и если у готового файла отпечаток тот же, документ не формируется заново.
+"""
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import zipfile
+from typing import NamedTuple, Optional
+
+from docx import Document
+from docx.text.paragraph import Paragraph
+
+PLACEHOLDER_RE = re.compile(r"\{\{[^{}]*\}\}")
+_IDENTIFIER_RE = re.compile(rb"<dc:identifier>([0-9a-f]+)</dc:identifier>")
+
+
+class Location(NamedTuple):
+    """Место абзаца с плейсхолдером в шаблоне."""
+
+    # Индексы дочерних элементов от корня документа до абзаца
+    path: tuple
+    # Номер таблицы верхнего уровня (с 1) или None для абзаца тела документа
+    table: Optional[int]
+    # Номер абзаца в document.paragraphs для абзаца тела документа
+    paragraph: Optional[int]
+
+
+def _element_path(element) -> tuple:
+    path = []
+    parent = element.getparent()
+    while parent is not None:
+        path.append(parent.index(element))
+        element, parent = parent, parent.getparent()
+    return tuple(reversed(path))
+
+
+class CompiledTemplate:
+    def __init__(self, path):
+        self.path = str(path)
+        self.mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, "rb") as f:
+            self.digest = hashlib.sha256(f.read()).hexdigest()
+        self.document = Document(self.path)
+        self.index = self._build_index()
+
+    def _build_index(self) -> dict:
+        index = {}
+
+        def add(p, table, paragraph):
+            placeholders = set(PLACEHOLDER_RE.findall(Paragraph(p, None).text))
+            if not placeholders:
+                return
+            location = Location(_element_path(p), table, paragraph)
+            for placeholder in placeholders:
+                index.setdefault(placeholder, []).append(location)
+
+        for number, paragraph in enumerate(self.document.paragraphs):
+            add(paragraph._p, None, number)
+        for number, table in enumerate(self.document.tables, start=1):
+            for p in table._tbl.xpath("./w:tr/w:tc/w:p"):
+                add(p, number, None)
+        return index
+
+    def render(self) -> "RenderedTemplate":
+        """Новая копия документа для заполнения.
+
+        Копируется часть документа (вместе с пакетом), а не объект Document:
+        обёртки python-docx над вложенными элементами при deepcopy
+        отрываются от копии дерева.
+        """
+        return RenderedTemplate(copy.deepcopy(self.document.part).document, self.index)
+
+
+class RenderedTemplate:
+    """Копия скомпилированного шаблона с доступом к абзацам по плейсхолдерам."""
+
+    def __init__(self, document, index: dict):
+        self.document = document
+        self.index = index
+
+    def locations(self, *placeholders, table=None, body=False) -> list:
+        """Места плейсхолдеров в порядке документа, без повторов.
+
+        :param table: только абзацы таблицы с этим номером (с 1)
+        :param body: только абзацы тела документа (вне таблиц)
+        """
+        found = {
+            location
+            for placeholder in placeholders
+            for location in self.index.get(placeholder, ())
+            if (table is None or location.table == table)
+            and (not body or location.table is None)
+        }
+        return sorted(found)
+
+    def paragraphs(self, *placeholders, table=None, body=False) -> list:
+        """Абзацы копии, в которых в шаблоне стоят плейсхолдеры (см. locations)."""
+        return [
+            self._paragraph(location)
+            for location in self.locations(*placeholders, table=table, body=body)
+        ]
+
+    def save(self, path, fingerprint=""):
+        """Сохраняет документ, записывая отпечаток в его свойства."""
+        self.document.core_properties.identifier = fingerprint
+        self.document.save(path)
+
+    def _paragraph(self, location: Location) -> Paragraph:
+        element = self.document.element
+        for position in location.path:
+            element = element[position]
+        return Paragraph(element, self.document._body)
+
+
+_templates = {}
+_lock = threading.Lock()
+
+
+def compile_template(path) -> CompiledTemplate:
+    """Скомпилированный шаблон из кэша процесса; перечитывается при смене mtime."""
+    path = str(path)
+    mtime = os.stat(path).st_mtime_ns
+    compiled = _templates.get(path)
+    if compiled is None or compiled.mtime != mtime:
+        with _lock:
+            compiled = _templates.get(path)
+            if compiled is None or compiled.mtime != mtime:
+                compiled = _templates[path] = CompiledTemplate(path)
+    return compiled
+
+
+def render_template(path) -> RenderedTemplate:
+    """Копия шаблона ``path`` для заполнения."""
+    return compile_template(path).render()
+
+
+def fingerprint(template_path, data) -> str:
+    """Отпечаток документа: хэш шаблона и входных данных.
+
+    :param data: данные для подстановки (сериализуются в JSON)
+    """
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    digest = compile_template(template_path).digest
+    return hashlib.sha256(f"{digest}:{payload}".encode()).hexdigest()
+
+
+def read_fingerprint(path) -> str:
+    """Отпечаток, записанный в готовый файл; "" если файла или отпечатка нет."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            core = archive.read("docProps/core.xml")
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return ""
+    match = _IDENTIFIER_RE.search(core)
+    return match.group(1).decode() if match else ""
+
+
+def is_current(path, expected) -> bool:
+    """Готовый файл ``path`` сформирован из тех же данных и шаблона."""
+    return bool(path) and read_fingerprint(path) == expected
+
+
+def clear_template_cache():
+    _templates.clear()
@@ -0,0 +1,71 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from documents.services import fail_stale_jobs, process_next_job
+
+
+class Command(BaseCommand):
+    help = "Формирует документы Word (акты, приказы) из очереди в БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить все задания из очереди и завершиться",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2,
+            help="Пауза между опросами пустой очереди, сек (по умолчанию 2)",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.DOCUMENT_WORKER_PROCESSES,
+            help="Число параллельных процессов (по умолчанию DOCUMENT_WORKER_PROCESSES)",
+        )
+
+    def handle(self, *args, **options):
+        fail_stale_jobs()
+        processes = max(options["processes"], 1)
+        if processes == 1:
+            self.work(options)
+            return
+
+        # Дочерние процессы не должны делить соединение с БД родителя:
+        # закрываем его до fork, каждый процесс откроет своё.
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=self.work, args=(options,), name=f"document-worker-{n}")
+            for n in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
+
+    def work(self, options):
+        while True:
+            close_old_connections()
+            job = process_next_job()
+            if job is not None:
+                self.stdout.write(
+                    f"{job.pk}: {job.get_kind_display()}, {job.get_status_display()}"
+                )
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+            fail_stale_jobs()
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentJob',
+            fields=[
+                ('id', models.UUIDField(db_comment='ID записи', default=uuid.uuid4, editable=False, help_text='ID записи', primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_dt', models.DateTimeField(auto_now_add=True, db_comment='Дата создания записи.', help_text='Дата создания записи. Заполняется автоматически', verbose_name='Дата создания')),
+                ('object_id', models.UUIDField(db_comment='ID записи, для которой формируется документ', verbose_name='ID записи')),
+                ('kind', models.CharField(choices=[('service_akt', 'Акт о проведении работ'), ('accept_in_akt', 'Акт приёма-передачи в ремонт'), ('accept_from_akt', 'Акт приёма-передачи из ремонта'), ('order_trip', 'Приказ о направлении в командировку')], db_comment='Вид документа; совпадает с полем владельца, куда пишется путь к файлу', max_length=32, verbose_name='Документ')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Формируется'), ('done', 'Готово'), ('failed', 'Ошибка')], db_comment='Статус задания: pending, running, done, failed', default='pending', max_length=16, verbose_name='Статус')),
+                ('started_dt', models.DateTimeField(blank=True, db_comment='Когда воркер взял задание в работу', null=True, verbose_name='Начало')),
+                ('finished_dt', models.DateTimeField(blank=True, db_comment='Когда задание завершилось', null=True, verbose_name='Окончание')),
+                ('file_path', models.CharField(blank=True, db_comment='Путь к сформированному файлу', max_length=2056, verbose_name='Файл')),
+                ('error', models.TextField(blank=True, db_comment='Текст ошибки, если документ не сформирован', verbose_name='Ошибка')),
+                ('content_type', models.ForeignKey(db_comment='Модель записи, для которой формируется документ', on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Раздел')),
+                ('user', models.ForeignKey(blank=True, db_comment='ID пользователя, запросившего документ', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='document_job_user', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Формирование документа',
+                'verbose_name_plural': 'Формирование документов',
+                'db_table': '"medsil"."document_job"',
+                'db_table_comment': 'Задания на формирование документов Word. \n\n-- BMatyushin',
+                'ordering': ('-create_dt',),
+                'indexes': [models.Index(fields=['status', 'create_dt'], name='document_jo_status_5dc4ee_idx'), models.Index(fields=['content_type', 'object_id', 'kind'], name='document_jo_content_930475_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentCounter',
+            fields=[
+                ('name', models.CharField(db_comment='Имя счётчика (вид документа)', max_length=64, primary_key=True, serialize=False, verbose_name='Счётчик')),
+                ('value', models.PositiveBigIntegerField(db_comment='Последний выданный номер', default=0, verbose_name='Последний номер')),
+            ],
+            options={
+                'verbose_name': 'Счётчик номеров',
+                'verbose_name_plural': 'Счётчики номеров',
+                'db_table': '"medsil"."document_counter"',
+                'db_table_comment': 'Счётчики номеров документов. \n\n-- BMatyushin',
+            },
+        ),
+    ]
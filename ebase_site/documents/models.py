@@ -0,0 +1,142 @@
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+
+from ebase.models import EbaseModel
+
+company = '"medsil"'  # название схемы для таблиц
+
+
+class DocumentJob(EbaseModel):
+    """Задание на формирование документа Word (акта, приказа) для записи.
+
+    Очередь хранится в БД: задание создаёт кнопка карточки или экшен
+    админки, забирает и выполняет ``manage.py run_document_worker``.
+    Путь к готовому файлу записывается в поле владельца с именем ``kind``
+    (``Service.service_akt``, ``BusinessTrip.order_trip``), история
+    заданий доступна владельцу через ``document_jobs``.
+    """
+
+    class Kind(models.TextChoices):
+        SERVICE_AKT = "service_akt", "Акт о проведении работ"
+        ACCEPT_IN_AKT = "accept_in_akt", "Акт приёма-передачи в ремонт"
+        ACCEPT_FROM_AKT = "accept_from_akt", "Акт приёма-передачи из ремонта"
+        ORDER_TRIP = "order_trip", "Приказ о направлении в командировку"
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "В очереди"
+        RUNNING = "running", "Формируется"
+        DONE = "done", "Готово"
+        FAILED = "failed", "Ошибка"
+
+    ACTIVE_STATUSES = (Status.PENDING, Status.RUNNING)
+
+    user = models.ForeignKey(
+        "users.CompanyUser",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="document_job_user",
+        verbose_name="Пользователь",
+        db_comment="ID пользователя, запросившего документ",
+    )
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        verbose_name="Раздел",
+        db_comment="Модель записи, для которой формируется документ",
+    )
+    object_id = models.UUIDField(
+        verbose_name="ID записи",
+        db_comment="ID записи, для которой формируется документ",
+    )
+    owner = GenericForeignKey("content_type", "object_id")
+    kind = models.CharField(
+        max_length=32,
+        choices=Kind.choices,
+        verbose_name="Документ",
+        db_comment="Вид документа; совпадает с полем владельца, куда пишется путь к файлу",
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name="Статус",
+        db_comment="Статус задания: pending, running, done, failed",
+    )
+    started_dt = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Начало",
+        db_comment="Когда воркер взял задание в работу",
+    )
+    finished_dt = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Окончание",
+        db_comment="Когда задание завершилось",
+    )
+    file_path = models.CharField(
+        max_length=2056,
+        blank=True,
+        verbose_name="Файл",
+        db_comment="Путь к сформированному файлу",
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name="Ошибка",
+        db_comment="Текст ошибки, если документ не сформирован",
+    )
+
+    class Meta:
+        db_table = f'{company}."document_job"'
+        db_table_comment = "Задания на формирование документов Word. \n\n-- BMatyushin"
+        verbose_name = "Формирование документа"
+        verbose_name_plural = "Формирование документов"
+        ordering = ("-create_dt",)
+        indexes = [
+            models.Index(fields=["status", "create_dt"]),
+            models.Index(fields=["content_type", "object_id", "kind"]),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} от {self.create_dt:%d.%m.%Y %H:%M}"
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in self.ACTIVE_STATUSES
+
+    @property
+    def duration(self):
+        if self.started_dt and self.finished_dt:
+            return self.finished_dt - self.started_dt
+        return None
+
+
+class DocumentCounter(models.Model):
+    """Счётчик номеров документов одного вида (см. documents.numbering).
+
+    Номер выдаётся атомарным ``UPDATE ... SET value = value + 1`` строки
+    счётчика, без ``Max()`` по таблице документов.
+    """
+
+    name = models.CharField(
+        max_length=64,
+        primary_key=True,
+        verbose_name="Счётчик",
+        db_comment="Имя счётчика (вид документа)",
+    )
+    value = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name="Последний номер",
+        db_comment="Последний выданный номер",
+    )
+
+    class Meta:
+        db_table = f'{company}."document_counter"'
+        db_table_comment = "Счётчики номеров документов. \n\n-- BMatyushin"
+        verbose_name = "Счётчик номеров"
+        verbose_name_plural = "Счётчики номеров"
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
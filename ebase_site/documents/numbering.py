@@ -0,0 +1,75 @@
+"""Сквозная нумерация документов без пропусков и гонок.
+
+Номер берётся из строки ``DocumentCounter``: ``UPDATE ... SET value =
+value + 1`` блокирует строку до конца транзакции, поэтому одновременные
+сохранения получают разные номера, а не падают на уникальности. Номер
+резервируется внутри транзакции сохранения документа и фиксируется вместе
+с ней; при откате счётчик откатывается тоже — пропусков не остаётся.
+Номер выдаётся за два запроса (UPDATE и SELECT), независимо от размера
+таблицы документов.
+
+Строка счётчика создаётся один раз — когда UPDATE при первом обращении
+не нашёл её — и начинается с ``seed()``: максимального номера, уже
+записанного в таблицу документов::
+
+    trip_numbers = DocumentNumbering("business_trip", BusinessTrip, "doc_number")
+    trip.doc_number = trip_numbers.reserve()
+"""
+from django.db import transaction
+from django.db.models import F, Max
+
+from .models import DocumentCounter
+
+
+class DocumentNumbering:
+    """Нумерация документов одного вида.
+
+    :param name: имя счётчика
+    :param model: модель документа (для начального значения счётчика)
+    :param field: целочисленное поле номера в ``model``
+    """
+
+    def __init__(self, name, model=None, field=None):
+        self.name = name
+        self.model = model
+        self.field = field
+
+    def seed(self) -> int:
+        """Начальное значение счётчика — наибольший номер в таблице документов."""
+        if self.model is None:
+            return 0
+        return self.model._default_manager.aggregate(n=Max(self.field))["n"] or 0
+
+    def _counter(self):
+        return DocumentCounter.objects.filter(name=self.name)
+
+    def _create_counter(self, value=0):
+        DocumentCounter.objects.get_or_create(
+            name=self.name, defaults={"value": max(self.seed(), value)}
+        )
+
+    def reserve(self) -> int:
+        """Следующий номер; занят до конца текущей транзакции.
+
+        Вызывается в транзакции сохранения документа: номер фиксируется
+        вместе с документом или освобождается при откате.
+        """
+        with transaction.atomic():
+            counter = self._counter()
+            if not counter.update(value=F("value") + 1):
+                self._create_counter()
+                counter.update(value=F("value") + 1)
+            return counter.values_list("value", flat=True).get()
+
+    def peek(self) -> int:
+        """Номер, который получит следующий документ (без резервирования)."""
+        value = self._counter().values_list("value", flat=True).first()
+        return (self.seed() if value is None else value) + 1
+
+    def commit(self, number):
+        """Учитывает номер, введённый вручную: следующие будут больше него."""
+        if number is None:
+            return
+        # Строка блокируется, только если номер действительно больше
+        if not self._counter().filter(value__lt=number).update(value=number):
+            self._create_counter(number)
@@ -0,0 +1,175 @@
+"""Формирование документов Word в фоне: очередь заданий и их выполнение.
+
+Разбор шаблона .docx и запись файла — работа для процессора, в запросе
+она занимает gevent-воркер gunicorn целиком. Поэтому кнопки карточек
+и экшены только ставят ``DocumentJob`` в очередь, а документы формирует
+``manage.py run_document_worker`` — несколькими процессами параллельно.
+Задания забираются через ``SELECT ... FOR UPDATE SKIP LOCKED``, так что
+процессы не возьмут одно задание дважды. Страница карточки опрашивает
+статус заданий и показывает ссылку на файл, когда он готов.
+"""
+import logging
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from business_trip.docx_create import create_trip_order, trip_order
+from business_trip.models import BusinessTrip
+from ebase.docx_create import create_service_atk, service_akt
+from ebase.models import Service
+from .models import DocumentJob
+
+logger = logging.getLogger("documents")
+
+Kind = DocumentJob.Kind
+
+# Вид документа -> (модель владельца, функция формирования файла).
+# Функция формирует файл и записывает путь в поле владельца ``kind``.
+DOCUMENTS = {
+    Kind.SERVICE_AKT: (Service, lambda obj: create_service_atk(obj, "serviceAkt")),
+    Kind.ACCEPT_IN_AKT: (Service, lambda obj: create_service_atk(obj, "acceptInAkt")),
+    Kind.ACCEPT_FROM_AKT: (Service, lambda obj: create_service_atk(obj, "acceptFromAkt")),
+    Kind.ORDER_TRIP: (BusinessTrip, create_trip_order),
+}
+
+# Вид документа -> функция, собирающая данные документа без формирования
+# файла: объект с ``save_file_path``, ``is_current()`` и ``render()``.
+DOCUMENT_FILES = {
+    Kind.SERVICE_AKT: lambda obj: service_akt(obj, "serviceAkt"),
+    Kind.ACCEPT_IN_AKT: lambda obj: service_akt(obj, "acceptInAkt"),
+    Kind.ACCEPT_FROM_AKT: lambda obj: service_akt(obj, "acceptFromAkt"),
+    Kind.ORDER_TRIP: trip_order,
+}
+
+
+def _check_kind(model, kind):
+    if kind not in DOCUMENTS or DOCUMENTS[kind][0] is not model:
+        raise ValueError(f"Документ {kind!r} не формируется для {model._meta.label}")
+
+
+def active_jobs(model, object_ids, kind) -> dict:
+    """Незавершённые задания вида ``kind``: {ID записи: задание}."""
+    jobs = DocumentJob.objects.filter(
+        content_type=ContentType.objects.get_for_model(model),
+        object_id__in=list(object_ids),
+        kind=kind,
+        status__in=DocumentJob.ACTIVE_STATUSES,
+    ).order_by("create_dt")
+    return {job.object_id: job for job in jobs}
+
+
+def enqueue_documents(queryset, kind, user=None) -> list:
+    """Ставит в очередь документ ``kind`` для каждой записи ``queryset``.
+
+    Если для записи документ уже в очереди или формируется, новое
+    задание не создаётся — возвращается существующее.
+    """
+    _check_kind(queryset.model, kind)
+    object_ids = list(queryset.values_list("pk", flat=True))
+    existing = active_jobs(queryset.model, object_ids, kind)
+    content_type = ContentType.objects.get_for_model(queryset.model)
+    created = DocumentJob.objects.bulk_create(
+        DocumentJob(
+            user=user if user and user.is_authenticated else None,
+            content_type=content_type,
+            object_id=object_id,
+            kind=kind,
+        )
+        for object_id in object_ids
+        if object_id not in existing
+    )
+    jobs = {**existing, **{job.object_id: job for job in created}}
+    return [jobs[object_id] for object_id in object_ids]
+
+
+def enqueue_document(obj, kind, user=None) -> DocumentJob:
+    """Ставит в очередь документ ``kind`` для одной записи."""
+    return enqueue_documents(type(obj).objects.filter(pk=obj.pk), kind, user)[0]
+
+
+def latest_jobs(obj) -> dict:
+    """Последнее задание каждого вида для записи: {kind: задание}.
+
+    Результат кэшируется на объекте: поля карточки с документами
+    обходятся одним запросом.
+    """
+    if not hasattr(obj, "_latest_document_jobs"):
+        jobs = {}
+        if obj.pk:
+            for job in obj.document_jobs.order_by("create_dt"):
+                jobs[job.kind] = job
+        obj._latest_document_jobs = jobs
+    return obj._latest_document_jobs
+
+
+def document_url(file_path) -> str:
+    """Ссылка на файл документа из ``MEDIA_ROOT/docs``."""
+    return re.sub(r".*/docs", "/media/docs", file_path) if file_path else ""
+
+
+def fail_stale_jobs() -> int:
+    """Завершает ошибкой задания, зависшие в работе дольше DOCUMENT_JOB_TIMEOUT.
+
+    Такие задания остаются после аварийной остановки воркера и иначе
+    не дали бы поставить документ в очередь повторно.
+    """
+    deadline = timezone.now() - timedelta(seconds=settings.DOCUMENT_JOB_TIMEOUT)
+    return DocumentJob.objects.filter(
+        status=DocumentJob.Status.RUNNING, started_dt__lt=deadline
+    ).update(
+        status=DocumentJob.Status.FAILED,
+        error="Превышено время формирования",
+        finished_dt=timezone.now(),
+    )
+
+
+def claim_next_job():
+    """Забирает самое старое задание из очереди и помечает его выполняемым."""
+    with transaction.atomic():
+        job = (
+            DocumentJob.objects.select_for_update(skip_locked=True)
+            .filter(status=DocumentJob.Status.PENDING)
+            .order_by("create_dt")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = DocumentJob.Status.RUNNING
+        job.started_dt = timezone.now()
+        job.save(update_fields=["status", "started_dt"])
+    return job
+
+
+def run_document_job(job: DocumentJob):
+    """Формирует файл задания и запоминает путь к нему."""
+    model, render = DOCUMENTS[job.kind]
+    obj = model.objects.get(pk=job.object_id)
+    render(obj)
+    job.file_path = getattr(obj, job.kind) or ""
+
+
+def process_job(job: DocumentJob):
+    """Выполняет задание и фиксирует результат; ошибки не пробрасываются."""
+    try:
+        run_document_job(job)
+    except Exception as e:
+        logger.exception("Ошибка формирования документа %s", job.pk)
+        job.status = DocumentJob.Status.FAILED
+        job.error = str(e)
+    else:
+        job.status = DocumentJob.Status.DONE
+    job.finished_dt = timezone.now()
+    job.save(update_fields=["status", "error", "file_path", "finished_dt"])
+    return job
+
+
+def process_next_job():
+    """Выполняет одно задание из очереди. Возвращает его или None."""
+    job = claim_next_job()
+    if job is not None:
+        process_job(job)
+    return job
@@ -0,0 +1,106 @@
+/**
+ * Формирование документов Word (акты ремонта, приказ о командировке) в фоне.
+ *
+ * Кнопка «Создать»/«Обновить» (.document-job-btn) ставит документ в очередь
+ * POST-запросом, страница не перезагружается. Затем статус задания
+ * опрашивается, пока воркер не сформирует файл, и в поле появляется ссылка.
+ * Если при загрузке карточки документ ещё формируется (data-job-id),
+ * опрос начинается сразу.
+ */
+(function () {
+    "use strict";
+
+    var ENQUEUE_URL = "/admin/document-jobs/enqueue/";
+    var STATUS_URL = "/admin/document-jobs/status/";
+    var POLL_INTERVAL = 2000;
+
+    function getCsrfToken() {
+        var input = document.querySelector("input[name=csrfmiddlewaretoken]");
+        if (input) return input.value;
+        var match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : "";
+    }
+
+    function findParts(kind) {
+        return {
+            span: document.querySelector('.document-job[data-kind="' + kind + '"]'),
+            button: document.querySelector('.document-job-btn[data-kind="' + kind + '"]'),
+        };
+    }
+
+    function render(kind, state) {
+        var parts = findParts(kind);
+        if (!parts.span) return;
+        var active = state.status === "pending" || state.status === "running";
+        parts.span.dataset.jobId = active ? state.id : "";
+        if (parts.button) parts.button.disabled = active;
+
+        if (active) {
+            parts.span.textContent = state.status_display + "…";
+        } else if (state.status === "done") {
+            parts.span.textContent = "";
+            var link = document.createElement("a");
+            link.href = state.url + "?v=" + Date.now();
+            link.textContent = state.file_name;
+            parts.span.appendChild(link);
+            if (parts.button) parts.button.value = "Обновить";
+        } else {
+            parts.span.textContent = "Ошибка: " + (state.error || state.status_display);
+        }
+    }
+
+    function poll(kind, jobId) {
+        setTimeout(function () {
+            fetch(STATUS_URL + "?id=" + encodeURIComponent(jobId), {
+                credentials: "same-origin",
+            })
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    var state = data.results && data.results[jobId];
+                    if (!state) return;
+                    render(kind, state);
+                    if (state.status === "pending" || state.status === "running") {
+                        poll(kind, jobId);
+                    }
+                })
+                .catch(function () { poll(kind, jobId); });
+        }, POLL_INTERVAL);
+    }
+
+    function enqueue(button) {
+        var kind = button.dataset.kind;
+        var body = new FormData();
+        body.append("kind", kind);
+        body.append("object_id", button.dataset.objectId);
+        button.disabled = true;
+
+        fetch(ENQUEUE_URL, {
+            method: "POST",
+            body: body,
+            credentials: "same-origin",
+            headers: { "X-CSRFToken": getCsrfToken() },
+        })
+            .then(function (response) { return response.json(); })
+            .then(function (state) {
+                if (state.error && !state.status) {
+                    button.disabled = false;
+                    alert(state.error);
+                    return;
+                }
+                render(kind, state);
+                if (state.status === "pending" || state.status === "running") {
+                    poll(kind, state.id);
+                }
+            })
+            .catch(function () { button.disabled = false; });
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        document.querySelectorAll(".document-job-btn").forEach(function (button) {
+            button.addEventListener("click", function () { enqueue(button); });
+        });
+        document.querySelectorAll(".document-job[data-job-id]").forEach(function (span) {
+            if (span.dataset.jobId) poll(span.dataset.kind, span.dataset.jobId);
+        });
+    });
+})();
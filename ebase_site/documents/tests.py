@@ -0,0 +1,390 @@
+import io
+import os
+import tempfile
+import zipfile
+from datetime import date
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from docx import Document
+
+from business_trip.docx_create import create_trip_order
+from business_trip.models import BusinessTrip
+from .archive import iter_documents_zip
+from .docx_template import (
+    clear_template_cache,
+    compile_template,
+    read_fingerprint,
+    render_template,
+)
+from .models import DocumentCounter, DocumentJob
+from .numbering import DocumentNumbering
+from .services import enqueue_document, process_next_job
+
+
+User = get_user_model()
+
+
+class DocumentJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_superuser(
+            username="admin", password="pass", last_name="Иванов", first_name="Иван"
+        )
+        self.client.force_login(self.user)
+        self.trip = BusinessTrip.objects.create(
+            employee=self.user, beg_dt=date(2026, 3, 16), end_dt=date(2026, 3, 19)
+        )
+
+    def _write_template(self):
+        template_dir = Path(self.media_root.name, "docs", "trips")
+        template_dir.mkdir(parents=True)
+        doc = Document()
+        doc.add_paragraph("Приказ №{{ DOC_NUM }}: {{ FIO }}")
+        doc.save(template_dir / "order_trip.docx")
+
+    def _enqueue(self):
+        return self.client.post(
+            "/admin/document-jobs/enqueue/",
+            {"kind": DocumentJob.Kind.ORDER_TRIP, "object_id": str(self.trip.pk)},
+        )
+
+    def test_change_form_get_does_not_render(self):
+        """Открытие карточки не формирует документ."""
+        response = self.client.get(
+            f"/admin/business_trip/businesstrip/{self.trip.pk}/change/?order_trip=create"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(DocumentJob.objects.exists())
+        self.trip.refresh_from_db()
+        self.assertIsNone(self.trip.order_trip)
+
+    def test_order_is_queued_and_rendered_by_worker(self):
+        self._write_template()
+        response = self._enqueue()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], DocumentJob.Status.PENDING)
+        job = DocumentJob.objects.get()
+        self.assertEqual(job.owner, self.trip)
+        self.assertEqual(job.user, self.user)
+
+        self.assertEqual(process_next_job().pk, job.pk)
+        self.assertIsNone(process_next_job())
+
+        job.refresh_from_db()
+        self.trip.refresh_from_db()
+        self.assertEqual(job.status, DocumentJob.Status.DONE)
+        self.assertEqual(job.file_path, self.trip.order_trip)
+        text = Document(self.trip.order_trip).paragraphs[0].text
+        self.assertEqual(text, f"Приказ №{self.trip.doc_number}: Иванов Иван")
+
+        state = self.client.get(
+            "/admin/document-jobs/status/", {"id": str(job.pk)}
+        ).json()["results"][str(job.pk)]
+        self.assertEqual(state["status"], DocumentJob.Status.DONE)
+        self.assertTrue(state["url"].startswith("/media/docs/trips/"))
+
+    def test_repeated_click_reuses_active_job(self):
+        first = self._enqueue().json()
+        second = self._enqueue().json()
+
+        self.assertEqual(first["id"], second["id"])
+        self.assertEqual(DocumentJob.objects.count(), 1)
+
+    def test_failed_job_keeps_error_and_can_be_requeued(self):
+        # Шаблона нет — формирование падает
+        job = enqueue_document(self.trip, DocumentJob.Kind.ORDER_TRIP)
+        with self.assertLogs("documents", "ERROR"):
+            process_next_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DocumentJob.Status.FAILED)
+        self.assertTrue(job.error)
+        self.assertNotEqual(enqueue_document(self.trip, DocumentJob.Kind.ORDER_TRIP).pk, job.pk)
+
+    def test_kind_must_match_owner_model(self):
+        response = self.client.post(
+            "/admin/document-jobs/enqueue/",
+            {"kind": DocumentJob.Kind.SERVICE_AKT, "object_id": str(self.trip.pk)},
+        )
+
+        self.assertEqual(response.status_code, 404)
+        with self.assertRaises(ValueError):
+            enqueue_document(self.trip, DocumentJob.Kind.SERVICE_AKT)
+
+
+class DocxTemplateTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(clear_template_cache)
+        self.path = Path(self.tmp.name, "template.docx")
+        doc = Document()
+        doc.add_paragraph("Без плейсхолдеров")
+        doc.add_paragraph("Клиент: {{ CLIENT }}")
+        table = doc.add_table(rows=2, cols=2)
+        table.cell(1, 1).text = "{{ CLIENT }} / {{ DATE}}"
+        doc.save(self.path)
+
+    def test_template_is_compiled_once_per_mtime(self):
+        compiled = compile_template(self.path)
+        self.assertIs(compile_template(self.path), compiled)
+
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertIsNot(compile_template(self.path), compiled)
+
+    def test_index_locates_body_and_table_paragraphs(self):
+        compiled = compile_template(self.path)
+
+        client = compiled.index["{{ CLIENT }}"]
+        self.assertEqual([(loc.table, loc.paragraph) for loc in client], [(None, 1), (1, None)])
+        self.assertEqual(len(compiled.index["{{ DATE}}"]), 1)
+
+    def test_render_patches_a_copy(self):
+        rendered = render_template(self.path)
+        paragraphs = rendered.paragraphs("{{ CLIENT }}", "{{ DATE}}")
+        self.assertEqual(len(paragraphs), 2)
+        for paragraph in paragraphs:
+            paragraph.text = paragraph.text.replace("{{ CLIENT }}", "Больница")
+
+        self.assertEqual(rendered.document.paragraphs[1].text, "Клиент: Больница")
+        self.assertEqual(rendered.document.tables[0].cell(1, 1).text, "Больница / {{ DATE}}")
+        saved = Path(self.tmp.name, "saved.docx")
+        rendered.document.save(saved)
+        self.assertEqual(Document(saved).paragraphs[1].text, "Клиент: Больница")
+        # Кэшированный шаблон не изменился
+        fresh = render_template(self.path)
+        self.assertEqual(fresh.document.paragraphs[1].text, "Клиент: {{ CLIENT }}")
+        self.assertEqual(fresh.paragraphs("{{ CLIENT }}", body=True)[0].text, "Клиент: {{ CLIENT }}")
+
+
+class DocumentArchiveTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_superuser(username="admin", password="pass")
+        self.client.force_login(self.user)
+        self.trips = [
+            BusinessTrip.objects.create(
+                employee=self.user, beg_dt=date(2026, 3, day), end_dt=date(2026, 3, day + 1)
+            )
+            for day in (2, 9)
+        ]
+        template_dir = Path(self.media_root.name, "docs", "trips")
+        template_dir.mkdir(parents=True)
+        doc = Document()
+        doc.add_paragraph("Приказ №{{ DOC_NUM }}")
+        doc.save(template_dir / "order_trip.docx")
+
+    def _zip(self):
+        data = b"".join(
+            iter_documents_zip(
+                BusinessTrip.objects.order_by("doc_number"), (DocumentJob.Kind.ORDER_TRIP,)
+            )
+        )
+        return zipfile.ZipFile(io.BytesIO(data))
+
+    def _texts(self, archive):
+        return [
+            Document(io.BytesIO(archive.read(name))).paragraphs[0].text
+            for name in archive.namelist()
+        ]
+
+    def test_current_documents_are_streamed_without_rendering(self):
+        for trip in self.trips:
+            create_trip_order(trip)
+        with mock.patch(
+            "business_trip.docx_create.render_template", wraps=render_template
+        ) as render:
+            archive = self._zip()
+
+        self.assertEqual(render.call_count, 0)
+        folder = DocumentJob.Kind.ORDER_TRIP.label
+        for trip in self.trips:
+            trip.refresh_from_db()
+            name = f"{folder}/{os.path.basename(trip.order_trip)}"
+            self.assertEqual(archive.read(name), Path(trip.order_trip).read_bytes())
+
+    def test_stale_documents_are_rendered_in_request(self):
+        for trip in self.trips:
+            path = Path(self.media_root.name, f"order_{trip.doc_number}.docx")
+            path.write_bytes(b"docx %d" % trip.doc_number)
+            BusinessTrip.objects.filter(pk=trip.pk).update(order_trip=str(path))
+
+        archive = self._zip()
+
+        self.assertEqual(
+            sorted(self._texts(archive)), [f"Приказ №{trip.doc_number}" for trip in self.trips]
+        )
+        for trip in self.trips:
+            trip.refresh_from_db()
+            self.assertIn(f"trip{trip.doc_number}", trip.order_trip)
+
+    def test_missing_documents_are_rendered_by_process_pool(self):
+        # Без run_document_worker: документы формирует пул процессов запроса
+        with override_settings(DOCUMENT_ARCHIVE_PROCESSES=2):
+            archive = self._zip()
+
+        self.assertEqual(
+            sorted(self._texts(archive)), [f"Приказ №{trip.doc_number}" for trip in self.trips]
+        )
+        self.assertFalse(DocumentJob.objects.exists())
+
+    @override_settings(DOCUMENT_ARCHIVE_PROCESSES=1)
+    def test_failed_documents_are_listed(self):
+        with mock.patch(
+            "business_trip.docx_create.render_template", side_effect=ValueError("битый шаблон")
+        ), self.assertLogs("documents", "ERROR"):
+            archive = self._zip()
+
+        self.assertEqual(archive.namelist(), ["Ошибки.txt"])
+        self.assertEqual(archive.read("Ошибки.txt").decode().count("битый шаблон"), 2)
+
+    def test_admin_action_streams_archive(self):
+        response = self.client.post(
+            "/admin/business_trip/businesstrip/",
+            {
+                "action": "download_orders_zip",
+                "_selected_action": [str(trip.pk) for trip in self.trips],
+            },
+        )
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/zip")
+
+
+class DocumentFingerprintTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=self.media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(clear_template_cache)
+
+        self.user = User.objects.create_user(username="ivanov", password="pass")
+        self.trip = BusinessTrip.objects.create(
+            employee=self.user, beg_dt=date(2026, 3, 16), end_dt=date(2026, 3, 19)
+        )
+        self.template = Path(self.media_root.name, "docs", "trips", "order_trip.docx")
+        self.template.parent.mkdir(parents=True)
+        self._write_template("Приказ №{{ DOC_NUM }} до {{ END_DT }}")
+
+    def _write_template(self, text):
+        doc = Document()
+        doc.add_paragraph(text)
+        doc.save(self.template)
+        # Новая версия шаблона должна отличаться по mtime и в пределах секунды
+        stat = os.stat(self.template)
+        os.utime(self.template, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    def _create(self):
+        with mock.patch(
+            "business_trip.docx_create.render_template", wraps=render_template
+        ) as render, mock.patch.object(post_save, "send", wraps=post_save.send) as send:
+            create_trip_order(self.trip)
+        self.trip.refresh_from_db()
+        return render.call_count, send.call_count
+
+    def _text(self):
+        return Document(self.trip.order_trip).paragraphs[0].text
+
+    def test_unchanged_order_is_not_rendered_again(self):
+        self.assertEqual(self._create(), (1, 0))
+        self.assertTrue(read_fingerprint(self.trip.order_trip))
+        mtime = os.stat(self.trip.order_trip).st_mtime_ns
+
+        self.assertEqual(self._create(), (0, 0))
+        self.assertEqual(os.stat(self.trip.order_trip).st_mtime_ns, mtime)
+
+    def test_changed_data_or_template_renders_again(self):
+        self._create()
+
+        BusinessTrip.objects.filter(pk=self.trip.pk).update(end_dt=date(2026, 3, 20))
+        self.trip.refresh_from_db()
+        self.assertEqual(self._create()[0], 1)
+        self.assertEqual(self._text(), f"Приказ №{self.trip.doc_number} до 20.03.2026")
+
+        self._write_template("Новый приказ №{{ DOC_NUM }}")
+        self.assertEqual(self._create()[0], 1)
+        self.assertEqual(self._text(), f"Новый приказ №{self.trip.doc_number}")
+
+
+class DocumentNumberingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="ivanov", password="pass")
+        self.numbers = DocumentNumbering("business_trip", BusinessTrip, "doc_number")
+
+    def _trip(self, **kwargs):
+        return BusinessTrip.objects.create(
+            employee=self.user, beg_dt=date(2026, 3, 16), end_dt=date(2026, 3, 19), **kwargs
+        )
+
+    def test_counter_starts_from_existing_numbers(self):
+        BusinessTrip.objects.bulk_create(
+            [BusinessTrip(employee=self.user, beg_dt=date(2026, 3, 16),
+                          end_dt=date(2026, 3, 19), doc_number=41)]
+        )
+
+        self.assertEqual(self.numbers.peek(), 42)
+        self.assertEqual(self._trip().doc_number, 42)
+        self.assertEqual(DocumentCounter.objects.get(name="business_trip").value, 42)
+
+    def test_rolled_back_number_is_issued_again(self):
+        self._trip()
+        try:
+            with transaction.atomic():
+                self.assertEqual(self._trip().doc_number, 2)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertEqual(self._trip().doc_number, 2)
+
+    def test_manual_number_moves_counter_forward(self):
+        self._trip(doc_number=10)
+        self._trip(doc_number=5)
+
+        self.assertEqual(self._trip().doc_number, 11)
+
+    def _counter_queries(self, queries):
+        return [
+            query["sql"] for query in queries.captured_queries if "document_counter" in query["sql"]
+        ]
+
+    def test_reserve_takes_two_queries(self):
+        self._trip()
+        with CaptureQueriesContext(connection) as queries:
+            self.numbers.reserve()
+
+        self.assertEqual(len(self._counter_queries(queries)), 2)
+
+    def test_resave_does_not_touch_counter(self):
+        trip = self._trip(doc_number=7)
+        trip = BusinessTrip.objects.get(pk=trip.pk)
+        with CaptureQueriesContext(connection) as queries:
+            trip.save()
+
+        self.assertEqual(self._counter_queries(queries), [])
+
+    def test_numbering_is_reusable(self):
+        shipments = DocumentNumbering("spare_part_shipment")
+
+        self.assertEqual([shipments.reserve() for _ in range(3)], [1, 2, 3])
+        self.assertEqual(self.numbers.peek(), 1)
@@ -0,0 +1,16 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path(
+        "admin/document-jobs/enqueue/",
+        views.enqueue_document_job,
+        name="enqueue_document_job",
+    ),
+    path(
+        "admin/document-jobs/status/",
+        views.document_jobs_status,
+        name="document_jobs_status",
+    ),
+]
@@ -0,0 +1,64 @@
+import uuid
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
+
+from .models import DocumentJob
+from .services import DOCUMENTS, document_url, enqueue_document
+
+
+def _uuid_or_none(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def job_state(job: DocumentJob) -> dict:
+    return {
+        "id": str(job.pk),
+        "kind": job.kind,
+        "status": job.status,
+        "status_display": job.get_status_display(),
+        "url": document_url(job.file_path) if job.status == DocumentJob.Status.DONE else "",
+        "file_name": job.file_path.split("/")[-1],
+        "error": job.error,
+    }
+
+
+@staff_member_required
+@require_POST
+def enqueue_document_job(request):
+    """
+    Ставит в очередь формирование документа (document_jobs.js).
+
+    POST-параметры: kind — вид документа (DocumentJob.Kind), object_id — ID записи.
+    Ответ: состояние задания, как у document_jobs_status.
+    """
+    kind = request.POST.get("kind")
+    object_id = _uuid_or_none(request.POST.get("object_id"))
+    if kind not in DOCUMENTS or object_id is None:
+        return JsonResponse({"error": "Неизвестный документ"}, status=400)
+    model = DOCUMENTS[kind][0]
+    opts = model._meta
+    if not request.user.has_perm(f"{opts.app_label}.change_{opts.model_name}"):
+        return JsonResponse({"error": "Недостаточно прав"}, status=403)
+    obj = model.objects.filter(pk=object_id).first()
+    if obj is None:
+        return JsonResponse({"error": "Запись не найдена"}, status=404)
+    return JsonResponse(job_state(enqueue_document(obj, kind, request.user)))
+
+
+@staff_member_required
+@require_GET
+def document_jobs_status(request):
+    """
+    Статусы заданий на формирование документов — для опроса со страницы карточки.
+
+    GET-параметры: id — ID задания (повторяется).
+    Ответ: {"results": {ID задания: состояние}}
+    """
+    ids = [pk for pk in map(_uuid_or_none, request.GET.getlist("id")) if pk]
+    jobs = DocumentJob.objects.filter(pk__in=ids) if ids else []
+    return JsonResponse({"results": {str(job.pk): job_state(job) for job in jobs}})
@@ -2,8 +2,6 @@ import datetime
 import re
 import logging
 import json
-import time
-from typing import Optional
 from datetime import date
 
 from django.utils.safestring import mark_safe
@@ -17,18 +15,22 @@ from spare_part.models import (
     SparePartCount,
     SparePartShipment,
     SparePartShipmentV2,
-    SparePartShipmentM2M,
     SparePartAccessories,
 )
+from spare_part.services import sync_shipment_lines
 from directory.models import Position, Engineer
 from .forms import *
 from .admin_filters import *
-from .docx_create import CreateServiceAkt, create_service_atk
 from contracts.models import Contract
+from documents.admin import document_field
+from documents.archive import documents_zip_response
+from documents.models import DocumentJob
+from documents.services import enqueue_documents
 from .models import (
     Equipment,
     EquipmentAccounting,
     EquipmentAccDepartment,
+    EquipmentCurrentLocation,
     Service,
     ServicePhotos,
     ServiceAccessories,
@@ -37,6 +39,7 @@ from .models import (
 from clients.models import Department, DeptContactPers
 
 from utils import MainModelAdmin
+from utils.search import FullTextSearchMixin
 
 logger = logging.getLogger("ebase")
 
@@ -55,6 +58,11 @@ class EquipmentAdmin(MainModelAdmin):
         "supplier_name",
     )
     list_filter = ("med_direction__name",)
+    export_fields = {
+        "med_direction_name": "med_direction__name",
+        "manufacturer_name": "manufacturer__name",
+        "supplier_name": "supplier__name",
+    }
     search_fields = ("short_name", "full_name")
     search_help_text = "Поиск по полному/краткому наименованию оборудования"
     ordering = ("full_name",)
@@ -152,14 +160,12 @@ class EquipmentAccDepartmentInline(admin.StackedInline):
 
 
 @admin.register(EquipmentAccounting)
-class EquipmentAccountingAdmin(MainModelAdmin):
+class EquipmentAccountingAdmin(FullTextSearchMixin, MainModelAdmin):
     form = EquipmentAccountingForm
 
     actions = MainModelAdmin.actions + [
         "set_is_our_service",
     ]
-    # date_hierarchy не поддерживает аннотированные поля в Django Admin, поэтому отключен
-    # date_hierarchy = 'active_install_dt'
     # подставляет в шаблон ссылку на сайт
     add_form_template = "ebase/admin/equipment_acc_change_form.html"
     # autocomplete_fields = ('equipment',)  # С ним не отрабатывает def formfield_for_foreignkey
@@ -177,18 +183,22 @@ class EquipmentAccountingAdmin(MainModelAdmin):
         "is_our_service",
         "is_our_supply",
     )
+    export_fields = {"comment_short": "comment"}
     search_fields = (
         "equipment__full_name",
         "equipment__short_name",
         "serial_number",
-        "equipment_acc_department_equipment_accounting__department__name",
-    )  # поиск по названию подразделения
+        "current_location__department__name",
+    )  # поиск по названию подразделения текущей установки
+    search_similarity_field = "serial_number"
     # 'equipment_acc_department_equipment_accounting__department__city__name',)  # поиск по городу подразделения
     search_help_text = (
         "Поиск по полному и краткому наименованию оборудования, по его серийному номеру или "
         "по названию Подразделения клиента (где установлено)"
     )
-    # ordering вынесен в get_queryset для корректной работы с аннотациями
+    # ordering задан в get_queryset
+    keyset_pagination = True
+    show_full_result_count = False
     list_select_related = True
     list_filter = (
         InstallDtFilter,
@@ -216,44 +226,6 @@ class EquipmentAccountingAdmin(MainModelAdmin):
         ("YOUJAIL", {"fields": ("url_youjail",)}),
     )
 
-    def get_search_results(self, request, queryset, search_term):
-        """
-        Переопределяем поиск, чтобы учитывать только активные установки оборудования.
-        Используем Exists для корректной фильтрации по активным подразделениям без дублей и
-        ложных срабатываний на неактивные записи.
-        """
-        if not search_term:
-            return super().get_search_results(request, queryset, search_term)
-
-        from django.db.models import Exists, OuterRef
-
-        # Разбиваем поисковый запрос на слова, как это делает Django по умолчанию
-        search_terms = search_term.split()
-        query = Q()
-
-        for term in search_terms:
-            # Поиск по основным полям оборудования
-            equipment_query = (
-                Q(equipment__full_name__icontains=term)
-                | Q(equipment__short_name__icontains=term)
-                | Q(serial_number__icontains=term)
-            )
-
-            # Поиск по названию подразделения ТОЛЬКО среди активных установок
-            dept_query = Exists(
-                EquipmentAccDepartment.objects.filter(
-                    equipment_accounting=OuterRef("pk"),
-                    is_active=True,
-                    department__name__icontains=term,
-                )
-            )
-
-            # Объединяем условия для текущего слова (OR между полями)
-            query &= equipment_query | dept_query
-
-        queryset = queryset.filter(query)
-        return queryset, True
-
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
         # Проверяем, что у сотрудника установлена должность менеджер
@@ -264,49 +236,8 @@ class EquipmentAccountingAdmin(MainModelAdmin):
             # Для менеджреров не отображаем оборудование посталенное не нами
             queryset = queryset.filter(is_our_supply__exact=1)
 
-        # Получаем последнюю дату техобслуживания через подзапрос
-        from django.db.models import OuterRef, Subquery, Max
-        from directory.models import ServiceType
-
-        # Найдём ID типа "Тех. обслуживание"
-        try:
-            maintenance_type = ServiceType.objects.get(name="Тех. обслуживание")
-        except ServiceType.DoesNotExist:
-            maintenance_type = None
-
-        # Подзапрос для получения последней даты техобслуживания
-        if maintenance_type:
-            last_maintenance_subquery = (
-                Service.objects.filter(
-                    equipment_accounting=OuterRef("pk"),
-                    service_type=maintenance_type,
-                    end_dt__isnull=False,
-                )
-                .order_by("-end_dt")
-                .values("end_dt")[:1]
-            )
-
-            queryset = queryset.annotate(
-                last_maintenance_date=Subquery(last_maintenance_subquery)
-            )
-        else:
-            # Если тип техобслуживания не найден, устанавливаем None
-            from django.db.models import Value
-            from django.db.models.fields import DateField
-
-            queryset = queryset.annotate(
-                last_maintenance_date=Value(None, output_field=DateField())
-            )
-
-        # Аннотация для активной даты установки (для сортировки и date_hierarchy)
-        queryset = queryset.annotate(
-            active_install_dt=Max(
-                "equipment_acc_department_equipment_accounting__install_dt",
-                filter=Q(equipment_acc_department_equipment_accounting__is_active=True),
-            )
-        )
-
-        # Глубокая оптимизация запросов для избежания N+1
+        # Место установки, инженер, дата монтажа и последнее ТО берутся из
+        # EquipmentCurrentLocation одним JOIN-ом, без подзапросов и distinct
         queryset = queryset.select_related(
             "equipment",
             "equipment_status",
@@ -316,51 +247,36 @@ class EquipmentAccountingAdmin(MainModelAdmin):
             "equipment__supplier",
             "equipment__manufacturer__city",
             "equipment__supplier__city",
-        ).prefetch_related(
-            Prefetch(
-                "equipment_acc_department_equipment_accounting",
-                queryset=EquipmentAccDepartment.objects.select_related(
-                    "department",
-                    "department__city",
-                    "department__client",
-                    "department__client__city",
-                    "engineer",
-                ).filter(is_active=True),
-            ),
-            Prefetch(
-                "service_equipment_accounting",
-                queryset=Service.objects.select_related("service_type"),
-            ),
+            "current_location__department",
+            "current_location__engineer",
         )
 
-        # Убираем дубликаты
-        queryset = queryset.distinct()
-
-        # Применяем сортировку после аннотации, чтобы избежать FieldError
-        queryset = queryset.order_by(
-            "-active_install_dt", "equipment", "serial_number", "user"
+        return queryset.order_by(
+            "-current_location__install_dt", "equipment", "serial_number", "user"
         )
 
-        return queryset
+    @staticmethod
+    def _current_location(obj):
+        try:
+            return obj.current_location
+        except EquipmentCurrentLocation.DoesNotExist:
+            return None
 
-    @admin.display(description="Установлено")
+    @admin.display(description="Установлено", ordering="current_location__department__name")
     def dept_name(self, obj):
-        # Используем предзагруженные активные данные
-        dept = next(iter(obj.equipment_acc_department_equipment_accounting.all()), None)
-        return dept.department.name if dept and dept.department else "--"
+        location = self._current_location(obj)
+        return location.department.name if location and location.department else "--"
 
     @admin.display(description="Инженер")
     def engineer(self, obj):
-        # Используем предзагруженные активные данные
-        dept = next(iter(obj.equipment_acc_department_equipment_accounting.all()), None)
-        return dept.engineer.name if dept and dept.engineer else "--"
+        location = self._current_location(obj)
+        return location.engineer.name if location and location.engineer else "--"
 
-    @admin.display(description="Дата монтажа")
+    @admin.display(description="Дата монтажа", ordering="current_location__install_dt")
     def install_dt(self, obj):
-        # Используем предзагруженные активные данные
-        dept = next(iter(obj.equipment_acc_department_equipment_accounting.all()), None)
-        if dept and dept.install_dt:
-            return dept.install_dt.strftime("%d.%m.%Y г.")
+        location = self._current_location(obj)
+        if location and location.install_dt:
+            return location.install_dt.strftime("%d.%m.%Y г.")
         return "--"
 
     @admin.display(description="Комментарий")
@@ -375,8 +291,9 @@ class EquipmentAccountingAdmin(MainModelAdmin):
 
     @admin.display(description="Последнее ТО")
     def last_maintenance_date(self, obj):
-        if hasattr(obj, "last_maintenance_date") and obj.last_maintenance_date:
-            return obj.last_maintenance_date.strftime("%d.%m.%Y г.")
+        location = self._current_location(obj)
+        if location and location.last_maintenance_dt:
+            return location.last_maintenance_dt.strftime("%d.%m.%Y г.")
         return "Не проводилось"
 
     @admin.action(description="Установить - Проведено ТО")
@@ -466,12 +383,17 @@ class ServicePhotosInline(admin.StackedInline):
 
 
 @admin.register(Service)
-class ServiceAdmin(MainModelAdmin):
-    actions = MainModelAdmin.actions + ["create_service_akt_by_action"]
+class ServiceAdmin(FullTextSearchMixin, MainModelAdmin):
+    actions = MainModelAdmin.actions + [
+        "create_service_akt_by_action",
+        "download_akts_zip",
+    ]
     # add_form_template = 'ebase/admin/service_change_form.html'
     # autocomplete_fields = ('equipment_accounting',)
     form = ServiceForm
     date_hierarchy = "beg_dt"
+    keyset_pagination = True
+    show_full_result_count = False
     filter_horizontal = ("spare_part",)
     inlines = (ServiceAccessoriesInline, ServicePhotosInline)
     list_display = (
@@ -488,7 +410,13 @@ class ServiceAdmin(MainModelAdmin):
         "end_dt",
     )
     list_select_related = ("equipment_accounting", "service_type", "contract")
-    list_filter = ()
+    list_filter = (ContractFilter,)
+    export_fields = {
+        "spare_part_used": "spare_part__name",
+        "contract_link": "contract__contract_number",
+        "reason_short": "reason",
+        "job_content_short": "job_content",
+    }
     readonly_fields = (
         "service_akt_url",
         "accept_in_akt_url",
@@ -500,6 +428,7 @@ class ServiceAdmin(MainModelAdmin):
         "equipment_accounting__serial_number",
         "contract__contract_number",
     )
+    search_similarity_field = "equipment_accounting__serial_number"
     search_help_text = (
         "Поиск по полному/краткому наименованию оборудования, по серийному номеру или номеру Контракта"
     )
@@ -657,7 +586,8 @@ class ServiceAdmin(MainModelAdmin):
 
     @admin.display(description="Фото", boolean=True)
     def photos(self, obj):
-        return True if obj.service_photos.values() else False
+        # Используем предзагруженные данные
+        return bool(obj.service_photos.all())
 
     @admin.display(description="Акт", boolean=True)
     def akt(self, obj):
@@ -672,86 +602,45 @@ class ServiceAdmin(MainModelAdmin):
 
     @admin.display(description="Акт о проведении работ")
     def service_akt_url(self, obj):
-        if obj.service_akt:
-            url = re.sub(r".*/docs", "/media/docs", obj.service_akt)
-            akt_name = obj.service_akt.split("/")[-1]
-            return self._akt_mark_safe(
-                url=url, akt_name=akt_name, tag_id="akt-create-btn", action="update"
-            )
-        if obj.pk:
-            return self._akt_mark_safe(tag_id="akt-create-btn", action="create")
-        # При создании новой записи направит сюда
-        return self._akt_mark_safe()
+        return document_field(obj, DocumentJob.Kind.SERVICE_AKT, "akt-create-btn", "Акт не создан")
 
     @admin.display(description="Акт приёма-передачи в ремонт")
     def accept_in_akt_url(self, obj):
-        if obj.accept_in_akt:
-            url = re.sub(r".*/docs", "/media/docs", obj.accept_in_akt)
-            akt_name = obj.accept_in_akt.split("/")[-1]
-            return self._akt_mark_safe(
-                url=url,
-                akt_name=akt_name,
-                tag_id="accept-akt-create-btn",
-                action="update",
-            )
-        if obj.pk:
-            return self._akt_mark_safe(tag_id="accept-akt-create-btn", action="create")
-        # При создании новой записи направит сюда
-        return self._akt_mark_safe()
+        return document_field(
+            obj, DocumentJob.Kind.ACCEPT_IN_AKT, "accept-akt-create-btn", "Акт не создан"
+        )
 
     @admin.display(description="Акт приёма-передачи из ремонта")
     def accept_from_akt_url(self, obj):
-        if obj.accept_from_akt:
-            url = re.sub(r".*/docs", "/media/docs", obj.accept_from_akt)
-            akt_name = obj.accept_from_akt.split("/")[-1]
-            return self._akt_mark_safe(
-                url=url,
-                akt_name=akt_name,
-                tag_id="accept-akt-from-create-btn",
-                action="update",
-            )
-        if obj.pk:
-            return self._akt_mark_safe(
-                tag_id="accept-akt-from-create-btn", action="create"
-            )
-        # При создании новой записи направит сюда
-        return self._akt_mark_safe()
-
-    @staticmethod
-    def _akt_mark_safe(
-        url: Optional[str] = None,
-        akt_name: Optional[str] = None,
-        tag_id: Optional[str] = None,
-        action: Optional[str] = None,
-    ):
-        """Возвращает mark_safe для актов"""
-        if action == "create":
-            return mark_safe(
-                f'<span class="akt-span">Акт не создан</span>'
-                f'<input type="button" id="{tag_id}" value="Создать">'
-            )
-        elif action == "update":
-            time_version = int(time.time())
-            return mark_safe(
-                f'<span class="akt-span"><a href="{url}?v={time_version}">{akt_name}</a></span>'
-                f'<input type="button" id="{tag_id}" value="Обновить">'
-            )
-        else:
-            return mark_safe('<span class="akt-span">-------</span>')
+        return document_field(
+            obj, DocumentJob.Kind.ACCEPT_FROM_AKT, "accept-akt-from-create-btn", "Акт не создан"
+        )
 
     @admin.action(description="Создать - Акт о проведении работ")
     def create_service_akt_by_action(self, request, queryset) -> None:
-        """Формирование актов о проделаной работе для выбранных случаев"""
-        equipments_list: list = []
-        for qs in queryset:
-            create_akt = create_service_atk(obj=qs)
-            equipments_list.append(f"{create_akt[0]} (s/n {create_akt[1]})")
-        if len(equipments_list) > 1:
-            msg = f"Акты сформированы для: {', '.join(equipments_list)}."
-        else:
-            msg = f"Акт сформирован для {', '.join(equipments_list)}."
+        """Постановка в очередь актов о проделанной работе для выбранных случаев.
 
-        self.message_user(request, message=msg)
+        Акты формирует воркер документов, ссылки появляются в карточках ремонтов.
+        """
+        jobs = enqueue_documents(queryset, DocumentJob.Kind.SERVICE_AKT, request.user)
+        self.message_user(
+            request,
+            message=f"Акты о проведении работ поставлены в очередь: {len(jobs)}. "
+            f"Ссылки появятся в карточках ремонтов после формирования.",
+        )
+
+    @admin.action(description="Скачать акты архивом (ZIP)")
+    def download_akts_zip(self, request, queryset):
+        """Все акты выбранных ремонтов одним архивом; недостающие формируются."""
+        return documents_zip_response(
+            queryset,
+            (
+                DocumentJob.Kind.ACCEPT_IN_AKT,
+                DocumentJob.Kind.SERVICE_AKT,
+                DocumentJob.Kind.ACCEPT_FROM_AKT,
+            ),
+            prefix="service_akts",
+        )
 
     @staticmethod
     def get_equipment_ids(search_str: str) -> QuerySet:
@@ -793,32 +682,6 @@ class ServiceAdmin(MainModelAdmin):
         return fieldsets
 
     def get_form(self, request, obj=None, change=False, **kwargs):
-        """В карточке по ремонту есть кнопка по созданию акта. Чтобы отследить её
-        нажатие, через JS в GET передается параметр akt со значенем serviceAkt или
-        acceptAkt или acceptFromAkt.
-
-        serviceAkt - Акт о проведении работ
-        acceptInAkt - Акт приема-передачи оборудования в ремонт
-        acceptFromAkt - Акт приема-передачи оборудования из ремонт
-        """
-        if request.GET.get("akt"):
-            akt_name = request.GET["akt"]
-            start_msg_text = ""
-            if obj:
-                create_akt = create_service_atk(obj, akt_name)
-
-                if akt_name == "serviceAkt":
-                    start_msg_text = "Акт о проведении работ"
-                elif akt_name == "acceptInAkt":
-                    start_msg_text = "Акт приема-передачи оборудования в ремонт"
-                elif akt_name == "acceptFromAkt":
-                    start_msg_text = "Акт приема-передачи оборудования из ремонт"
-
-                self.message_user(
-                    request,
-                    message=f"{start_msg_text} сформирован для "
-                    f"{create_akt[0]} (s/n {create_akt[1]})",
-                )
         form = super().get_form(request, obj=None, change=False, **kwargs)
 
         # Обновляем queryset для поля contact_person
@@ -901,35 +764,23 @@ class ServiceAdmin(MainModelAdmin):
             eq_acc: QuerySet = self.get_equipment_ids(search_str=eq_search)
 
         if db_field.name == "equipment_accounting":
-            # Для страницы добавления новой записи
+            # Для страницы добавления новой записи: варианты подгружаются
+            # постранично (EquipmentAccountingAutocomplete), форма не
+            # выгружает весь парк оборудования
             if re.search(r"\/service\/add\/", request.path):
-                if eq_acc:
-                    # Предзагружаем все необходимые связи для оборудования
-                    eq_acc_ids = eq_acc.values_list("pk", flat=True)
-                    eq_acc_queryset: QuerySet = EquipmentAccounting.objects.filter(
-                        pk__in=eq_acc_ids
-                    )
-                else:
-                    eq_acc_queryset: QuerySet = EquipmentAccounting.objects.all()
-
-                kwargs["queryset"] = eq_acc_queryset.select_related(
-                    "equipment",
-                    "equipment__manufacturer",
-                    "equipment__supplier",
-                    "equipment__med_direction",
-                    "equipment_status",
-                    "user",
-                ).prefetch_related(
-                    Prefetch(
-                        "equipment_acc_department_equipment_accounting",
-                        queryset=EquipmentAccDepartment.objects.select_related(
-                            "department",
-                            "department__client",
-                            "department__city",
-                            "engineer",
-                        ),
-                    )
+                kwargs["widget"] = EquipmentAccountingAutocomplete(
+                    db_field,
+                    self.admin_site,
+                    params={
+                        "search": eq_search,
+                        "city": request.GET.get("city"),
+                        "department": request.GET.get("department"),
+                        "med_direction": request.GET.get("med_direction"),
+                    },
                 )
+                if eq_acc is None:
+                    eq_acc = EquipmentAccounting.objects.all()
+                kwargs["queryset"] = eq_acc.select_related("equipment")
 
             # Для страницы изменения записи - ограничиваем queryset только текущим оборудованием
             elif re.search(r"\/service\/.*\/change\/", request.path):
@@ -979,10 +830,9 @@ class ServiceAdmin(MainModelAdmin):
                 .values_list("replacement_equipment_id", flat=True)
             )
 
-            kwargs["queryset"] = (
-                ReplacementEquipment.objects.select_related("equipment", "user")
-                .prefetch_related("accessories")
-                .exclude(id__in=used_replacement_equipment_ids)
+            # Подпись прибора с комплектующими хранится в ReplacementEquipment.label
+            kwargs["queryset"] = ReplacementEquipment.objects.exclude(
+                id__in=used_replacement_equipment_ids
             )
         elif db_field.name == "contract":
             kwargs["queryset"] = Contract.objects.all().select_related("client")
@@ -1131,24 +981,20 @@ class ServiceAdmin(MainModelAdmin):
                     "user": request.user,
                     "comment": comment,
                     "is_auto_comment": True,
+                    "contract": obj.contract,
                 },
             )
 
-            # Удаляем старые записи о запчастях
-            shipment.shipment_m2m.all().delete()
+            # Переносим связь с контрактом из ремонта в отгрузку до записи строк:
+            # их расходы должны попасть в пересчёт нового контракта. Сигнал
+            # сохранения отгрузки пересчитывает и прежний, и новый контракт.
+            if shipment.contract_id != obj.contract_id:
+                shipment.contract = obj.contract
+                shipment.save(update_fields=["contract"])
 
-            # Добавляем новые записи о запчастях через промежуточную модель
-            for spare_part_info in spare_parts_data:
-                SparePartShipmentM2M.objects.create(
-                    shipment=shipment,
-                    spare_part_id=spare_part_info["id"],
-                    quantity=spare_part_info["quantity"],
-                    expiration_dt=spare_part_info["expiration_dt"],
-                )
-
-            # Переносим связь с контрактом из ремонта в отгрузку
-            shipment.contract = obj.contract
-            shipment.save(update_fields=["contract"])
+            # Приводим строки отгрузки к запчастям из формы: меняются только
+            # отличающиеся строки, остатки правятся на разницу
+            sync_shipment_lines(shipment, spare_parts_data)
 
         # TODO: включить, если нужно учитывать количество запчастей из SparePartCount
         # def delete_model(self, request, obj):
@@ -1188,6 +1034,10 @@ class ReplacementEquipmentAdmin(MainModelAdmin):
         "equipment",
         "serial_number",
     )
+    export_fields = {
+        "accessories_info": "accessories__name",
+        "comment_short": "comment",
+    }
     search_fields = (
         "equipment__full_name",
         "equipment__short_name",
@@ -1256,7 +1106,8 @@ class ReplacementEquipmentAdmin(MainModelAdmin):
 
     @admin.display(description="Комплектующие")
     def accessories_info(self, obj):
-        accessories_names = list(obj.accessories.all().values_list("name", flat=True))
+        # Используем предзагруженные данные
+        accessories_names = [accessory.name for accessory in obj.accessories.all()]
         return ", ".join(accessories_names) if accessories_names else "-"
 
     @admin.display(description="Состояние")
@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 
-from contracts.models import Contract
+from directory.cache import directory_cache
+from directory.models import MedDirection
+from utils.list_filters import AutocompleteListFilter
 
 
 class InstallDtFilter(admin.SimpleListFilter):
@@ -22,24 +24,20 @@ class InstallDtFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         if self.value() == "notnulldt":
-            return queryset.filter(
-                equipment_acc_department_equipment_accounting__install_dt__isnull=False
-            )
+            return queryset.filter(current_location__install_dt__isnull=False)
         elif self.value() == "nulldt":
-            return queryset.filter(
-                equipment_acc_department_equipment_accounting__install_dt__isnull=True
-            )
+            return queryset.filter(current_location__install_dt__isnull=True)
 
 
 class MedDirectionFilter(admin.SimpleListFilter):
+    """Варианты — из кэша справочников, без запроса на каждый показ списка."""
+
     title = "Направления"
     parameter_name = "med_direction"
 
     def lookups(self, request, model_admin):
-        from directory.models import MedDirection
-
-        directions = MedDirection.objects.all().order_by("name")
-        return [(direction.id, direction.name) for direction in directions]
+        directions = sorted(directory_cache.all(MedDirection), key=lambda d: d.name)
+        return [(d.id, d.name) for d in directions]
 
     def queryset(self, request, queryset):
         if self.value():
@@ -47,18 +45,16 @@ class MedDirectionFilter(admin.SimpleListFilter):
         return queryset
 
 
-class ContractFilter(admin.SimpleListFilter):
+class ContractFilter(AutocompleteListFilter):
+    """Контракт выбирается поиском: реестр контрактов в панель не выгружается."""
+
     title = _("По Контракту")
     parameter_name = "contract"
-
-    def lookups(self, request, model_admin):
-        choices = [
-            ("none", _("Без контракта")),
-            ("all", _("С контрактом")),
-        ]
-        for contract in Contract.objects.all().order_by("contract_number"):
-            choices.append((str(contract.pk), contract.contract_number))
-        return choices
+    field_name = "contract"
+    static_choices = (
+        ("none", _("Без контракта")),
+        ("all", _("С контрактом")),
+    )
 
     def queryset(self, request, queryset):
         value = self.value()
@@ -6,13 +6,13 @@ from pathlib import Path
 
 from django.conf import settings
 from django.db.models.query import QuerySet
-from docx import Document
 from docx.table import Table, _Cell
 from docx.shared import Pt
 from docx.oxml.shared import OxmlElement
 from docx.oxml.ns import qn
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 
+from documents.docx_template import fingerprint, is_current, render_template
 from .models import Service
 
 
@@ -26,7 +26,9 @@ class CreateServiceAkt:
                  service_type_name: str = "",
                  contract_number: str = "",
                  engineer_name: str = ""):
-        self.akt = Document(str(template_path))
+        self.template_path = template_path
+        self.template = None
+        self.akt = None
         self.file_name = template_path.name
         self.client = client
         self.description = description
@@ -39,6 +41,26 @@ class CreateServiceAkt:
         self.contract_number = contract_number
         self.engineer_name = engineer_name
         self.save_file_path = self.create_save_path()
+        self.fingerprint = fingerprint(template_path, self.input_data())
+
+    def input_data(self) -> dict:
+        """Все данные, которые попадают в акт, — для отпечатка документа"""
+        return {
+            'client': self.client,
+            'description': self.description,
+            'job_content': self.job_content,
+            'spare_parts': self.spare_parts,
+            'accessories': sorted(self.accessories),
+            'replacement_equipment': self.replacement_equipment,
+            'accessories_with_quantity': self.accessories_with_quantity,
+            'service_type_name': self.service_type_name,
+            'contract_number': self.contract_number,
+            'engineer_name': self.engineer_name,
+        }
+
+    def is_current(self) -> bool:
+        """Файл акта уже сформирован из тех же данных и той же версии шаблона"""
+        return is_current(self.save_file_path, self.fingerprint)
 
     def create_save_path(self) -> str:
         """Проверяет наличие папки для хранения актов определенной модели оборудования и
@@ -58,6 +80,10 @@ class CreateServiceAkt:
         return str(Path(settings.MEDIA_ROOT, 'docs', 'service_akt',
                         equipment_short_name, save_file_name))
 
+    def render(self):
+        """Формирует файл акта"""
+        self.update_tables()
+
     def update_paragraphs(self):
         """Для обновления абзацев. НЕ ИСПОЛЬЗУЕТСЯ"""
         for par in self.akt.paragraphs:
@@ -66,22 +92,25 @@ class CreateServiceAkt:
 
     def update_tables(self):
         """Обноления данных в таблицах документа WORD"""
+        # Копия скомпилированного шаблона: плейсхолдеры ищутся по индексу
+        self.template = render_template(self.template_path)
+        self.akt = self.template.document
         # итерируемся по всем таблицам в документе
         for i, table in enumerate(self.akt.tables, start=1):
             if i == 1 and self.file_name in ["Akt_in_service.docx", "Akt_from_service.docx"]:
-                self.head_table(table)
+                self.head_table(i)
 
-            if i == 2: self.main_table(table)  # таблица №2
+            if i == 2: self.main_table(i)  # таблица №2
 
             if i == 3:
                 if self.file_name == "service_akt_MEDSIL.docx":
-                    self.medsil_description_table_update(table)
+                    self.medsil_description_table_update(i)
                 else:
                     self.description_update(table)
 
             if i == 4:
                 if self.file_name == "service_akt_MEDSIL.docx":
-                    self.job_content_update(table)
+                    self.job_content_update(i)
                 elif self.file_name in ["Akt_in_service.docx", "Akt_from_service.docx"] \
                         and len(self.accessories_with_quantity) > 0:
                     # self.fill_accessories_table_for_service(table)
@@ -100,7 +129,7 @@ class CreateServiceAkt:
 
         self.update_engineer_paragraphs()
 
-        self.akt.save(self.save_file_path)
+        self.template.save(self.save_file_path, self.fingerprint)
 
     @staticmethod
     def cell_paragraph_gen(table: Table):
@@ -110,9 +139,9 @@ class CreateServiceAkt:
                 for paragraph in cell.paragraphs:
                     yield n, paragraph  # возвращает (номер строки, объект параграф)
 
-    def head_table(self, table: Table):
+    def head_table(self, table_no: int):
         """Обновляем таблицу с указанием города и даты (сразу под названеим акта)"""
-        for n, paragraph in self.cell_paragraph_gen(table):
+        for paragraph in self.template.paragraphs(*self.client, table=table_no):
             for key in self.client.keys():
                 if key in paragraph.text:
                     paragraph.text = paragraph.text.replace(key, self.client[key])
@@ -121,9 +150,9 @@ class CreateServiceAkt:
                     if key == "{{ AKT_DATE }}":
                         paragraph.paragraph_format.right_indent = Pt(0)  # отступ справа в 0 пунктов
 
-    def main_table(self, table: Table):
+    def main_table(self, table_no: int):
         """Обновления даттых в таблице с реквизитами"""
-        for n, paragraph in self.cell_paragraph_gen(table):
+        for paragraph in self.template.paragraphs(*self.client, table=table_no):
             for k, v in self.client.items():
                 if k in paragraph.text:
                     paragraph.text = paragraph.text.replace(k, v)
@@ -143,41 +172,32 @@ class CreateServiceAkt:
             if n == 4:
                 paragraph.text = self.description
 
-    def medsil_description_table_update(self, table: Table):
+    def medsil_description_table_update(self, table_no: int):
         """Обновление таблицы с наименованием работ, договором и описанием
         неисправности для шаблона service_akt_MEDSIL.docx"""
-        for _, paragraph in self.cell_paragraph_gen(table):
-            text = paragraph.text
-            if "{{ SERVICE_TYPE }}" in text:
-                self._replace_placeholder_in_paragraph(
-                    paragraph, "{{ SERVICE_TYPE }}", self.service_type_name
-                )
-            elif "{{ CONTRACT_NUMBER }}" in text:
-                self._replace_placeholder_in_paragraph(
-                    paragraph, "{{ CONTRACT_NUMBER }}", self.contract_number
-                )
-            elif "{{ SERVICE_DESCRIPTION }}" in text:
-                self._replace_placeholder_in_paragraph(
-                    paragraph, "{{ SERVICE_DESCRIPTION }}", self.description
-                )
-
-    def job_content_update(self, table):
+        for placeholder, value in (
+            ("{{ SERVICE_TYPE }}", self.service_type_name),
+            ("{{ CONTRACT_NUMBER }}", self.contract_number),
+            ("{{ SERVICE_DESCRIPTION }}", self.description),
+        ):
+            for paragraph in self.template.paragraphs(placeholder, table=table_no):
+                self._replace_placeholder_in_paragraph(paragraph, placeholder, value)
+
+    def job_content_update(self, table_no: int):
         """Описание проведенных работ"""
-        for _, paragraph in self.cell_paragraph_gen(table):
-            if "{{ SERVICE_JOB_CONTENT }}" in paragraph.text:
-                self._replace_placeholder_in_paragraph(
-                    paragraph, "{{ SERVICE_JOB_CONTENT }}", self.job_content
-                )
+        for paragraph in self.template.paragraphs("{{ SERVICE_JOB_CONTENT }}", table=table_no):
+            self._replace_placeholder_in_paragraph(
+                paragraph, "{{ SERVICE_JOB_CONTENT }}", self.job_content
+            )
 
     def update_engineer_paragraphs(self):
         """Заменяет placeholder {{ ENGINEER }} в абзацах документа."""
         if self.file_name != "service_akt_MEDSIL.docx":
             return
-        for paragraph in self.akt.paragraphs:
-            if "{{ ENGINEER }}" in paragraph.text:
-                self._replace_placeholder_in_paragraph(
-                    paragraph, "{{ ENGINEER }}", self.engineer_name
-                )
+        for paragraph in self.template.paragraphs("{{ ENGINEER }}", body=True):
+            self._replace_placeholder_in_paragraph(
+                paragraph, "{{ ENGINEER }}", self.engineer_name
+            )
 
     @staticmethod
     def _replace_placeholder_in_paragraph(paragraph, placeholder: str, value: str):
@@ -367,8 +387,11 @@ class CreateServiceAkt:
         cell_tcPr.append(tc_border)
 
 
-def create_service_atk(obj: Service, akt_name: str):
-    """Создание акта для преданного объекта из модели Service.
+def service_akt(obj: Service, akt_name: str) -> CreateServiceAkt:
+    """Данные акта для объекта из модели Service: путь файла и отпечаток.
+
+    Сам документ не формируется — это делает ``update_tables()``, если
+    ``is_current()`` ложно. Акт можно передать в другой процесс (pickle).
 
     serviceAkt - Акт о проведении работ
     acceptInAkt - Акт приема-передачи оборудования в ремонт
@@ -474,7 +497,8 @@ def create_service_atk(obj: Service, akt_name: str):
     service_type_name = obj.service_type.name if obj.service_type else ''
     contract_number = obj.contract.contract_number if obj.contract else ''
     accessories = \
-        obj.replacement_equipment.accessories.values_list("name", flat=True) if obj.replacement_equipment else []
+        list(obj.replacement_equipment.accessories.values_list("name", flat=True)) \
+        if obj.replacement_equipment else []
     replacement_equipment = \
         f"{obj.replacement_equipment.equipment.full_name} (s/n {obj.replacement_equipment.serial_number})" \
             if obj.replacement_equipment else ""
@@ -511,16 +535,28 @@ def create_service_atk(obj: Service, akt_name: str):
                                   service_type_name=service_type_name,
                                   contract_number=contract_number,
                                   engineer_name=engineer_name,)
-    create_akt.update_tables()
+    return create_akt
+
+
+def create_service_atk(obj: Service, akt_name: str):
+    """Создание акта для преданного объекта из модели Service (см. service_akt)."""
+    create_akt = service_akt(obj, akt_name)
+    client = create_akt.client
+    # Данные и шаблон не менялись — готовый файл не формируется заново
+    if not create_akt.is_current():
+        create_akt.update_tables()
 
     if akt_name == 'serviceAkt':
-        obj.service_akt = create_akt.save_file_path
+        field_name = 'service_akt'
     elif akt_name == 'acceptInAkt':
-        obj.accept_in_akt = create_akt.save_file_path
+        field_name = 'accept_in_akt'
     else:
-        obj.accept_from_akt = create_akt.save_file_path
-
-    obj.save()
+        field_name = 'accept_from_akt'
+    if getattr(obj, field_name) != create_akt.save_file_path:
+        setattr(obj, field_name, create_akt.save_file_path)
+        # Меняется только путь к файлу: без save(), чтобы не запускать сигналы
+        # ремонта (пересчёт контракта, места установки, поискового документа)
+        Service.objects.filter(pk=obj.pk).update(**{field_name: create_akt.save_file_path})
 
     return client['equipment_short_name'], client['{{ SERIAL_NUM }}']
 
@@ -1,4 +1,8 @@
+from urllib.parse import urlencode
+
 from django import forms
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.urls import reverse
 from django.forms.widgets import URLInput
 from django.db.models import Value, CharField, Q
 from django.db.models.functions import Concat
@@ -20,6 +24,23 @@ class ButtonWidget(forms.Widget):
         ''')
 
 
+class EquipmentAccountingAutocomplete(AutocompleteSelect):
+    """Выбор единицы учёта через select2 с подгрузкой с сервера.
+
+    Варианты отдаёт ebase.views.equipment_accounting_autocomplete постранично,
+    в форму попадает только выбранное значение. ``params`` — отбор
+    (search, city, department, med_direction), добавляется к адресу запроса.
+    """
+
+    def __init__(self, field, admin_site, params=None, **kwargs):
+        super().__init__(field, admin_site, **kwargs)
+        self.params = {key: value for key, value in (params or {}).items() if value}
+
+    def get_url(self):
+        url = reverse("equipment_accounting_autocomplete")
+        return f"{url}?{urlencode(self.params)}" if self.params else url
+
+
 def get_equipment_for_form() -> tuple:
     """Вернет картеж для поля формы ChoiceField"""
     qs = Equipment.objects.values_list("pk", "full_name",)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ebase.services import rebuild_current_locations
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает таблицу текущих мест установки оборудования "
+        "(EquipmentCurrentLocation) по установкам и ремонтам"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Сколько единиц учёта пересчитывать за один проход",
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_current_locations(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано записей: {total}"))
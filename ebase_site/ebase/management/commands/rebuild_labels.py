@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from ebase.models import ReplacementEquipment, Service
+from spare_part.models import SparePartShipmentV2
+from utils.labels import refresh_labels
+
+LABEL_MODELS = (ReplacementEquipment, Service, SparePartShipmentV2)
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает подписи (label) подменного оборудования, ремонтов "
+        "и отгрузок запчастей"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Сколько записей читать из БД за один запрос",
+        )
+
+    def handle(self, *args, **options):
+        for model in LABEL_MODELS:
+            total = refresh_labels(model.objects.all(), batch_size=options["batch_size"])
+            self.stdout.write(
+                self.style.SUCCESS(f"{model._meta.verbose_name_plural}: обновлено {total}")
+            )
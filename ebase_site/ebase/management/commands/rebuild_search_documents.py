@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.models import Department
+from ebase.models import EquipmentAccounting, Service
+from spare_part.models import SparePart
+from utils.search import refresh_search_documents, search_supported
+
+SEARCH_MODELS = (EquipmentAccounting, Service, SparePart, Department)
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает поисковые документы (search_document) учёта оборудования, "
+        "ремонтов, запчастей и подразделений"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Сколько записей читать из БД за один запрос",
+        )
+
+    def handle(self, *args, **options):
+        if not search_supported():
+            raise CommandError("Полнотекстовый поиск доступен только на PostgreSQL")
+        for model in SEARCH_MODELS:
+            total = refresh_search_documents(
+                model.objects.all(), batch_size=options["batch_size"]
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"{model._meta.verbose_name_plural}: {total}")
+            )
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Первичное заполнение; дальше таблица поддерживается сигналами
+# и командой rebuild_current_locations.
+FILL_CURRENT_LOCATION_SQL = """
+INSERT INTO "medsil"."equipment_current_location"
+    (equipment_accounting_id, department_id, engineer_id, install_dt, last_maintenance_dt)
+SELECT ea.id, inst.department_id, inst.engineer_id, inst.install_dt, tm.last_dt
+FROM "medsil"."equipment_accounting" ea
+LEFT JOIN LATERAL (
+    SELECT d.department_id, d.engineer_id, d.install_dt
+    FROM "medsil"."equipment_acc_department" d
+    WHERE d.equipment_accounting_id = ea.id AND d.is_active
+    ORDER BY d.install_dt DESC NULLS LAST, d.create_dt DESC
+    LIMIT 1
+) inst ON TRUE
+LEFT JOIN LATERAL (
+    SELECT MAX(s.end_dt) AS last_dt
+    FROM "medsil"."service" s
+    JOIN "medsil"."service_type" st ON st.id = s.service_type_id
+    WHERE s.equipment_accounting_id = ea.id AND st.name = 'Тех. обслуживание'
+) tm ON TRUE;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0001_initial'),
+        ('directory', '0003_supplier_manufacturer'),
+        ('ebase', '0015_service_engineer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EquipmentCurrentLocation',
+            fields=[
+                ('equipment_accounting', models.OneToOneField(db_comment='ID Учёта оборудования', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='current_location', serialize=False, to='ebase.equipmentaccounting', verbose_name='Оборудование')),
+                ('install_dt', models.DateField(blank=True, db_comment='Дата монтажа активной установки', null=True, verbose_name='Дата монтажа')),
+                ('last_maintenance_dt', models.DateField(blank=True, db_comment='Дата окончания последнего тех. обслуживания', null=True, verbose_name='Последнее ТО')),
+                ('department', models.ForeignKey(blank=True, db_comment='ID подразделения активной установки', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='current_location_department', to='clients.department', verbose_name='Установлено')),
+                ('engineer', models.ForeignKey(blank=True, db_comment='ID инженера, запускавшего оборудование', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='current_location_engineer', to='directory.engineer', verbose_name='Инженер')),
+            ],
+            options={
+                'verbose_name': 'Текущее место установки',
+                'verbose_name_plural': 'Текущие места установки',
+                'db_table': '"medsil"."equipment_current_location"',
+                'db_table_comment': 'Текущее место установки оборудования (денормализация equipment_acc_department и service).\n\n-- BMatyushin',
+                'indexes': [models.Index(fields=['department'], name='equipment_c_departm_ff8cbe_idx'), models.Index(fields=['install_dt'], name='equipment_c_install_a36410_idx'), models.Index(fields=['last_maintenance_dt'], name='equipment_c_last_ma_629665_idx')],
+            },
+        ),
+        migrations.RunSQL(FILL_CURRENT_LOCATION_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
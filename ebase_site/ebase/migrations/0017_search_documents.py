@@ -0,0 +1,42 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:16
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# GIN-индексы поиска: pg_trgm под ILIKE по search_fields админки (Django
+# строит icontains как UPPER(col::text) LIKE UPPER(...)), и по tsvector-документу
+SEARCH_INDEXES = (
+    ("equipment_full_name_trgm", "equipment", '(UPPER("full_name"::text)) gin_trgm_ops'),
+    ("equipment_short_name_trgm", "equipment", '(UPPER("short_name"::text)) gin_trgm_ops'),
+    ("equipment_acc_serial_trgm", "equipment_accounting", '(UPPER("serial_number"::text)) gin_trgm_ops'),
+    ("equipment_acc_search_doc", "equipment_accounting", '"search_document"'),
+    ("service_search_doc", "service", '"search_document"'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebase', '0016_equipmentcurrentlocation'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='equipmentaccounting',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(db_comment='tsvector для поиска: оборудование, серийный номер, комментарий', editable=False, null=True, verbose_name='Поисковый документ'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(db_comment='tsvector для поиска: оборудование, серийный номер, описание работ', editable=False, null=True, verbose_name='Поисковый документ'),
+        ),
+    ] + [
+        migrations.RunSQL(
+            f'CREATE INDEX IF NOT EXISTS {name} ON "medsil"."{table}" USING gin ({expr})',
+            reverse_sql=f'DROP INDEX IF EXISTS "medsil".{name}',
+        )
+        for name, table, expr in SEARCH_INDEXES
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ebase', '0017_search_documents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='replacementequipment',
+            name='label',
+            field=models.TextField(blank=True, db_comment='Подпись для списков выбора: оборудование, серийный номер, комплектующие', default='', editable=False, verbose_name='Подпись'),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='label',
+            field=models.TextField(blank=True, db_comment='Подпись для списков выбора: оборудование, серийный номер, вид работ', default='', editable=False, verbose_name='Подпись'),
+        ),
+    ]
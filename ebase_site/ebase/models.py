@@ -3,12 +3,16 @@ from pathlib import Path
 
 from django.db import models
 from django.conf import settings
+from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
 from django.core.validators import MinValueValidator
 
 # from django.contrib.postgres.fields import ArrayField
 from django.utils.timezone import now
 
+from utils.labels import LabelMixin
+
 
 company = '"medsil"'  # название схемы для таблиц
 
@@ -197,6 +201,15 @@ class EquipmentAccounting(EbaseModel):
     comment = models.TextField(
         null=True, blank=True, verbose_name="Комментарий", db_comment="Комментарий"
     )
+    search_document = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name="Поисковый документ",
+        db_comment="tsvector для поиска: оборудование, серийный номер, комментарий",
+    )
+
+    # Связи для поискового документа (см. utils.search)
+    search_select_related = ("equipment",)
 
     class Meta:
         db_table = f'{company}."equipment_accounting"'
@@ -226,6 +239,14 @@ class EquipmentAccounting(EbaseModel):
     def __repr__(self):
         return f"<EquipmentAccounting {self.serial_number=!r}>"
 
+    def search_document_parts(self):
+        return [
+            (self.equipment.full_name, "A"),
+            (self.equipment.short_name, "A"),
+            (self.serial_number, "A"),
+            (self.comment, "C"),
+        ]
+
 
 class EquipmentAccDepartment(EbaseModel):
     """Учет поставленного оборудования в подразделения клиента"""
@@ -295,7 +316,72 @@ class EquipmentAccDepartment(EbaseModel):
         return f"<EquipmentAccDepartment {self.id=!r}, {self.is_active=!r}>"
 
 
-class ReplacementEquipment(EbaseModel):
+class EquipmentCurrentLocation(models.Model):
+    """Текущее место установки единицы оборудования.
+
+    Денормализованная выжимка из EquipmentAccDepartment (активная установка
+    с самой поздней датой монтажа) и Service (последнее завершённое ТО) для
+    changelist-а "Учёт оборудований". Поддерживается сигналами, пересобирается
+    командой ``manage.py rebuild_current_locations``."""
+
+    equipment_accounting = models.OneToOneField(
+        "EquipmentAccounting",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="current_location",
+        verbose_name="Оборудование",
+        db_comment="ID Учёта оборудования",
+    )
+    department = models.ForeignKey(
+        "clients.Department",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="current_location_department",
+        verbose_name="Установлено",
+        db_comment="ID подразделения активной установки",
+    )
+    engineer = models.ForeignKey(
+        "directory.Engineer",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="current_location_engineer",
+        verbose_name="Инженер",
+        db_comment="ID инженера, запускавшего оборудование",
+    )
+    install_dt = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name="Дата монтажа",
+        db_comment="Дата монтажа активной установки",
+    )
+    last_maintenance_dt = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name="Последнее ТО",
+        db_comment="Дата окончания последнего тех. обслуживания",
+    )
+
+    class Meta:
+        db_table = f'{company}."equipment_current_location"'
+        db_table_comment = (
+            "Текущее место установки оборудования (денормализация "
+            "equipment_acc_department и service).\n\n-- BMatyushin"
+        )
+        verbose_name = "Текущее место установки"
+        verbose_name_plural = "Текущие места установки"
+        indexes = [
+            models.Index(fields=["department"]),
+            models.Index(fields=["install_dt"]),
+            models.Index(fields=["last_maintenance_dt"]),
+        ]
+
+    def __str__(self):
+        return f"{self.equipment_accounting_id} - {self.department_id}"
+
+
+class ReplacementEquipment(LabelMixin, EbaseModel):
     """Подменное оборудование для временной замены"""
 
     equipment = models.ForeignKey(
@@ -350,6 +436,17 @@ class ReplacementEquipment(EbaseModel):
         db_comment="Пользователь, который добавил запись о подменном оборудовании",
         help_text="Пользователь, который добавил запись о подменном оборудовании",
     )
+    label = models.TextField(
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Подпись",
+        db_comment="Подпись для списков выбора: оборудование, серийный номер, комплектующие",
+    )
+
+    # Связи для подписи (см. utils.labels)
+    label_select_related = ("equipment",)
+    label_prefetch_related = ("accessories",)
 
     class Meta:
         db_table = f'{company}."replacement_equipment"'
@@ -365,8 +462,8 @@ class ReplacementEquipment(EbaseModel):
             models.Index(fields=["user"]),
         ]
 
-    def __str__(self):
-        accessories_list = list(self.accessories.all().values_list("name", flat=True))
+    def build_label(self):
+        accessories_list = sorted(accessory.name for accessory in self.accessories.all())
         accessories_info = (
             f" с комплектующими: {', '.join(accessories_list)}"
             if accessories_list
@@ -428,7 +525,7 @@ class ServiceAccessories(models.Model):
         return f"<ServiceAccessories {self.accessory.name=!r}, {self.quantity=!r}>"
 
 
-class Service(EbaseModel):
+class Service(LabelMixin, EbaseModel):
     """Таблица для учета поступившего на ремонт оборудования."""
 
     replacement_equipment = models.OneToOneField(
@@ -592,6 +689,26 @@ class Service(EbaseModel):
         help_text="Акт приёма-передачи оборудования из ремонт",
         validators=[validators.RegexValidator(regex=r"\.docs$|\.doc$")],
     )
+    search_document = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name="Поисковый документ",
+        db_comment="tsvector для поиска: оборудование, серийный номер, описание работ",
+    )
+    label = models.TextField(
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Подпись",
+        db_comment="Подпись для списков выбора: оборудование, серийный номер, вид работ",
+    )
+    # Задания на формирование актов и их статусы (documents.DocumentJob)
+    document_jobs = GenericRelation("documents.DocumentJob")
+
+    # Связи для поискового документа (см. utils.search)
+    search_select_related = ("equipment_accounting__equipment",)
+    # Связи для подписи (см. utils.labels)
+    label_select_related = ("equipment_accounting__equipment", "service_type")
 
     class Meta:
         db_table = f'{company}."service"'
@@ -607,12 +724,28 @@ class Service(EbaseModel):
             models.Index(fields=["user"]),
         ]
 
-    def __str__(self):
+    def build_label(self):
         return f"{self.equipment_accounting} - {self.service_type}"
 
     def __repr__(self):
         return f"<Service {self.id=!r}, {self.user=!r}>"
 
+    def search_document_parts(self):
+        parts = [
+            (self.reason, "B"),
+            (self.description, "C"),
+            (self.job_content, "C"),
+            (self.comment, "C"),
+        ]
+        if self.equipment_accounting:
+            equipment_accounting = self.equipment_accounting
+            parts += [
+                (equipment_accounting.equipment.full_name, "A"),
+                (equipment_accounting.equipment.short_name, "A"),
+                (equipment_accounting.serial_number, "A"),
+            ]
+        return parts
+
 
 class ServicePhotos(EbaseModel):
     """Набор фото связанных с ремонтом"""
@@ -0,0 +1,224 @@
+"""Сервисные функции приложения ebase."""
+from datetime import datetime
+from typing import Optional
+
+from django.db.models import CharField, F, Max, Q, Sum, Value
+from django.db.models.functions import Concat, Upper
+
+from directory.cache import directory_cache
+from directory.models import ServiceType
+from spare_part.fifo import current_prices
+from spare_part.models import SparePart, SparePartCount
+from .models import (
+    EquipmentAccDepartment,
+    EquipmentAccounting,
+    EquipmentCurrentLocation,
+    Service,
+)
+
+# Вид работ, по которому считается дата последнего ТО
+MAINTENANCE_SERVICE_TYPE = "Тех. обслуживание"
+
+_LOCATION_FIELDS = ("department", "engineer", "install_dt", "last_maintenance_dt")
+
+
+def get_maintenance_type_id():
+    found = directory_cache.filter(ServiceType, name=MAINTENANCE_SERVICE_TYPE)
+    return found[0].id if found else None
+
+
+def refresh_current_locations(equipment_accounting_ids) -> int:
+    """Пересчитывает EquipmentCurrentLocation для переданных единиц учёта.
+
+    Обходится тремя запросами на чтение и одним upsert-ом независимо
+    от количества ID. Возвращает количество обновлённых записей.
+    """
+    ids = {pk for pk in equipment_accounting_ids if pk is not None}
+    if not ids:
+        return 0
+    existing_ids = set(
+        EquipmentAccounting.objects.filter(pk__in=ids).values_list("pk", flat=True)
+    )
+    if not existing_ids:
+        return 0
+
+    # Текущая установка — активная с самой поздней датой монтажа
+    active = {}
+    installs = (
+        EquipmentAccDepartment.objects.filter(
+            equipment_accounting_id__in=existing_ids, is_active=True
+        )
+        .order_by(F("install_dt").desc(nulls_last=True), "-create_dt")
+        .values_list("equipment_accounting_id", "department_id", "engineer_id", "install_dt")
+    )
+    for equipment_accounting_id, *install in installs:
+        active.setdefault(equipment_accounting_id, install)
+
+    last_maintenance = {}
+    maintenance_type_id = get_maintenance_type_id()
+    if maintenance_type_id:
+        last_maintenance = dict(
+            Service.objects.filter(
+                equipment_accounting_id__in=existing_ids,
+                service_type_id=maintenance_type_id,
+                end_dt__isnull=False,
+            )
+            .values("equipment_accounting_id")
+            .annotate(last_dt=Max("end_dt"))
+            .values_list("equipment_accounting_id", "last_dt")
+        )
+
+    locations = []
+    for pk in existing_ids:
+        department_id, engineer_id, install_dt = active.get(pk, (None, None, None))
+        locations.append(
+            EquipmentCurrentLocation(
+                equipment_accounting_id=pk,
+                department_id=department_id,
+                engineer_id=engineer_id,
+                install_dt=install_dt,
+                last_maintenance_dt=last_maintenance.get(pk),
+            )
+        )
+    EquipmentCurrentLocation.objects.bulk_create(
+        locations,
+        update_conflicts=True,
+        unique_fields=["equipment_accounting"],
+        update_fields=_LOCATION_FIELDS,
+    )
+    return len(locations)
+
+
+def rebuild_current_locations(batch_size=1000) -> int:
+    """Полностью пересобирает EquipmentCurrentLocation порциями."""
+    ids = list(EquipmentAccounting.objects.values_list("pk", flat=True))
+    total = 0
+    for start in range(0, len(ids), batch_size):
+        total += refresh_current_locations(ids[start:start + batch_size])
+    return total
+
+
+def equipment_accounting_label():
+    """Подпись единицы учёта, как в ``EquipmentAccounting.__str__``, — в SQL."""
+    return Concat(
+        "equipment__full_name",
+        Value(" ["),
+        Upper("serial_number"),
+        Value("]"),
+        output_field=CharField(),
+    )
+
+
+def equipment_accounting_choices(
+    term="", search="", city=None, department=None, med_direction=None
+):
+    """Единицы учёта для выбора в форме ремонта: ``values(id, label)``.
+
+    Подпись собирается в запросе, объекты моделей не создаются. Отбор —
+    по тем же признакам, что в формах и фильтрах админки:
+
+    :param term: набранный текст — название оборудования или серийный номер
+    :param search: значение поля «Поиск оборудования» формы ремонта
+    :param city: название города текущей установки (без учёта регистра)
+    :param department: ID подразделения текущей установки
+    :param med_direction: название направления оборудования
+    """
+    queryset = EquipmentAccounting.objects.all()
+    for text in (term, search):
+        text = (text or "").strip()
+        if text:
+            # icontains идёт по GIN-индексам pg_trgm (ebase 0017_search_documents)
+            queryset = queryset.filter(
+                Q(equipment__full_name__icontains=text)
+                | Q(equipment__short_name__icontains=text)
+                | Q(serial_number__icontains=text)
+            )
+    if city:
+        queryset = queryset.filter(current_location__department__city__name__iexact=city)
+    if department:
+        queryset = queryset.filter(current_location__department_id=department)
+    if med_direction:
+        queryset = queryset.filter(equipment__med_direction__name=med_direction)
+    return (
+        queryset.annotate(label=equipment_accounting_label())
+        .order_by("label", "pk")
+        .values("id", "label")
+    )
+
+
+def get_service_part_count(spare_part_count_info: Optional[list], part: dict) -> int:
+    """Получаем количество запчестей используемых в ремонте
+    для определенного срока годности"""
+    if spare_part_count_info:
+        for info in spare_part_count_info:
+            ext_dt = datetime.date(datetime.strptime(info["expiration_dt"], "%Y-%m-%d")) \
+                if info["expiration_dt"] else None
+            if ext_dt == part["expiration_dt"]:
+                return info["service_part_count"]
+    return 0
+
+
+def spare_parts_availability(spare_part_ids, service_id=None) -> dict:
+    """Остатки, цены и использованное в ремонте количество по партиям запчастей.
+
+    Для блока «Выбранные запчасти» формы ремонта (part_to_service_grok.js).
+    Четыре-пять запросов на любое число запчастей: запчасти, сгруппированные
+    остатки, JSON ремонта и цены FIFO. Возвращает
+    ``{ID запчасти: [партия, ...]}``; несуществующих запчастей в ответе нет.
+    """
+    parts = {
+        str(part.pk): part
+        for part in SparePart.objects.filter(pk__in=spare_part_ids).select_related("unit")
+    }
+    if not parts:
+        return {}
+
+    batches = {part_id: [] for part_id in parts}
+    rows = (
+        SparePartCount.objects.filter(spare_part_id__in=[part.pk for part in parts.values()])
+        .values("spare_part_id", "expiration_dt")
+        .annotate(total_amount=Sum("amount"))
+        .order_by("spare_part_id", "expiration_dt")
+    )
+    for row in rows:
+        batches[str(row["spare_part_id"])].append(row)
+
+    used = {}
+    if service_id:
+        used = (
+            Service.objects.filter(pk=service_id)
+            .values_list("spare_part_count", flat=True)
+            .first()
+        ) or {}
+
+    for part_id, part in parts.items():
+        if not batches[part_id]:  # заглушка на случай, если запчасть не ставили на приход
+            batches[part_id] = [
+                {"spare_part_id": part.pk, "total_amount": 0, "expiration_dt": None}
+            ]
+    prices = current_prices(
+        (row["spare_part_id"], row["expiration_dt"])
+        for part_rows in batches.values()
+        for row in part_rows
+    )
+
+    result = {}
+    for part_id, part in parts.items():
+        used_info = used.get(part_id)
+        name = f"{part.name}" + (f" (арт. {part.article})" if part.article else "")
+        result[part_id] = [
+            {
+                "name": name + (
+                    f' годен до: {row["expiration_dt"].strftime("%d.%m.%Y")}г.'
+                    if row["expiration_dt"] else ""
+                ),
+                "quantity": row["total_amount"] or 0,
+                "id": part_id,
+                "expiration_dt": row["expiration_dt"],
+                "service_part_count": get_service_part_count(used_info, row) if service_id else 0,
+                "price": float(prices[(part.pk, row["expiration_dt"])]),
+                "unit": part.unit.short_name if part.unit else "шт.",
+            }
+            for row in batches[part_id]
+        ]
+    return result
@@ -1,45 +1,193 @@
-from django.db.models.signals import pre_save, post_save
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, pre_delete, pre_save, post_save, post_delete
 from django.dispatch import receiver
 
-from contracts.signals import recalc_contract
-from contracts.models import Contract
-from .models import Service
+from contracts.services import contract_ref, schedule_contract_recalc
+from directory.models import ServiceType
+from spare_part.models import SparePartAccessories
+from utils.labels import label_scheduler, refresh_labels
+from utils.search import refresh_search_documents
+from .models import (
+    Equipment,
+    EquipmentAccDepartment,
+    EquipmentAccounting,
+    ReplacementEquipment,
+    Service,
+)
+from .services import refresh_current_locations
 
 
 @receiver(pre_save, sender=Service)
 def service_pre_save(sender, instance, **kwargs):
     """Запоминаем старый contract_id для пересчёта старого контракта."""
+    instance._old_contract_id = None
+    instance._old_equipment_accounting_id = None
     if instance.pk:
         try:
             old = Service.objects.get(pk=instance.pk)
             instance._old_contract_id = old.contract_id
+            instance._old_equipment_accounting_id = old.equipment_accounting_id
         except Service.DoesNotExist:
-            instance._old_contract_id = None
-    else:
-        instance._old_contract_id = None
+            pass
 
 
 def get_fifo_price(spare_part, expiration_dt=None):
-    """Возвращает закупочную цену по FIFO для запчасти."""
-    from spare_part.models import SparePartSupplyItem
-    qs = SparePartSupplyItem.objects.filter(spare_part=spare_part)
-    if expiration_dt is not None:
-        qs = qs.filter(expiration_dt=expiration_dt)
-    qs = qs.order_by("supply__supply_dt", "expiration_dt")
-    first = qs.first()
-    return first.price if first else 0
+    """Возвращает закупочную цену по FIFO для запчасти (первый несписанный слой)."""
+    from spare_part.fifo import current_price
+    return current_price(getattr(spare_part, "pk", spare_part), expiration_dt)
 
 
 @receiver(post_save, sender=Service)
 def service_post_save(sender, instance, created, **kwargs):
-    """Пересчитываем связанный контракт при изменении ремонта."""
-    if instance.contract:
-        recalc_contract(instance.contract)
+    """Пересчитываем связанный контракт и дату последнего ТО при изменении ремонта."""
+    refresh_current_locations(
+        [instance.equipment_accounting_id, instance._old_equipment_accounting_id]
+    )
 
     old_contract_id = getattr(instance, "_old_contract_id", None)
-    if old_contract_id and old_contract_id != instance.contract_id:
-        try:
-            old_contract = Contract.objects.get(pk=old_contract_id)
-            recalc_contract(old_contract)
-        except Contract.DoesNotExist:
-            pass
+    if old_contract_id == instance.contract_id:
+        old_contract_id = None
+    schedule_contract_recalc(contract_ref(instance), old_contract_id)
+
+
+def _is_equipment_accounting_deletion(origin):
+    """Удаление идёт каскадом от самой единицы учёта: её запись о месте
+    установки удаляется вместе с ней, пересчитывать нечего."""
+    if isinstance(origin, QuerySet):
+        return origin.model is EquipmentAccounting
+    return isinstance(origin, EquipmentAccounting)
+
+
+@receiver(post_delete, sender=Service)
+def service_post_delete(sender, instance, origin=None, **kwargs):
+    if not _is_equipment_accounting_deletion(origin):
+        refresh_current_locations([instance.equipment_accounting_id])
+
+
+@receiver(post_save, sender=EquipmentAccounting)
+def equipment_accounting_post_save(sender, instance, created, **kwargs):
+    """Каждая единица учёта сразу получает запись о текущем месте установки."""
+    if created:
+        refresh_current_locations([instance.pk])
+
+
+@receiver(pre_save, sender=EquipmentAccDepartment)
+def equipment_acc_department_pre_save(sender, instance, **kwargs):
+    """Запоминаем прежнюю единицу учёта, если установку перенесли на другую."""
+    instance._old_equipment_accounting_id = None
+    if instance.pk:
+        instance._old_equipment_accounting_id = (
+            EquipmentAccDepartment.objects.filter(pk=instance.pk)
+            .values_list("equipment_accounting_id", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=EquipmentAccDepartment)
+def equipment_acc_department_post_save(sender, instance, **kwargs):
+    refresh_current_locations(
+        [instance.equipment_accounting_id, instance._old_equipment_accounting_id]
+    )
+
+
+@receiver(post_delete, sender=EquipmentAccDepartment)
+def equipment_acc_department_post_delete(sender, instance, origin=None, **kwargs):
+    if not _is_equipment_accounting_deletion(origin):
+        refresh_current_locations([instance.equipment_accounting_id])
+
+
+@receiver(post_save, sender=Service)
+def service_search_document(sender, instance, **kwargs):
+    refresh_search_documents(Service.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=EquipmentAccounting)
+def equipment_accounting_search_document(sender, instance, **kwargs):
+    """Серийный номер и оборудование входят и в документы ремонтов."""
+    refresh_search_documents(EquipmentAccounting.objects.filter(pk=instance.pk))
+    refresh_search_documents(Service.objects.filter(equipment_accounting=instance))
+
+
+@receiver(post_save, sender=Equipment)
+def equipment_search_document(sender, instance, created, **kwargs):
+    """Наименование оборудования входит в документы учёта и ремонтов."""
+    if not created:
+        refresh_search_documents(EquipmentAccounting.objects.filter(equipment=instance))
+        refresh_search_documents(
+            Service.objects.filter(equipment_accounting__equipment=instance)
+        )
+
+
+# Подписи (label) ремонтов и подменного оборудования собираются в save();
+# здесь — пересборка при изменении записей, из которых они состоят.
+replacement_equipment_labels = label_scheduler(ReplacementEquipment)
+
+
+@receiver(post_save, sender=EquipmentAccounting)
+def equipment_accounting_labels(sender, instance, created, **kwargs):
+    if not created:
+        refresh_labels(Service.objects.filter(equipment_accounting=instance))
+
+
+@receiver(post_save, sender=Equipment)
+def equipment_labels(sender, instance, created, **kwargs):
+    if not created:
+        refresh_labels(Service.objects.filter(equipment_accounting__equipment=instance))
+        refresh_labels(ReplacementEquipment.objects.filter(equipment=instance))
+
+
+@receiver(post_save, sender=ServiceType)
+def service_type_labels(sender, instance, created, **kwargs):
+    if not created:
+        refresh_labels(Service.objects.filter(service_type=instance))
+
+
+@receiver(pre_delete, sender=ServiceType)
+def service_type_pre_delete(sender, instance, **kwargs):
+    """Ремонты с этим видом работ: после удаления ссылка на него обнулится."""
+    instance._label_service_ids = list(
+        Service.objects.filter(service_type=instance).values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=ServiceType)
+def service_type_post_delete(sender, instance, **kwargs):
+    refresh_labels(Service.objects.filter(pk__in=instance._label_service_ids))
+
+
+@receiver(m2m_changed, sender=ReplacementEquipment.accessories.through)
+def replacement_equipment_accessories_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            replacement_equipment_labels.schedule(instance.pk)
+        return
+    # Изменение со стороны комплектующего: pk_set — ID подменных приборов
+    if action == "pre_clear":
+        instance._label_replacement_ids = list(
+            instance.replacement_equipment_accessories.values_list("pk", flat=True)
+        )
+    elif action == "post_clear":
+        replacement_equipment_labels.schedule(*instance._label_replacement_ids)
+    elif action in ("post_add", "post_remove"):
+        replacement_equipment_labels.schedule(*pk_set)
+
+
+@receiver(post_save, sender=SparePartAccessories)
+def spare_part_accessories_labels(sender, instance, created, **kwargs):
+    if not created:
+        refresh_labels(ReplacementEquipment.objects.filter(accessories=instance))
+
+
+@receiver(pre_delete, sender=SparePartAccessories)
+def spare_part_accessories_pre_delete(sender, instance, **kwargs):
+    """Связи с подменными приборами удаляются каскадом без m2m_changed."""
+    instance._label_replacement_ids = list(
+        instance.replacement_equipment_accessories.values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=SparePartAccessories)
+def spare_part_accessories_post_delete(sender, instance, **kwargs):
+    replacement_equipment_labels.schedule(*instance._label_replacement_ids)
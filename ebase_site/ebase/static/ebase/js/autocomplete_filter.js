@@ -0,0 +1,20 @@
+/**
+ * Фильтр списка с поиском (utils.list_filters.AutocompleteListFilter).
+ *
+ * Варианты подгружает select2 через autocomplete админки; при выборе
+ * значения (или его сбросе) открывается список с новым параметром фильтра,
+ * остальные параметры сохраняются.
+ */
+(function ($) {
+    "use strict";
+
+    $(document).on("change", "select.autocomplete-filter", function () {
+        var query = this.dataset.queryString || "?";
+        var value = $(this).val();
+        if (value) {
+            query += (query.length > 1 ? "&" : "")
+                + encodeURIComponent(this.dataset.parameterName) + "=" + encodeURIComponent(value);
+        }
+        window.location.search = query;
+    });
+})(django.jQuery);
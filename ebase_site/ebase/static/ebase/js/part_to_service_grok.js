@@ -106,12 +106,17 @@ class SparePartsManager {
         const selectedOptions = this.sparePartSelect.querySelectorAll('option');
         console.log(`Found ${selectedOptions.length} options in select`);
 
+        // Данные по всем выбранным запчастям — одним запросом
+        const ids = Array.from(selectedOptions)
+            .map(option => option.value)
+            .filter(value => value && value.trim() !== '');
+        const dataById = await this.getSparePartsData(ids);
+
         for (let option of selectedOptions) {
             if (option.value && option.value.trim() !== '') {
                 console.log(`Loading data for spare part: ${option.value}`);
 
-                // Получаем данные о запчасти с сервера
-                let results = await this.getSparePartData(option.value);
+                let results = dataById[option.value] || [];
                 if (results.length === 0) {
                     // Fallback если нет данных
                     results = [{
@@ -250,14 +255,20 @@ class SparePartsManager {
 
         console.log(`Found ${selectedOptions.length} options in select`);
 
+        // Новые запчасти (группа не загружена) — одним запросом
+        const newIds = Array.from(selectedOptions)
+            .map(option => option.value)
+            .filter(value => value && value.trim() !== '' && !this.sparePartGroups.has(value));
+        const dataById = newIds.length > 0 ? await this.getSparePartsData(newIds) : {};
+
         for (let option of selectedOptions) {
             if (option.value && option.value.trim() !== '') {
                 currentIds.add(option.value);
 
-                // Если это новая запчасть (группа не загружена), получаем её данные
+                // Если это новая запчасть (группа не загружена), берём её данные из ответа
                 if (!this.sparePartGroups.has(option.value)) {
                     console.log(`Loading new spare part: ${option.value}`);
-                    let results = await this.getSparePartData(option.value);
+                    let results = dataById[option.value] || [];
                     if (results.length === 0) {
                         // Fallback
                         results = [{
@@ -482,12 +493,20 @@ class SparePartsManager {
         return Math.round(value * 100) / 100;
     }
 
-    async getSparePartData(sparePartId) {
-        console.log(`Fetching data for spare part: ${sparePartId}`);
+    /**
+     * Остатки, цены и количество в ремонте сразу для нескольких запчастей.
+     * Возвращает объект {sparePartId: [партии]}.
+     */
+    async getSparePartsData(sparePartIds) {
+        if (sparePartIds.length === 0) return {};
+        console.log(`Fetching data for spare parts: ${sparePartIds.join(', ')}`);
         try {
             const currentPath = window.location.pathname;  // остается тольк путь без get параметров
             const serviceId = currentPath.match(/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}/i);
-            const response = await fetch(`/admin/get-spare-part-quantity/${serviceId}/${sparePartId}/`, {
+            const params = new URLSearchParams();
+            sparePartIds.forEach(id => params.append('id', id));
+            if (serviceId) params.append('service_id', serviceId[0]);
+            const response = await fetch(`/admin/get-spare-parts-quantity/?${params.toString()}`, {
                 method: 'GET',
                 headers: {
                     'X-CSRFToken': this.getCSRFToken(),
@@ -498,15 +517,15 @@ class SparePartsManager {
             if (response.ok) {
                 const data = await response.json();
                 console.log(`Received data:`, data);
-                return data.results || [];
+                return data.results || {};
             } else {
-                console.error(`Failed to fetch data for ${sparePartId}: ${response.status}`);
+                console.error(`Failed to fetch data for ${sparePartIds.length} spare parts: ${response.status}`);
             }
         } catch (error) {
-            console.error('Error fetching spare part sparePartId:', error);
+            console.error('Error fetching spare parts data:', error);
         }
 
-        return [];
+        return {};
     }
 
     async handleFormSubmit(e) {
@@ -1,4 +1,5 @@
 from django import template
+from directory.cache import directory_cache
 from directory.models import MedDirection, City
 
 
@@ -7,10 +8,10 @@ register = template.Library()
 
 @register.simple_tag()
 def get_med_direction():
-    return MedDirection.objects.values('name', 'slug_name').distinct()\
-            .order_by('name')
+    directions = {(d.name, d.slug_name) for d in directory_cache.all(MedDirection)}
+    return [{'name': name, 'slug_name': slug} for name, slug in sorted(directions)]
 
 
 @register.simple_tag()
 def get_cities():
-    return City.objects.values_list('name', flat=True).distinct().order_by('name')
+    return sorted({city.name for city in directory_cache.all(City)})
@@ -1,12 +1,38 @@
+import json
+from datetime import date
 from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib import admin
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 
 from clients.models import Client, Department
-from directory.models import City, ServiceType
+from directory.cache import directory_cache
+from directory.models import City, Engineer, MedDirection, ServiceType, Unit
 from contracts.models import Contract
-from ebase.models import Equipment, EquipmentAccounting, Service
+from contracts.services import schedule_contract_recalc
+from ebase.models import (
+    Equipment,
+    EquipmentAccDepartment,
+    EquipmentAccounting,
+    EquipmentCurrentLocation,
+    ReplacementEquipment,
+    Service,
+)
+from ebase.services import MAINTENANCE_SERVICE_TYPE, spare_parts_availability
+from spare_part.models import (
+    SparePart,
+    SparePartAccessories,
+    SparePartSupplyItem,
+    SparePartSupplyV2,
+)
+from utils.deferred import deferred_batch
+from utils.keyset import KeysetPaginator
 
 
 User = get_user_model()
@@ -96,3 +122,563 @@ class ServiceContractTests(TestCase):
         self.contract.refresh_from_db()
         self.assertEqual(self.contract.expenses_amount, Decimal("50.00"))
 
+
+
+class ServiceShipmentContractTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="pass")
+        city, _ = City.objects.get_or_create(name="Москва", region=None)
+        self.service_type = ServiceType.objects.create(name="Ремонт")
+        self.client_obj = Client.objects.create(name="Клиент", city=city, inn="123456789001")
+        department = Department.objects.create(name="Главный офис", client=self.client_obj, city=city)
+        equipment = Equipment.objects.create(full_name="Анализатор", short_name="Анализатор")
+        self.eq_acc = EquipmentAccounting.objects.create(
+            equipment=equipment, serial_number="SN001", user=self.user
+        )
+        EquipmentAccDepartment.objects.create(equipment_accounting=self.eq_acc, department=department)
+        self.contract = Contract.objects.create(
+            client=self.client_obj,
+            contract_number="CNT-SRV-001",
+            conclusion_date="2026-01-15",
+            contract_amount=50000,
+        )
+
+    def test_admin_save_recalculates_new_contract(self):
+        """Строки отгрузки из формы ремонта попадают в расходы нового контракта."""
+        unit = Unit.objects.create(short_name="шт.", full_name="штука")
+        part = SparePart.objects.create(name="Лампа", unit=unit)
+        supply = SparePartSupplyV2.objects.create(
+            doc_num="SUP-001", supply_dt="2026-01-10", user=self.user
+        )
+        SparePartSupplyItem.objects.create(supply=supply, spare_part=part, quantity=5, price=40)
+        other = Contract.objects.create(
+            client=self.client_obj,
+            contract_number="CNT-SRV-002",
+            conclusion_date="2026-01-20",
+            contract_amount=10000,
+        )
+        service = Service.objects.create(
+            service_type=self.service_type,
+            equipment_accounting=self.eq_acc,
+            user=self.user,
+            beg_dt=date(2026, 2, 1),
+            contract=self.contract,
+        )
+        model_admin = admin.site._registry[Service]
+
+        def save(quantity):
+            line = {"id": str(part.pk), "quantity": quantity, "expiration_dt": ""}
+            request = RequestFactory().post("/", {"spare_part_quantities[0]": json.dumps(line)})
+            request.user = self.user
+            model_admin.save_model(request, service, mock.Mock(cleaned_data={}), True)
+
+        save(1)
+        self.contract.refresh_from_db()
+        self.assertEqual(self.contract.expenses_amount, Decimal("40"))
+
+        service.contract = other
+        with mock.patch(
+            "spare_part.services.schedule_contract_recalc", wraps=schedule_contract_recalc
+        ) as recalc:
+            save(2)
+        # Строки записываются уже в отгрузку нового контракта
+        recalc.assert_called_once_with(other.pk)
+        self.contract.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.contract.expenses_amount, Decimal("0"))
+        self.assertEqual(other.expenses_amount, Decimal("80"))
+
+
+class EquipmentCurrentLocationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="admin", password="pass")
+        self.city, _ = City.objects.get_or_create(name="Москва", region=None)
+        client = Client.objects.create(name="Клиент", city=self.city, inn="123456789001")
+        self.dept_old = Department.objects.create(name="Старое отделение", client=client)
+        self.dept_new = Department.objects.create(name="Новое отделение", client=client)
+        self.engineer = Engineer.objects.create(name="Иванов")
+        self.maintenance = ServiceType.objects.create(name=MAINTENANCE_SERVICE_TYPE)
+        equipment = Equipment.objects.create(full_name="Анализатор", short_name="Анализатор")
+        self.eq_acc = EquipmentAccounting.objects.create(
+            equipment=equipment, serial_number="SN001", user=self.user
+        )
+
+    def _location(self):
+        return EquipmentCurrentLocation.objects.get(equipment_accounting=self.eq_acc)
+
+    def _install(self, department, install_dt, is_active=True):
+        return EquipmentAccDepartment.objects.create(
+            equipment_accounting=self.eq_acc,
+            department=department,
+            engineer=self.engineer,
+            install_dt=install_dt,
+            is_active=is_active,
+        )
+
+    def test_location_created_with_equipment_accounting(self):
+        location = self._location()
+        self.assertIsNone(location.department)
+        self.assertIsNone(location.install_dt)
+
+    def test_latest_active_install_is_current(self):
+        """Текущей считается активная установка с самой поздней датой монтажа."""
+        self._install(self.dept_old, date(2024, 1, 10))
+        new_install = self._install(self.dept_new, date(2025, 3, 1))
+        self._install(self.dept_old, date(2026, 1, 1), is_active=False)
+
+        location = self._location()
+        self.assertEqual(location.department, self.dept_new)
+        self.assertEqual(location.engineer, self.engineer)
+        self.assertEqual(location.install_dt, date(2025, 3, 1))
+
+        new_install.is_active = False
+        new_install.save()
+        self.assertEqual(self._location().department, self.dept_old)
+
+        EquipmentAccDepartment.objects.filter(department=self.dept_old).delete()
+        self.assertEqual(self._location().department, None)
+
+    def test_last_maintenance_date_follows_services(self):
+        service = Service.objects.create(
+            service_type=self.maintenance,
+            equipment_accounting=self.eq_acc,
+            user=self.user,
+            beg_dt=date(2026, 2, 1),
+            end_dt=date(2026, 2, 3),
+        )
+        self.assertEqual(self._location().last_maintenance_dt, date(2026, 2, 3))
+
+        service.delete()
+        self.assertIsNone(self._location().last_maintenance_dt)
+
+    def test_rebuild_command_restores_locations(self):
+        self._install(self.dept_new, date(2025, 3, 1))
+        EquipmentCurrentLocation.objects.all().delete()
+
+        call_command("rebuild_current_locations", stdout=open("/dev/null", "w"))
+
+        self.assertEqual(self._location().department, self.dept_new)
+
+    def test_equipment_accounting_delete_cascades(self):
+        self._install(self.dept_new, date(2025, 3, 1))
+        self.eq_acc.delete()
+        self.assertFalse(EquipmentCurrentLocation.objects.exists())
+
+    def test_changelist_reads_current_location(self):
+        self._install(self.dept_new, date(2025, 3, 1))
+        self.client.force_login(self.user)
+
+        response = self.client.get(
+            "/admin/ebase/equipmentaccounting/", {"install_dt": "notnulldt", "q": "Новое"}
+        )
+
+        self.assertContains(response, "Новое отделение")
+        self.assertContains(response, "01.03.2025 г.")
+
+
+class SparePartsAvailabilityTests(TestCase):
+    def setUp(self):
+        from directory.models import Unit
+        from spare_part.models import SparePart, SparePartSupplyItem, SparePartSupplyV2
+
+        self.user = User.objects.create_superuser(username="admin", password="pass")
+        unit = Unit.objects.create(short_name="шт.", full_name="штука")
+        self.parts = [
+            SparePart.objects.create(name=f"Датчик {i}", article=f"D-{i}", unit=unit)
+            for i in range(3)
+        ]
+        supply = SparePartSupplyV2.objects.create(
+            doc_num="SUP-1", supply_dt="2026-01-10", user=self.user
+        )
+        for part in self.parts:
+            for exp_dt, price in (("2027-01-01", 100), (None, 150)):
+                SparePartSupplyItem.objects.create(
+                    supply=supply, spare_part=part, quantity=4, price=price,
+                    expiration_dt=exp_dt,
+                )
+        equipment = Equipment.objects.create(full_name="Анализатор", short_name="Анализатор")
+        eq_acc = EquipmentAccounting.objects.create(
+            equipment=equipment, serial_number="SN1", user=self.user
+        )
+        self.service = Service.objects.create(
+            service_type=ServiceType.objects.create(name="Ремонт"),
+            equipment_accounting=eq_acc,
+            user=self.user,
+            beg_dt="2026-02-01",
+            spare_part_count={
+                str(self.parts[0].pk): [
+                    {"expiration_dt": "2027-01-01", "service_part_count": 2}
+                ]
+            },
+        )
+
+    def test_batches_for_all_parts_in_fixed_queries(self):
+        ids = [part.pk for part in self.parts]
+        with self.assertNumQueries(4):
+            data = spare_parts_availability(ids, self.service.pk)
+        self.assertEqual(set(data), {str(pk) for pk in ids})
+        batches = {row["expiration_dt"]: row for row in data[str(self.parts[0].pk)]}
+        self.assertEqual(batches[date(2027, 1, 1)]["quantity"], 4)
+        self.assertEqual(batches[date(2027, 1, 1)]["service_part_count"], 2)
+        self.assertEqual(batches[date(2027, 1, 1)]["price"], 100.0)
+        self.assertEqual(batches[None]["price"], 150.0)
+        self.assertEqual(batches[None]["service_part_count"], 0)
+
+    def test_batch_endpoint(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            "/admin/get-spare-parts-quantity/",
+            {"id": [str(self.parts[1].pk), "not-a-uuid"], "service_id": str(self.service.pk)},
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(list(results), [str(self.parts[1].pk)])
+        self.assertEqual(len(results[str(self.parts[1].pk)]), 2)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="admin", password="pass")
+        self.client.force_login(self.user)
+        service_type = ServiceType.objects.create(name="Ремонт")
+        equipment = Equipment.objects.create(full_name="Анализатор", short_name="Анализатор")
+        eq_accs = [
+            EquipmentAccounting.objects.create(
+                equipment=equipment, serial_number=f"SN{n}", user=self.user
+            )
+            for n in range(3)
+        ]
+        # Повторяющиеся даты: порядок внутри даты задают следующие колонки
+        for n in range(45):
+            Service.objects.create(
+                service_type=service_type,
+                equipment_accounting=eq_accs[n % 3],
+                user=self.user,
+                beg_dt=date(2026, 1 + n % 2, 1 + n // 6),
+            )
+
+    def _walk(self, params=None):
+        pages, query = [], "?" + "&".join(f"{k}={v}" for k, v in (params or {}).items())
+        while query:
+            cl = self.client.get("/admin/ebase/service/" + query).context["cl"]
+            pages.append([obj.pk for obj in cl.result_list])
+            page = cl.paginator.current_page
+            query = cl.paginator.next_query if page.has_next() else None
+        return pages, cl
+
+    def test_pages_follow_changelist_ordering(self):
+        pages, cl = self._walk()
+
+        expected = list(
+            Service.objects.order_by("-beg_dt", "equipment_accounting", "-pk")
+            .values_list("pk", flat=True)
+        )
+        self.assertTrue(cl.paginator.keyset)
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(cl.result_count, 45)
+
+    def test_previous_page_returns_same_rows(self):
+        first = self.client.get("/admin/ebase/service/").context["cl"]
+        first_pks = [obj.pk for obj in first.result_list]
+        second = self.client.get(
+            "/admin/ebase/service/" + first.paginator.next_query
+        ).context["cl"]
+
+        back = self.client.get(
+            "/admin/ebase/service/" + second.paginator.previous_query
+        ).context["cl"]
+
+        self.assertEqual([obj.pk for obj in back.result_list], first_pks)
+        self.assertFalse(back.paginator.current_page.has_previous())
+
+    def test_date_hierarchy_filter_is_kept(self):
+        pages, cl = self._walk({"beg_dt__year": 2026, "beg_dt__month": 2})
+
+        self.assertEqual(sum(map(len, pages)), 22)
+        self.assertEqual(
+            Service.objects.filter(pk__in=sum(pages, []), beg_dt__month=2).count(), 22
+        )
+
+    def test_rows_without_value_are_paged(self):
+        """Строки с NULL в колонке сортировки не теряются и не повторяются."""
+        city, _ = City.objects.get_or_create(name="Москва", region=None)
+        client = Client.objects.create(name="Клиент", city=city, inn="123456789001")
+        department = Department.objects.create(name="Отделение", client=client)
+        for n, eq_acc in enumerate(EquipmentAccounting.objects.order_by("serial_number")[:2]):
+            EquipmentAccDepartment.objects.create(
+                equipment_accounting=eq_acc, department=department, install_dt=date(2025, 1, 1 + n)
+            )
+        queryset = EquipmentAccounting.objects.order_by(
+            "-current_location__install_dt", "serial_number"
+        )
+        rows, query = [], "?"
+        while query:
+            paginator = KeysetPaginator(queryset, 1, request=RequestFactory().get(query))
+            page = paginator.page(1)
+            rows += [obj.serial_number for obj in page]
+            query = paginator.next_query if page.has_next() else None
+
+        expected = list(queryset.values_list("serial_number", flat=True))
+        self.assertEqual(rows, expected)
+        self.assertEqual(len(expected), 3)
+
+    def test_numbered_page_uses_offset(self):
+        """Autocomplete админки листает номером страницы, а не курсором."""
+        queryset = Service.objects.order_by("-beg_dt", "pk")
+        request = RequestFactory().get("/", {"page": 2})
+        paginator = KeysetPaginator(queryset, 20, request=request)
+
+        page = paginator.page("2")
+
+        self.assertEqual([obj.pk for obj in page], [obj.pk for obj in queryset[20:40]])
+
+    def test_broken_cursor_is_rejected(self):
+        response = self.client.get("/admin/ebase/service/", {"p": "n!!!"})
+
+        self.assertRedirects(response, "/admin/ebase/service/?e=1", fetch_redirect_response=False)
+
+
+class EquipmentAccountingAutocompleteTests(TestCase):
+    url = "/admin/equipment-accounting/autocomplete/"
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="admin", password="pass")
+        self.client.force_login(self.user)
+        direction = MedDirection.objects.create(name="Лаборатория")
+        self.analyzer = Equipment.objects.create(
+            full_name="Анализатор", short_name="АН", med_direction=direction
+        )
+        centrifuge = Equipment.objects.create(full_name="Центрифуга", short_name="ЦФ")
+        city, _ = City.objects.get_or_create(name="Москва", region=None)
+        client = Client.objects.create(name="Клиент", city=city, inn="123456789001")
+        self.department = Department.objects.create(name="Отделение", client=client, city=city)
+        self.installed = EquipmentAccounting.objects.create(
+            equipment=self.analyzer, serial_number="sn-001", user=self.user
+        )
+        EquipmentAccDepartment.objects.create(
+            equipment_accounting=self.installed,
+            department=self.department,
+            install_dt=date(2025, 1, 1),
+        )
+        for n in range(2, 26):
+            EquipmentAccounting.objects.create(
+                equipment=self.analyzer, serial_number=f"SN-{n:03}", user=self.user
+            )
+        EquipmentAccounting.objects.create(
+            equipment=centrifuge, serial_number="CF-1", user=self.user
+        )
+
+    def _get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_results_are_paged_with_precomputed_labels(self):
+        first = self._get(term="Анализ")
+        second = self._get(term="Анализ", page=2)
+
+        self.assertEqual(len(first["results"]), 20)
+        self.assertTrue(first["pagination"]["more"])
+        self.assertEqual(len(second["results"]), 5)
+        self.assertFalse(second["pagination"]["more"])
+        self.assertEqual(
+            first["results"][0], {"id": str(self.installed.pk), "text": "Анализатор [SN-001]"}
+        )
+        self.assertEqual(first["results"][0]["text"], str(self.installed))
+
+    def test_filters_match_admin_params(self):
+        self.assertEqual(len(self._get(city="Москва")["results"]), 1)
+        self.assertEqual(len(self._get(department=str(self.department.pk))["results"]), 1)
+        self.assertEqual(self._get(med_direction="Лаборатория")["pagination"]["more"], True)
+        self.assertEqual(
+            [row["text"] for row in self._get(term="cf")["results"]], ["Центрифуга [CF-1]"]
+        )
+        self.assertEqual(self._get(department="not-a-uuid")["results"], [])
+
+    def test_add_form_does_not_load_the_fleet(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/ebase/service/add/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "SN-002")
+        self.assertContains(response, self.url)
+        self.assertFalse(
+            [
+                query
+                for query in queries.captured_queries
+                if 'FROM "medsil"."equipment_accounting"' in query["sql"]
+            ]
+        )
+
+    def test_requires_view_permission(self):
+        staff = User.objects.create_user(username="staff", password="pass", is_staff=True)
+        self.client.force_login(staff)
+
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class DisplayLabelTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="pass")
+        self.equipment = Equipment.objects.create(full_name="Анализатор", short_name="АН")
+        self.eq_acc = EquipmentAccounting.objects.create(
+            equipment=self.equipment, serial_number="sn-001", user=self.user
+        )
+        self.service_type = ServiceType.objects.create(name="Ремонт")
+        self.service = Service.objects.create(
+            equipment_accounting=self.eq_acc, service_type=self.service_type, user=self.user
+        )
+        self.replacement = ReplacementEquipment.objects.create(
+            equipment=self.equipment, serial_number="R-1", user=self.user
+        )
+        self.cable = SparePartAccessories.objects.create(name="Кабель")
+
+    def _label(self, obj):
+        return type(obj).objects.values_list("label", flat=True).get(pk=obj.pk)
+
+    def test_str_uses_stored_label_without_queries(self):
+        self.assertEqual(self._label(self.service), "Анализатор [SN-001] - Ремонт")
+        services = list(Service.objects.all())
+        with self.assertNumQueries(0):
+            self.assertEqual([str(obj) for obj in services], ["Анализатор [SN-001] - Ремонт"])
+
+    def test_related_changes_refresh_labels(self):
+        self.equipment.full_name = "Анализатор крови"
+        self.equipment.short_name = "АК"
+        self.equipment.save()
+        self.eq_acc.serial_number = "sn-002"
+        self.eq_acc.save()
+        self.service_type.name = "Диагностика"
+        self.service_type.save()
+
+        self.assertEqual(self._label(self.service), "Анализатор крови [SN-002] - Диагностика")
+        self.assertEqual(self._label(self.replacement), "АК [R-1]")
+
+        self.service_type.delete()
+        self.assertEqual(self._label(self.service), "Анализатор крови [SN-002] - None")
+
+    def test_accessories_are_relabelled_once_per_batch(self):
+        bag = SparePartAccessories.objects.create(name="Сумка")
+        with self.captureOnCommitCallbacks(execute=True), deferred_batch():
+            self.replacement.accessories.add(self.cable)
+            self.replacement.accessories.add(bag)
+            self.assertEqual(self._label(self.replacement), "АН [R-1]")
+        self.assertEqual(
+            self._label(self.replacement), "АН [R-1] с комплектующими: Кабель, Сумка"
+        )
+
+        self.cable.name = "Кабель питания"
+        self.cable.save()
+        bag.delete()
+        self.assertEqual(
+            self._label(self.replacement), "АН [R-1] с комплектующими: Кабель питания"
+        )
+        self.cable.replacement_equipment_accessories.clear()
+        self.assertEqual(self._label(self.replacement), "АН [R-1]")
+
+    def test_rebuild_labels_command(self):
+        Service.objects.update(label="")
+        ReplacementEquipment.objects.update(label="устарело")
+
+        call_command("rebuild_labels", stdout=StringIO())
+
+        self.assertEqual(self._label(self.service), "Анализатор [SN-001] - Ремонт")
+        self.assertEqual(self._label(self.replacement), "АН [R-1]")
+
+
+class ServiceListFilterTests(TestCase):
+    url = "/admin/ebase/service/"
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="admin", password="pass")
+        self.client.force_login(self.user)
+        city, _ = City.objects.get_or_create(name="Москва", region=None)
+        client = Client.objects.create(name="Клиент", city=city, inn="123456789001")
+        self.contracts = [
+            Contract.objects.create(
+                client=client,
+                contract_number=f"CNT-{n:03}",
+                conclusion_date="2026-01-15",
+                contract_amount=1000,
+            )
+            for n in range(30)
+        ]
+        equipment = Equipment.objects.create(full_name="Анализатор", short_name="АН")
+        eq_acc = EquipmentAccounting.objects.create(
+            equipment=equipment, serial_number="SN-1", user=self.user
+        )
+        self.with_contract = Service.objects.create(
+            equipment_accounting=eq_acc, contract=self.contracts[5], user=self.user
+        )
+        self.without_contract = Service.objects.create(
+            equipment_accounting=eq_acc, user=self.user
+        )
+
+    def _contract_queries(self, queries):
+        return [
+            query
+            for query in queries.captured_queries
+            if 'FROM "medsil"."contract"' in query["sql"]
+        ]
+
+    def test_changelist_does_not_load_contracts(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "autocomplete-filter")
+        self.assertContains(response, "admin/js/autocomplete.js")
+        self.assertNotContains(response, "CNT-029")
+        self.assertFalse(self._contract_queries(queries))
+
+    def test_selected_contract_filters_and_is_shown(self):
+        contract = self.contracts[5]
+        response = self.client.get(self.url, {"contract": str(contract.pk)})
+
+        self.assertEqual(list(response.context["cl"].result_list), [self.with_contract])
+        self.assertContains(response, f'<option value="{contract.pk}" selected>')
+
+        response = self.client.get(self.url, {"contract": "none"})
+        self.assertEqual(list(response.context["cl"].result_list), [self.without_contract])
+
+    def test_contracts_are_searched_through_admin_autocomplete(self):
+        response = self.client.get(
+            "/admin/autocomplete/",
+            {"app_label": "ebase", "model_name": "service", "field_name": "contract", "term": "CNT-02"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 10)
+
+
+
+class MedDirectionFilterTests(TestCase):
+    def setUp(self):
+        from ebase.admin_filters import MedDirectionFilter
+
+        self.filter_class = MedDirectionFilter
+        directory_cache.clear()
+        self.addCleanup(directory_cache.clear)
+        MedDirection.objects.all().delete()
+        self.lab = MedDirection.objects.create(name="Лаборатория", slug_name="lab")
+        self.ray = MedDirection.objects.create(name="Визуализация", slug_name="ray")
+
+    def lookups(self):
+        model_admin = admin.site._registry[EquipmentAccounting]
+        request = RequestFactory().get("/admin/ebase/equipmentaccounting/")
+        return self.filter_class(request, {}, EquipmentAccounting, model_admin).lookup_choices
+
+    def test_choices_come_from_directory_cache(self):
+        self.assertEqual(
+            self.lookups(), [(self.ray.pk, "Визуализация"), (self.lab.pk, "Лаборатория")]
+        )
+        with self.assertNumQueries(0):
+            self.lookups()
+
+        self.lab.name = "Лабораторная диагностика"
+        self.lab.save()
+        self.assertEqual(self.lookups()[1], (self.lab.pk, "Лабораторная диагностика"))
+        self.assertEqual(
+            directory_cache.stats()["directory.MedDirection"], {"hits": 1, "misses": 2}
+        )
@@ -8,11 +8,21 @@ urlpatterns = [
         views.get_spare_part_quantity,
         name="get_spare_part_quantity",
     ),
+    path(
+        "admin/get-spare-parts-quantity/",
+        views.get_spare_parts_quantity,
+        name="get_spare_parts_quantity",
+    ),
     path(
         "get_equipment_id_by_name/<str:equipment_full_name>/",
         views.get_equipment_id_by_name,
         name="get_equipment_id_by_name"
-    )
+    ),
+    path(
+        "admin/equipment-accounting/autocomplete/",
+        views.equipment_accounting_autocomplete,
+        name="equipment_accounting_autocomplete",
+    ),
     # path('admin/get-spare-part-quantity/<uuid:service_id>/<uuid:spare_part_id>/',
     #      views.get_spare_part_quantity,
     #      name="get_spare_part_quantity"),
@@ -1,10 +1,10 @@
 import logging
-from datetime import datetime
+import uuid
 
 from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, redirect
 from django.http import JsonResponse
-from django.db.models import Sum, QuerySet
+from django.db.models import QuerySet
 from django.views.decorators.csrf import csrf_exempt
 from django.urls import reverse_lazy
 from django.views.generic.base import RedirectView
@@ -28,19 +28,14 @@ class IndexRedirectView(RedirectView):
     url = 'admin/'
 
 
-from ebase.signals import get_fifo_price
+from .services import equipment_accounting_choices, spare_parts_availability
 
 
-def get_service_part_count(spare_part_count_info: Optional[list], part: dict) -> int:
-    """Получаем количество запчестей используемых в ремонте
-    для определенного срока годности"""
-    if spare_part_count_info:
-        for info in spare_part_count_info:
-            ext_dt = datetime.date(datetime.strptime(info["expiration_dt"], "%Y-%m-%d")) \
-                if info["expiration_dt"] else None
-            if ext_dt == part["expiration_dt"]:
-                return info["service_part_count"]
-    return 0
+def _uuid_or_none(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
 
 
 @staff_member_required
@@ -54,40 +49,38 @@ def get_spare_part_quantity(request, service_id,  spare_part_id):
     :param spare_part_id - UUID
     """
     try:
-        part = SparePart.objects.get(pk=spare_part_id)
-        part_count = SparePartCount.objects.annotate(total_amount=Sum('amount')) \
-            .filter(spare_part=part) \
-            .values('total_amount', 'expiration_dt') \
-            .order_by("expiration_dt")
-
-        if service_id != "null":
-            service = Service.objects.get(pk=service_id)
-            # информация о том склолько уже было использованна данной запчасти в ремонте
-            spare_part_count_info: list = service.spare_part_count.get(str(spare_part_id))
-
-        if not part_count:  # заглушка на случай, если запчасть не ставили на приход
-            part_count = [{"total_amount": 0, "expiration_dt": None}]
-
-        data = [
-            {
-                "name": f"{part.name}" + (f" (арт. {part.article})" if part.article else "") +
-                        (f' годен до: {obj.get("expiration_dt").strftime("%d.%m.%Y")}г.' if obj.get("expiration_dt") else ""),
-                "quantity": obj["total_amount"] if obj.get("total_amount") else 0,
-                "id": spare_part_id,
-                "expiration_dt": obj["expiration_dt"] if obj.get("expiration_dt") else None,
-                "service_part_count": get_service_part_count(spare_part_count_info, obj) if service_id != "null" else 0,
-                "price": float(get_fifo_price(part, obj.get("expiration_dt"))) if obj.get("expiration_dt") else float(get_fifo_price(part)),
-                "unit": part.unit.short_name if part.unit else "шт.",
-            } for obj in part_count
-        ]
-
-        return JsonResponse({"results": data})
+        part_id = str(uuid.UUID(spare_part_id))
+        data = spare_parts_availability(
+            [part_id], None if service_id == "null" else service_id
+        )
+        if part_id not in data:
+            raise SparePart.DoesNotExist("SparePart matching query does not exist.")
+        return JsonResponse({"results": data[part_id]})
     except Exception as e:
         return JsonResponse({
             "error": str(e)
         }, status=500)
 
 
+@staff_member_required
+def get_spare_parts_quantity(request):
+    """
+    API endpoint с остатками сразу для нескольких запчастей (part_to_service_grok.js).
+
+    GET-параметры: id — ID запчасти (повторяется), service_id — ID ремонта (необязательно).
+    Ответ: {"results": {ID запчасти: [партии как у get_spare_part_quantity]}}
+    """
+    ids = [pk for pk in map(_uuid_or_none, request.GET.getlist("id")) if pk]
+    service_id = _uuid_or_none(request.GET.get("service_id"))
+    if not ids:
+        return JsonResponse({"results": {}})
+    try:
+        return JsonResponse({"results": spare_parts_availability(ids, service_id)})
+    except Exception as e:
+        logger.exception("Spare parts availability failed")
+        return JsonResponse({"error": str(e)}, status=500)
+
+
 @staff_member_required
 def get_equipment_id_by_name(request, equipment_full_name: str):
     """Возвращаем id оборудование по его названию.
@@ -104,3 +97,46 @@ def get_equipment_id_by_name(request, equipment_full_name: str):
     except Equipment.DoesNotExist:
         return JsonResponse({"id": None})
 
+
+
+# Сколько вариантов отдаёт autocomplete оборудования за один запрос
+EQUIPMENT_AUTOCOMPLETE_PAGE_SIZE = 20
+
+
+@staff_member_required
+def equipment_accounting_autocomplete(request):
+    """
+    Autocomplete единиц учёта для поля «Оборудование» формы ремонта
+    (виджет EquipmentAccountingAutocomplete, select2 админки).
+
+    GET-параметры: term — набранный текст, page — страница (с 1),
+    search, city, department, med_direction — отбор, см.
+    equipment_accounting_choices. Ответ в формате autocomplete Django:
+    {"results": [{"id": ..., "text": ...}], "pagination": {"more": ...}}
+    """
+    if not request.user.has_perm("ebase.view_equipmentaccounting"):
+        return JsonResponse({"error": "Недостаточно прав"}, status=403)
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    department = request.GET.get("department")
+    if department and _uuid_or_none(department) is None:
+        return JsonResponse({"results": [], "pagination": {"more": False}})
+
+    size = EQUIPMENT_AUTOCOMPLETE_PAGE_SIZE
+    offset = (page - 1) * size
+    # Одна строка сверх страницы показывает, есть ли следующая, без COUNT
+    rows = list(
+        equipment_accounting_choices(
+            term=request.GET.get("term", ""),
+            search=request.GET.get("search", ""),
+            city=request.GET.get("city"),
+            department=department,
+            med_direction=request.GET.get("med_direction"),
+        )[offset:offset + size + 1]
+    )
+    return JsonResponse({
+        "results": [{"id": str(row["id"]), "text": row["label"]} for row in rows[:size]],
+        "pagination": {"more": len(rows) > size},
+    })
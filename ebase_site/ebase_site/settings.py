@@ -42,6 +42,8 @@ INSTALLED_APPS = [
     "spare_part.apps.SparePartConfig",
     "contracts.apps.ContractsConfig",
     "business_trip.apps.BusinessTripConfig",
+    "exports.apps.ExportsConfig",
+    "documents.apps.DocumentsConfig",
     "debug_toolbar",
     "django.contrib.admin",
     "django.contrib.auth",
@@ -49,6 +51,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "django_extensions",
     "django_cleanup",
 ]
@@ -153,6 +156,49 @@ MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = 'media/'
 
 
+# Файлы фоновых выгрузок в Excel (exports) хранятся вне MEDIA_ROOT: веб-сервер
+# их не раздаёт, скачать файл можно только через админку.
+EXPORT_ROOT = config("EXPORT_ROOT", default="") or BASE_DIR / "private" / "exports"
+
+# Выгрузки в Excel больше этого числа строк выполняются в фоне
+# воркером `manage.py run_export_worker`, а не в запросе.
+EXPORT_BACKGROUND_THRESHOLD = 5000
+# Сколько секунд задание выгрузки может выполняться, прежде чем будет
+# считаться зависшим (воркер остановился, не завершив его).
+EXPORT_JOB_TIMEOUT = 1800
+
+# Документы Word (акты, приказы) формирует `manage.py run_document_worker`:
+# число параллельных процессов и сколько секунд задание может выполняться,
+# прежде чем будет считаться зависшим.
+DOCUMENT_WORKER_PROCESSES = config("DOCUMENT_WORKER_PROCESSES", default=2, cast=int)
+DOCUMENT_JOB_TIMEOUT = 300
+# Сколько процессов формируют недостающие документы ZIP-архива (documents.archive)
+# прямо в запросе; 1 — без пула, в процессе веб-воркера.
+DOCUMENT_ARCHIVE_PROCESSES = config("DOCUMENT_ARCHIVE_PROCESSES", default=2, cast=int)
+
+# Сколько секунд воркер доверяет своему кэшу справочников (directory.cache):
+# изменения из других процессов подхватываются не позже этого срока.
+DIRECTORY_CACHE_TTL = 300
+
+# Счётчики строк списков админки и выгрузок (utils.counts): выше порога
+# число строк берётся из статистики планировщика PostgreSQL, точные
+# COUNT кэшируются в процессе на указанное число секунд, не больше
+# COUNT_CACHE_SIZE запросов.
+COUNT_ESTIMATE_THRESHOLD = 1000
+COUNT_CACHE_TTL = 60
+COUNT_CACHE_SIZE = 1000
+
+# Варианты фильтров боковой панели админки (utils.list_filters) кэшируются
+# в процессе и сбрасываются сигналами; другие воркеры подхватят изменения
+# не позже этого срока, сек.
+FILTER_CHOICES_CACHE_TTL = 300
+
+# Просроченные остатки запчастей отмечает `manage.py sweep_expired_stock`
+# (таймер systemd stock_expiry_sweep.timer).
+# «Истекает срок годности» — в течение стольких дней
+STOCK_EXPIRING_DAYS = 30
+
+
 SHELL_PLUS = "ipython"
 SHELL_PLUS_PRINT_SQL = True
 
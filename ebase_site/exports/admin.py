@@ -0,0 +1,90 @@
+import os
+
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.urls import reverse
+from django.utils.html import format_html
+
+from .models import ExportJob
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "__str__",
+        "status",
+        "row_count",
+        "duration_display",
+        "user",
+        "create_dt",
+        "download_link",
+    )
+    list_filter = ("status",)
+    list_per_page = 20
+    list_select_related = ("content_type", "user")
+    fields = (
+        "content_type",
+        "user",
+        "status",
+        "row_count",
+        "create_dt",
+        "started_dt",
+        "finished_dt",
+        "download_link",
+        "error",
+    )
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(user=request.user)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Длительность")
+    def duration_display(self, obj):
+        if obj.duration is None:
+            return "--"
+        return f"{obj.duration.total_seconds():.1f} с"
+
+    def get_urls(self):
+        from django.urls import path
+
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                "<path:object_id>/download/",
+                self.admin_site.admin_view(self.download),
+                name="exports_exportjob_download",
+            ),
+        ]
+        return custom_urls + urls
+
+    def download(self, request, object_id):
+        """Файл выгрузки; чужие задания get_queryset не отдаёт."""
+        job = self.get_object(request, object_id)
+        if (
+            job is None
+            or not self.has_view_permission(request, job)
+            or job.status != ExportJob.Status.DONE
+            or not job.file
+        ):
+            raise Http404
+        try:
+            file = job.file.open("rb")
+        except FileNotFoundError:
+            raise Http404
+        return FileResponse(file, as_attachment=True, filename=os.path.basename(job.file.name))
+
+    @admin.display(description="Файл")
+    def download_link(self, obj):
+        if obj.status != ExportJob.Status.DONE or not obj.file:
+            return "--"
+        url = reverse("admin:exports_exportjob_download", args=[obj.pk])
+        return format_html('<a href="{}">Скачать</a>', url)
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from exports.services import fail_stale_jobs, process_next_job
+
+
+class Command(BaseCommand):
+    help = "Выполняет задания фоновой выгрузки в Excel из очереди в БД"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Выполнить все задания из очереди и завершиться",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Пауза между опросами пустой очереди, сек (по умолчанию 5)",
+        )
+
+    def handle(self, *args, **options):
+        fail_stale_jobs()
+        while True:
+            close_old_connections()
+            job = process_next_job()
+            if job is not None:
+                self.stdout.write(
+                    f"{job.pk}: {job.get_status_display()}, строк {job.row_count}"
+                )
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+            fail_stale_jobs()
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.UUIDField(db_comment='ID записи', default=uuid.uuid4, editable=False, help_text='ID записи', primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_dt', models.DateTimeField(auto_now_add=True, db_comment='Дата создания записи.', help_text='Дата создания записи. Заполняется автоматически', verbose_name='Дата создания')),
+                ('object_ids', models.JSONField(db_comment='ID выгружаемых записей в порядке changelist-а', default=list, verbose_name='ID записей')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], db_comment='Статус задания: pending, running, done, failed', default='pending', max_length=16, verbose_name='Статус')),
+                ('row_count', models.PositiveIntegerField(db_comment='Количество выгруженных строк', default=0, verbose_name='Строк')),
+                ('started_dt', models.DateTimeField(blank=True, db_comment='Когда воркер взял задание в работу', null=True, verbose_name='Начало')),
+                ('finished_dt', models.DateTimeField(blank=True, db_comment='Когда задание завершилось', null=True, verbose_name='Окончание')),
+                ('file', models.FileField(blank=True, db_comment='Путь к готовому файлу выгрузки', upload_to='exports/%Y/%m/', verbose_name='Файл')),
+                ('error', models.TextField(blank=True, db_comment='Текст ошибки, если выгрузка не удалась', verbose_name='Ошибка')),
+                ('content_type', models.ForeignKey(db_comment='Модель, записи которой выгружаются', on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Раздел')),
+                ('user', models.ForeignKey(blank=True, db_comment='ID пользователя, запустившего выгрузку', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='export_job_user', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Выгрузка в Excel',
+                'verbose_name_plural': 'Выгрузки в Excel',
+                'db_table': '"medsil"."export_job"',
+                'db_table_comment': 'Задания на фоновую выгрузку в Excel. \n\n-- BMatyushin',
+                'ordering': ('-create_dt',),
+                'indexes': [models.Index(fields=['status', 'create_dt'], name='export_job_status_f9b609_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:30
+
+from django.db import migrations, models
+import exports.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(blank=True, db_comment='Путь к готовому файлу выгрузки', storage=exports.models.ExportStorage(), upload_to='%Y/%m/', verbose_name='Файл'),
+        ),
+    ]
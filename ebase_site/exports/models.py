@@ -0,0 +1,121 @@
+import os
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+
+from ebase.models import EbaseModel
+
+company = '"medsil"'  # название схемы для таблиц
+
+
+class ExportStorage(FileSystemStorage):
+    """Файлы выгрузок в ``settings.EXPORT_ROOT``, без публичного URL.
+
+    Каталог читается из настроек при каждом обращении, а не при импорте.
+    """
+
+    @property
+    def base_location(self):
+        return settings.EXPORT_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError("Файлы выгрузок отдаются только через админку")
+
+
+export_storage = ExportStorage()
+
+
+class ExportJob(EbaseModel):
+    """Задание на фоновую выгрузку записей changelist-а в Excel.
+
+    Очередь хранится прямо в БД: задание создаёт экшен админки, забирает
+    и выполняет воркер ``manage.py run_export_worker``.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "В очереди"
+        RUNNING = "running", "Выполняется"
+        DONE = "done", "Готово"
+        FAILED = "failed", "Ошибка"
+
+    user = models.ForeignKey(
+        "users.CompanyUser",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="export_job_user",
+        verbose_name="Пользователь",
+        db_comment="ID пользователя, запустившего выгрузку",
+    )
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        verbose_name="Раздел",
+        db_comment="Модель, записи которой выгружаются",
+    )
+    object_ids = models.JSONField(
+        default=list,
+        verbose_name="ID записей",
+        db_comment="ID выгружаемых записей в порядке changelist-а",
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PENDING,
+        verbose_name="Статус",
+        db_comment="Статус задания: pending, running, done, failed",
+    )
+    row_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Строк",
+        db_comment="Количество выгруженных строк",
+    )
+    started_dt = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Начало",
+        db_comment="Когда воркер взял задание в работу",
+    )
+    finished_dt = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Окончание",
+        db_comment="Когда задание завершилось",
+    )
+    file = models.FileField(
+        upload_to="%Y/%m/",
+        storage=export_storage,
+        blank=True,
+        verbose_name="Файл",
+        db_comment="Путь к готовому файлу выгрузки",
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name="Ошибка",
+        db_comment="Текст ошибки, если выгрузка не удалась",
+    )
+
+    class Meta:
+        db_table = f'{company}."export_job"'
+        db_table_comment = "Задания на фоновую выгрузку в Excel. \n\n-- BMatyushin"
+        verbose_name = "Выгрузка в Excel"
+        verbose_name_plural = "Выгрузки в Excel"
+        ordering = ("-create_dt",)
+        indexes = [
+            models.Index(fields=["status", "create_dt"]),
+        ]
+
+    def __str__(self):
+        return f"{self.content_type.name} от {self.create_dt:%d.%m.%Y %H:%M}"
+
+    @property
+    def duration(self):
+        if self.started_dt and self.finished_dt:
+            return self.finished_dt - self.started_dt
+        return None
@@ -0,0 +1,155 @@
+"""Фоновая выгрузка в Excel: постановка заданий в очередь и их выполнение.
+
+Очередь — таблица ``ExportJob``. Экшен админки сохраняет в задание
+упорядоченный список ID выбранных записей, воркер забирает задания
+через ``SELECT ... FOR UPDATE SKIP LOCKED`` (несколько воркеров не возьмут
+одно задание дважды) и пишет файл в ``EXPORT_ROOT`` потоково, порциями.
+Файл отдаёт только админка заданий: владельцу или суперпользователю.
+"""
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.http import HttpRequest
+from django.utils import timezone
+
+from utils.export_plan import get_export_plan
+from utils.export_to_xlsx import (
+    EXPORT_CHUNK_SIZE,
+    export_rows,
+    get_export_headers,
+    iter_xlsx,
+)
+from .models import ExportJob
+
+logger = logging.getLogger("exports")
+
+
+class ExportUserMissing(Exception):
+    """Задание осталось без пользователя: записи не отфильтровать по его правам."""
+
+
+def enqueue_export(modeladmin, request, queryset) -> ExportJob:
+    """Ставит выгрузку ``queryset`` в очередь, сохраняя порядок записей."""
+    object_ids = [str(pk) for pk in queryset.values_list("pk", flat=True)]
+    return ExportJob.objects.create(
+        user=request.user,
+        content_type=ContentType.objects.get_for_model(modeladmin.model),
+        object_ids=object_ids,
+    )
+
+
+def fail_stale_jobs() -> int:
+    """Завершает ошибкой задания, зависшие в работе дольше EXPORT_JOB_TIMEOUT.
+
+    Такие задания остаются после аварийной остановки или перезапуска воркера.
+    """
+    deadline = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+    return ExportJob.objects.filter(
+        status=ExportJob.Status.RUNNING, started_dt__lt=deadline
+    ).update(
+        status=ExportJob.Status.FAILED,
+        error="Превышено время выгрузки",
+        finished_dt=timezone.now(),
+    )
+
+
+def claim_next_job():
+    """Забирает самое старое задание из очереди и помечает его выполняемым."""
+    with transaction.atomic():
+        job = (
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ExportJob.Status.PENDING)
+            .order_by("create_dt")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = ExportJob.Status.RUNNING
+        job.started_dt = timezone.now()
+        job.save(update_fields=["status", "started_dt"])
+    return job
+
+
+def _iter_job_objects(queryset, object_ids, chunk_size=EXPORT_CHUNK_SIZE):
+    """Объекты задания порциями, в том порядке, в котором их выбрали.
+
+    Удалённые с момента постановки в очередь записи пропускаются.
+    """
+    for start in range(0, len(object_ids), chunk_size):
+        chunk = object_ids[start:start + chunk_size]
+        objects = {str(obj.pk): obj for obj in queryset.filter(pk__in=chunk)}
+        for pk in chunk:
+            if pk in objects:
+                yield objects[pk]
+
+
+def run_export_job(job: ExportJob):
+    """Формирует файл выгрузки задания в ``EXPORT_ROOT``."""
+    model = job.content_type.model_class()
+    modeladmin = admin.site._registry[model]
+
+    # Queryset строится той же админкой, что и changelist, от имени
+    # пользователя, запустившего выгрузку: от его прав и должности зависит,
+    # какие записи он видит. Без пользователя выгрузку не выполнить.
+    if job.user is None:
+        raise ExportUserMissing("Пользователь, запустивший выгрузку, удалён")
+    request = HttpRequest()
+    request.method = "GET"
+    request.user = job.user
+    queryset = get_export_plan(modeladmin).apply(modeladmin.get_queryset(request))
+
+    file_name = job.file.field.generate_filename(
+        job, f"{model._meta.model_name}_{job.create_dt:%Y%m%d_%H%M%S}.xlsx"
+    )
+    storage = job.file.storage
+    file_name = storage.get_available_name(file_name)
+    file_path = storage.path(file_name)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    row_count = 0
+
+    def rows():
+        nonlocal row_count
+        objects = _iter_job_objects(queryset, job.object_ids)
+        for row in export_rows(modeladmin, objects):
+            row_count += 1
+            yield row
+
+    with open(file_path, "wb") as f:
+        for chunk in iter_xlsx(get_export_headers(modeladmin), rows()):
+            f.write(chunk)
+
+    job.file.name = file_name
+    job.row_count = row_count
+
+
+def process_job(job: ExportJob):
+    """Выполняет задание и фиксирует результат; ошибки не пробрасываются."""
+    try:
+        run_export_job(job)
+    except ExportUserMissing as e:
+        logger.warning("Выгрузка %s не выполнена: %s", job.pk, e)
+        job.status = ExportJob.Status.FAILED
+        job.error = str(e)
+    except Exception as e:
+        logger.exception("Ошибка выгрузки %s", job.pk)
+        job.status = ExportJob.Status.FAILED
+        job.error = str(e)
+    else:
+        job.status = ExportJob.Status.DONE
+    job.finished_dt = timezone.now()
+    job.save(update_fields=["status", "error", "file", "row_count", "finished_dt"])
+    return job
+
+
+def process_next_job():
+    """Выполняет одно задание из очереди. Возвращает его или None."""
+    job = claim_next_job()
+    if job is not None:
+        process_job(job)
+    return job
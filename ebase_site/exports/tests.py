@@ -0,0 +1,129 @@
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from ebase.models import Equipment
+from .models import ExportJob
+from .services import fail_stale_jobs, process_next_job
+
+
+User = get_user_model()
+
+
+class ExportJobTests(TestCase):
+    def setUp(self):
+        self.export_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.export_root.cleanup)
+        self.user = User.objects.create_superuser(username="admin", password="pass")
+        self.client.force_login(self.user)
+        self.equipment = [
+            Equipment.objects.create(full_name=f"Прибор {i}", short_name=f"П{i}")
+            for i in range(3)
+        ]
+
+    def _post_export(self):
+        return self.client.post(
+            "/admin/ebase/equipment/",
+            {
+                "action": "export_to_excel_formatted",
+                "_selected_action": [str(eq.pk) for eq in self.equipment],
+            },
+        )
+
+    @override_settings(EXPORT_BACKGROUND_THRESHOLD=100)
+    def test_small_export_is_streamed(self):
+        """Небольшая выгрузка отдаётся сразу, без задания в очереди."""
+        response = self._post_export()
+
+        self.assertTrue(response.streaming)
+        self.assertFalse(ExportJob.objects.exists())
+
+    @override_settings(EXPORT_BACKGROUND_THRESHOLD=2)
+    def test_large_export_is_queued_and_processed(self):
+        """Большая выгрузка уходит в очередь, воркер формирует файл."""
+        with override_settings(EXPORT_ROOT=self.export_root.name):
+            response = self._post_export()
+            self.assertEqual(response.status_code, 302)
+
+            job = ExportJob.objects.get()
+            self.assertEqual(job.status, ExportJob.Status.PENDING)
+            self.assertEqual(len(job.object_ids), 3)
+
+            self.assertEqual(process_next_job().pk, job.pk)
+            self.assertIsNone(process_next_job())
+
+            job.refresh_from_db()
+            self.assertEqual(job.status, ExportJob.Status.DONE)
+            self.assertEqual(job.row_count, 3)
+            ws = load_workbook(Path(self.export_root.name, job.file.name)).active
+            self.assertEqual(ws.max_row, 4)
+
+    @override_settings(EXPORT_BACKGROUND_THRESHOLD=2)
+    def test_file_is_downloaded_only_by_owner(self):
+        """Файл лежит вне MEDIA_ROOT и отдаётся админкой только владельцу."""
+        with override_settings(EXPORT_ROOT=self.export_root.name):
+            self._post_export()
+            job = process_next_job()
+            url = f"/admin/exports/exportjob/{job.pk}/download/"
+
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response["Content-Disposition"].startswith("attachment"))
+            with self.assertRaises(ValueError):
+                job.file.url
+
+            other = User.objects.create_user(username="other", password="pass", is_staff=True)
+            other.user_permissions.add(Permission.objects.get(codename="view_exportjob"))
+            self.client.force_login(other)
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_job_of_deleted_user_fails(self):
+        """Без пользователя выгрузка не выполняется от имени анонима."""
+        job = ExportJob.objects.create(
+            user=None,
+            content_type=ContentType.objects.get_for_model(Equipment),
+            object_ids=[str(eq.pk) for eq in self.equipment],
+        )
+
+        with self.assertLogs("exports", "WARNING"):
+            process_next_job()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.Status.FAILED)
+        self.assertEqual(job.error, "Пользователь, запустивший выгрузку, удалён")
+        self.assertFalse(job.file)
+
+    @override_settings(EXPORT_JOB_TIMEOUT=60)
+    def test_stale_running_job_is_failed(self):
+        """Задание, брошенное упавшим воркером, не висит в работе вечно."""
+        started = timezone.now() - timedelta(seconds=120)
+        stale = ExportJob.objects.create(
+            user=self.user,
+            content_type=ContentType.objects.get_for_model(Equipment),
+            object_ids=[],
+            status=ExportJob.Status.RUNNING,
+            started_dt=started,
+        )
+        fresh = ExportJob.objects.create(
+            user=self.user,
+            content_type=ContentType.objects.get_for_model(Equipment),
+            object_ids=[],
+            status=ExportJob.Status.RUNNING,
+            started_dt=timezone.now(),
+        )
+
+        self.assertEqual(fail_stale_jobs(), 1)
+
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, ExportJob.Status.FAILED)
+        self.assertEqual(stale.error, "Превышено время выгрузки")
+        self.assertEqual(fresh.status, ExportJob.Status.RUNNING)
+
@@ -4,11 +4,10 @@ import logging
 
 from django.contrib import admin
 from django.urls import reverse
-from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
-from django.db.models import Sum
 from utils import MainModelAdmin
+from utils.search import FullTextSearchMixin
 from ebase.models import Service, EquipmentAccDepartment
 
 # from ebase_site.ebase.models import Service, EquipmentAccDepartment
@@ -25,7 +24,8 @@ from .models import (
     SparePartSupplyItem,
 )
 from .forms import *
-from .admin_filters import WhoShipment
+from .admin_filters import ExpirationFilter, WhoShipment
+from .services import post_count_correction, with_stock_totals
 
 logger = logging.getLogger("spare_part")
 
@@ -86,7 +86,7 @@ class SparePartPhotoInline(admin.StackedInline):
 
 
 @admin.register(SparePart)
-class SparePartAdmin(MainModelAdmin):
+class SparePartAdmin(FullTextSearchMixin, MainModelAdmin):
     form = SparePartForm
 
     autocomplete_fields = ("unit",)
@@ -109,6 +109,7 @@ class SparePartAdmin(MainModelAdmin):
         "article",
         "equipment__full_name",
     )
+    search_similarity_field = "name"
     search_help_text = "Поиск по названию, артикулу запчасти или по оборудованию"
     ordering = ("name", "article")
     filter_horizontal = ("equipment",)
@@ -185,22 +186,23 @@ class SparePartAdmin(MainModelAdmin):
             }
         )
 
+    def get_queryset(self, request):
+        # Остаток, фото и оборудование — аннотациями одного запроса (и для выгрузки)
+        return with_stock_totals(super().get_queryset(request))
+
     @admin.display(description="Оборудование")
     def equipment_name(self, obj):
-        equipment_list = obj.equipment.values_list("full_name", flat=True)
-        return ", ".join(equipment_list)
+        return obj.equipment_names
 
-    @admin.display(description="Кол-во")
+    @admin.display(description="Кол-во", ordering="stock_amount")
     def amount(self, obj):
-        amount = (
-            obj.spare_part_count_spare_part.aggregate(Sum("amount"))["amount__sum"] or 0
-        )
+        amount = round(obj.stock_amount, 2)
         amount = amount if amount % 1 else int(amount)
         return amount
 
     @admin.display(description="Фото", boolean=True)
     def photo(self, obj):
-        return True if obj.spare_part_photo.values() else False
+        return obj.has_photo
 
 
 @admin.register(SparePartCount)
@@ -215,7 +217,7 @@ class SparePartCountAdmin(MainModelAdmin):
         "expiration_dt",
         "is_overdue",
     )
-    list_filter = ("is_overdue",)
+    list_filter = ("is_overdue", ExpirationFilter)
     search_fields = (
         "spare_part__name",
         "spare_part__article",
@@ -247,13 +249,26 @@ class SparePartCountAdmin(MainModelAdmin):
         return obj.spare_part.unit.short_name if obj.spare_part.unit else "-"
 
     def get_queryset(self, request):
-        """Обноление состояни просроченности при отображение страницы"""
-        today = timezone.now().date()
+        # Просроченность отмечает ежедневный sweep_expired_stock, здесь только чтение
         qs = super().get_queryset(request)
         qs = qs.select_related("spare_part__unit")
-        qs.filter(expiration_dt__lt=today).update(is_overdue=False)
         return qs
 
+    def save_model(self, request, obj, form, change):
+        """Ручная правка остатка попадает в журнал движений как корректировка"""
+        loaded = getattr(obj, "_loaded_stock", None) if change else None
+        super().save_model(request, obj, form, change)
+        post_count_correction(obj, loaded)
+
+    def delete_model(self, request, obj):
+        post_count_correction(obj, getattr(obj, "_loaded_stock", None), deleted=True)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            post_count_correction(obj, obj._loaded_stock, deleted=True)
+        super().delete_queryset(request, queryset)
+
     def get_search_results(self, request, queryset, search_term):
         """Переопределяем выдачу для autocomplete_fields"""
         if request.GET.get("model_name") == "sparepartshipment":
@@ -493,9 +508,8 @@ class SparePartShipmentV2Admin(MainModelAdmin):
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "service":
-            qs = Service.objects.select_related(
-                "service_type", "equipment_accounting__equipment", "user"
-            )
+            # Подпись ремонта хранится в Service.label — связи не нужны
+            qs = Service.objects.all()
 
             # Для авто-отгрузки (is_auto_comment=True) — сужаем queryset до текущего ремонта,
             # чтобы нельзя было переключиться на другой.
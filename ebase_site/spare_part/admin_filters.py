@@ -1,24 +1,43 @@
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.db.models import Value
 from django.db.models.functions import Concat, Trim
 
+from directory.models import Position
+from utils.list_filters import CachedChoicesFilter
+
 CompanyUser = get_user_model()
 
 
-class WhoShipment(admin.SimpleListFilter):
+class WhoShipment(CachedChoicesFilter):
     title = 'Кто отгрузил'
     parameter_name = 'user'
+    choices_models = (CompanyUser, CompanyUser.position.through, Position)
 
-    def lookups(self, request, model_admin):
-        users = CompanyUser.objects \
+    def load_choices(self):
+        return CompanyUser.objects \
             .annotate(fio=Trim(Concat('first_name', Value(' '), 'last_name'))) \
             .filter(position__name__in=['инженер']) \
             .values_list('username', 'fio')
 
-        return list(users)
-
     def queryset(self, request, queryset):
         if self.value():  # здесь будет username выбранного фильтра
             return queryset.filter(user__username=self.value())
-        return queryset
\ No newline at end of file
+        return queryset
+
+
+class ExpirationFilter(admin.SimpleListFilter):
+    title = 'Срок годности'
+    parameter_name = 'expiring'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('soon', f'Истекает в течение {settings.STOCK_EXPIRING_DAYS} дн.'),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'soon':
+            from .services import expiring_stock
+            return queryset.filter(pk__in=expiring_stock().values('pk'))
+        return queryset
@@ -0,0 +1,229 @@
+"""Себестоимость запчастей по FIFO.
+
+Каждая строка поставки (``SparePartSupplyItem``) — слой
+``SparePartCostLayer`` с ценой и несписанным остатком ``remaining``.
+Отгрузка списывает слои своей партии (запчасть, срок годности)
+от старой поставки к новой, себестоимость строки отгрузки — сумма
+списанного по ценам слоёв. Возврат (удаление или уменьшение отгрузки)
+восстанавливает слои в обратном порядке.
+
+Текущая закупочная цена партии — цена первого слоя с ``remaining > 0``:
+один запрос по частичному индексу ``spare_part_cost_layer_open``.
+Пакетные функции делают один SELECT и один bulk_update на весь набор строк.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import SparePartCostLayer, SparePartShipmentM2M, SparePartSupplyItem
+
+_CENT = Decimal("0.01")
+
+# Ключ «любой срок годности» для цены без партии
+ANY_EXPIRATION = object()
+
+
+def _qty(value) -> Decimal:
+    return Decimal(str(value or 0))
+
+
+def line_price(cost, quantity) -> Decimal:
+    """Цена за единицу строки отгрузки по её себестоимости."""
+    if not quantity:
+        return Decimal(0)
+    return (cost / _qty(quantity)).quantize(_CENT)
+
+
+def _last_prices(spare_part_ids) -> dict:
+    """Цена последней поставки: для партий, у которых всё списано."""
+    prices = {}
+    rows = (
+        SparePartCostLayer.objects.filter(spare_part_id__in=spare_part_ids)
+        .order_by("-supply_dt", "-id")
+        .values_list("spare_part_id", "expiration_dt", "price")
+    )
+    for spare_part_id, expiration_dt, price in rows:
+        prices.setdefault((spare_part_id, ANY_EXPIRATION), price)
+        prices.setdefault((spare_part_id, expiration_dt), price)
+    return prices
+
+
+def current_prices(keys) -> dict:
+    """Текущие закупочные цены для ключей (запчасть, срок годности).
+
+    Для партии без слоёв берётся цена запчасти с любым сроком,
+    для полностью списанной — цена последней поставки.
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+    part_ids = {spare_part_id for spare_part_id, _ in keys}
+    prices = {}
+    rows = (
+        SparePartCostLayer.objects.filter(spare_part_id__in=part_ids, remaining__gt=0)
+        .order_by("supply_dt", "id")
+        .values_list("spare_part_id", "expiration_dt", "price")
+    )
+    for spare_part_id, expiration_dt, price in rows:
+        prices.setdefault((spare_part_id, ANY_EXPIRATION), price)
+        prices.setdefault((spare_part_id, expiration_dt), price)
+    if not all(key in prices for key in keys):
+        for key, price in _last_prices(part_ids).items():
+            prices.setdefault(key, price)
+    return {
+        key: prices.get(key, prices.get((key[0], ANY_EXPIRATION), Decimal(0)))
+        for key in keys
+    }
+
+
+def current_price(spare_part_id, expiration_dt=None) -> Decimal:
+    return current_prices({(spare_part_id, expiration_dt)})[(spare_part_id, expiration_dt)]
+
+
+def _layers_by_key(queryset):
+    layers = {}
+    for layer in queryset:
+        layers.setdefault((layer.spare_part_id, layer.expiration_dt), []).append(layer)
+    return layers
+
+
+def consume(items) -> list:
+    """Списывает слои под строки отгрузки.
+
+    items — [(spare_part_id, expiration_dt, quantity)]. Возвращает
+    себестоимость каждой строки (Decimal). То, что не покрыто слоями
+    (отгрузка без поставки), оценивается по цене последней поставки.
+    """
+    items = [(part_id, exp_dt, float(quantity or 0)) for part_id, exp_dt, quantity in items]
+    part_ids = {part_id for part_id, _, quantity in items if quantity > 0}
+    if not part_ids:
+        return [Decimal(0)] * len(items)
+    with transaction.atomic():
+        layers = _layers_by_key(
+            SparePartCostLayer.objects.select_for_update()
+            .filter(spare_part_id__in=part_ids, remaining__gt=0)
+            .order_by("supply_dt", "id")
+        )
+        changed = {}
+        costs, shortfalls = [], []
+        for index, (part_id, exp_dt, quantity) in enumerate(items):
+            cost = Decimal(0)
+            for layer in layers.get((part_id, exp_dt), ()):
+                if quantity <= 0:
+                    break
+                if layer.remaining <= 0:
+                    continue
+                take = min(layer.remaining, quantity)
+                layer.remaining = round(layer.remaining - take, 2)
+                quantity = round(quantity - take, 2)
+                cost += _qty(take) * layer.price
+                changed[layer.pk] = layer
+            if quantity > 0:
+                shortfalls.append((index, part_id, exp_dt, quantity))
+            costs.append(cost)
+        if shortfalls:
+            last = _last_prices({part_id for _, part_id, _, _ in shortfalls})
+            for index, part_id, exp_dt, quantity in shortfalls:
+                price = last.get((part_id, exp_dt), last.get((part_id, ANY_EXPIRATION), 0))
+                costs[index] += _qty(quantity) * price
+        if changed:
+            SparePartCostLayer.objects.bulk_update(changed.values(), ["remaining"])
+    return [cost.quantize(_CENT) for cost in costs]
+
+
+def release(items):
+    """Возвращает в слои количество отменённых отгрузок (от новых слоёв к старым).
+
+    items — [(spare_part_id, expiration_dt, quantity)].
+    """
+    items = [
+        (part_id, exp_dt, float(quantity))
+        for part_id, exp_dt, quantity in items
+        if quantity and quantity > 0
+    ]
+    if not items:
+        return
+    with transaction.atomic():
+        layers = _layers_by_key(
+            SparePartCostLayer.objects.select_for_update()
+            .filter(
+                spare_part_id__in={part_id for part_id, _, _ in items},
+                remaining__lt=F("quantity"),
+            )
+            .order_by("-supply_dt", "-id")
+        )
+        changed = {}
+        for part_id, exp_dt, quantity in items:
+            for layer in layers.get((part_id, exp_dt), ()):
+                if quantity <= 0:
+                    break
+                give = min(round(layer.quantity - layer.remaining, 2), quantity)
+                if give <= 0:
+                    continue
+                layer.remaining = round(layer.remaining + give, 2)
+                quantity = round(quantity - give, 2)
+                changed[layer.pk] = layer
+        if changed:
+            SparePartCostLayer.objects.bulk_update(changed.values(), ["remaining"])
+
+
+def sync_cost_layer(item):
+    """Создаёт или обновляет слой строки поставки.
+
+    При изменении количества уже списанная часть слоя сохраняется.
+    """
+    layer = SparePartCostLayer.objects.filter(supply_item=item).first()
+    expiration_dt = SparePartCostLayer._meta.get_field("expiration_dt").to_python(
+        item.expiration_dt
+    )
+    quantity = float(item.quantity or 0)
+    if layer is None:
+        SparePartCostLayer.objects.create(
+            supply_item=item,
+            spare_part_id=item.spare_part_id,
+            expiration_dt=expiration_dt,
+            supply_dt=item.supply.supply_dt,
+            price=item.price or 0,
+            quantity=quantity,
+            remaining=quantity,
+        )
+        return
+    consumed = layer.quantity - layer.remaining
+    layer.spare_part_id = item.spare_part_id
+    layer.expiration_dt = expiration_dt
+    layer.price = item.price or 0
+    layer.quantity = quantity
+    layer.remaining = max(round(quantity - consumed, 2), 0)
+    layer.save()
+
+
+def rebuild_cost_layers() -> int:
+    """Пересобирает слои по всем поставкам и списывает на них все отгрузки.
+
+    Отгрузки списываются в порядке их создания. Цены строк отгрузок
+    не меняются. Возвращает число слоёв.
+    """
+    with transaction.atomic():
+        SparePartCostLayer.objects.all().delete()
+        SparePartCostLayer.objects.bulk_create(
+            (
+                SparePartCostLayer(
+                    supply_item_id=item.pk,
+                    spare_part_id=item.spare_part_id,
+                    expiration_dt=item.expiration_dt,
+                    supply_dt=item.supply.supply_dt,
+                    price=item.price or 0,
+                    quantity=item.quantity or 0,
+                    remaining=item.quantity or 0,
+                )
+                for item in SparePartSupplyItem.objects.select_related("supply").iterator()
+            ),
+            batch_size=1000,
+        )
+        consume(
+            SparePartShipmentM2M.objects.order_by("create_dt", "pk").values_list(
+                "spare_part_id", "expiration_dt", "quantity"
+            )
+        )
+    return SparePartCostLayer.objects.count()
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from spare_part.fifo import rebuild_cost_layers
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает слои себестоимости FIFO по поставкам и списывает "
+        "на них все отгрузки"
+    )
+
+    def handle(self, *args, **options):
+        layers = rebuild_cost_layers()
+        self.stdout.write(self.style.SUCCESS(f"Слоёв себестоимости: {layers}"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from spare_part.services import expiring_stock, sweep_expired_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Отмечает просроченные остатки запчастей и выводит остатки, "
+        "срок годности которых скоро истекает"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Показать остатки, срок годности которых истекает в течение N дней "
+            "(по умолчанию STOCK_EXPIRING_DAYS)",
+        )
+
+    def handle(self, *args, **options):
+        changed = sweep_expired_stock()
+        self.stdout.write(self.style.SUCCESS(f"Изменена отметка просрочки: {changed}"))
+        for count in expiring_stock(options["days"]):
+            self.stdout.write(f"{count.expiration_dt:%d.%m.%Y}  {count}")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from spare_part.services import rebuild_stock_balances, verify_stock_balances
+
+
+class Command(BaseCommand):
+    help = "Сверяет остатки запчастей с журналом движений (--fix исправляет остатки)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Выставить остатки по журналу движений",
+        )
+
+    def handle(self, *args, **options):
+        mismatches = verify_stock_balances()
+        for spare_part_id, expiration_dt, amount, ledger in mismatches:
+            self.stdout.write(
+                f"{spare_part_id} (до {expiration_dt or '-'}): "
+                f"остаток {amount if amount is not None else 'нет'}, по журналу {ledger}"
+            )
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Остатки совпадают с журналом"))
+            return
+        if options["fix"]:
+            fixed = rebuild_stock_balances()
+            self.stdout.write(self.style.SUCCESS(f"Исправлено остатков: {fixed}"))
+        else:
+            self.stdout.write(
+                self.style.WARNING(f"Расхождений: {len(mismatches)}. Запустите с --fix")
+            )
@@ -0,0 +1,99 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def merge_no_expiration_counts(apps, schema_editor):
+    """Сливает дубли остатков без срока годности перед уникальным индексом."""
+    SparePartCount = apps.get_model("spare_part", "SparePartCount")
+    SparePartShipment = apps.get_model("spare_part", "SparePartShipment")
+    duplicated = (
+        SparePartCount.objects.filter(expiration_dt__isnull=True)
+        .values("spare_part_id")
+        .annotate(rows=Count("id"))
+        .filter(rows__gt=1)
+        .values_list("spare_part_id", flat=True)
+    )
+    for spare_part_id in list(duplicated):
+        counts = list(
+            SparePartCount.objects.filter(
+                spare_part_id=spare_part_id, expiration_dt__isnull=True
+            ).order_by("create_dt")
+        )
+        keep, extra = counts[0], counts[1:]
+        keep.amount = round(sum(count.amount for count in counts), 2)
+        keep.save(update_fields=["amount"])
+        extra_ids = [count.pk for count in extra]
+        SparePartShipment.objects.filter(spare_part_count_id__in=extra_ids).update(
+            spare_part_count_id=keep.pk
+        )
+        SparePartCount.objects.filter(pk__in=extra_ids).delete()
+
+
+def add_opening_balances(apps, schema_editor):
+    """Начальные остатки журнала: текущие SparePartCount."""
+    SparePartCount = apps.get_model("spare_part", "SparePartCount")
+    SparePartStockMovement = apps.get_model("spare_part", "SparePartStockMovement")
+    SparePartStockMovement.objects.bulk_create(
+        (
+            SparePartStockMovement(
+                spare_part_id=count.spare_part_id,
+                expiration_dt=count.expiration_dt,
+                quantity=count.amount,
+                kind="opening",
+                source_model="sparepartcount",
+                source_id=str(count.pk),
+            )
+            for count in SparePartCount.objects.exclude(amount=0).iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spare_part', '0009_sparepart_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SparePartStockMovement',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('expiration_dt', models.DateField(blank=True, db_comment='Срок годности партии', null=True, verbose_name='Годен до')),
+                ('quantity', models.FloatField(db_comment='Изменение остатка: приход со знаком +, расход со знаком -', verbose_name='Кол-во')),
+                ('kind', models.CharField(choices=[('opening', 'Начальный остаток'), ('supply', 'Поставка'), ('shipment', 'Отгрузка'), ('correction', 'Корректировка остатка')], db_comment='Вид движения: opening, supply, shipment, correction', max_length=20, verbose_name='Вид движения')),
+                ('source_model', models.CharField(blank=True, db_comment='Модель строки-основания (поставка, отгрузка и т.д.)', default='', max_length=50, verbose_name='Документ')),
+                ('source_id', models.CharField(blank=True, db_comment='ID строки-основания', default='', max_length=36, verbose_name='ID документа')),
+                ('create_dt', models.DateTimeField(auto_now_add=True, db_comment='Дата создания записи.', verbose_name='Дата создания')),
+            ],
+            options={
+                'verbose_name': 'Движение запчастей',
+                'verbose_name_plural': 'Движение запчастей',
+                'db_table': '"medsil"."spare_part_stock_movement"',
+                'db_table_comment': 'Журнал движения запчастей (только добавление). Остатки spare_part_count сверяются с ним командой verify_stock.\n\n-- BMatyushin',
+            },
+        ),
+        migrations.RunPython(merge_no_expiration_counts, reverse_code=migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='sparepartcount',
+            constraint=models.UniqueConstraint(condition=models.Q(('expiration_dt__isnull', True)), fields=('spare_part',), name='spare_part_count_no_expiration_uniq'),
+        ),
+        migrations.AddField(
+            model_name='sparepartstockmovement',
+            name='spare_part',
+            field=models.ForeignKey(db_comment='ID запчасти', on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='spare_part.sparepart', verbose_name='Запчасть'),
+        ),
+        migrations.AddIndex(
+            model_name='sparepartstockmovement',
+            index=models.Index(fields=['spare_part', 'expiration_dt'], name='spare_part__spare_p_677e65_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sparepartstockmovement',
+            index=models.Index(fields=['source_model', 'source_id'], name='spare_part__source__78237d_idx'),
+        ),
+        migrations.RunPython(add_opening_balances, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_cost_layers(apps, schema_editor):
+    """Слои по существующим поставкам; отгрузки списываются с самых старых."""
+    SparePartSupplyItem = apps.get_model("spare_part", "SparePartSupplyItem")
+    SparePartShipmentM2M = apps.get_model("spare_part", "SparePartShipmentM2M")
+    SparePartCostLayer = apps.get_model("spare_part", "SparePartCostLayer")
+    shipped = {
+        (row["spare_part_id"], row["expiration_dt"]): row["total"] or 0
+        for row in SparePartShipmentM2M.objects.values("spare_part_id", "expiration_dt")
+        .annotate(total=Sum("quantity"))
+        .order_by()
+    }
+    layers = []
+    items = SparePartSupplyItem.objects.select_related("supply").order_by(
+        "supply__supply_dt", "pk"
+    )
+    for item in items.iterator():
+        key = (item.spare_part_id, item.expiration_dt)
+        quantity = item.quantity or 0
+        take = min(quantity, shipped.get(key, 0))
+        shipped[key] = shipped.get(key, 0) - take
+        layers.append(
+            SparePartCostLayer(
+                supply_item_id=item.pk,
+                spare_part_id=item.spare_part_id,
+                expiration_dt=item.expiration_dt,
+                supply_dt=item.supply.supply_dt,
+                price=item.price or 0,
+                quantity=quantity,
+                remaining=round(quantity - take, 2),
+            )
+        )
+    SparePartCostLayer.objects.bulk_create(layers, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spare_part', '0010_sparepartstockmovement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SparePartCostLayer',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('expiration_dt', models.DateField(blank=True, db_comment='Срок годности партии', null=True, verbose_name='Годен до')),
+                ('supply_dt', models.DateField(db_comment='Дата поставки (порядок списания FIFO)', verbose_name='Дата поставки')),
+                ('price', models.DecimalField(db_comment='Цена закупки за единицу', decimal_places=2, default=0, max_digits=15, verbose_name='Цена')),
+                ('quantity', models.FloatField(db_comment='Количество в строке поставки', verbose_name='Кол-во')),
+                ('remaining', models.FloatField(db_comment='Сколько из поставки ещё не списано отгрузками', verbose_name='Не списано')),
+                ('spare_part', models.ForeignKey(db_comment='ID запчасти', on_delete=django.db.models.deletion.CASCADE, related_name='cost_layers', to='spare_part.sparepart', verbose_name='Запчасть')),
+                ('supply_item', models.OneToOneField(db_comment='ID строки поставки', on_delete=django.db.models.deletion.CASCADE, related_name='cost_layer', to='spare_part.sparepartsupplyitem', verbose_name='Строка поставки')),
+            ],
+            options={
+                'verbose_name': 'Слой себестоимости',
+                'verbose_name_plural': 'Слои себестоимости',
+                'db_table': '"medsil"."spare_part_cost_layer"',
+                'db_table_comment': 'Слои себестоимости FIFO по строкам поставок запчастей.\n\n-- BMatyushin',
+                'indexes': [models.Index(condition=models.Q(('remaining__gt', 0)), fields=['spare_part', 'expiration_dt', 'supply_dt', 'id'], name='spare_part_cost_layer_open'), models.Index(fields=['spare_part', 'supply_dt'], name='spare_part__spare_p_bd29e3_idx')],
+            },
+        ),
+        migrations.RunPython(fill_cost_layers, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:33
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def recompute_is_overdue(apps, schema_editor):
+    """Раньше админка писала False для просроченных (флаг был перевёрнут)."""
+    SparePartCount = apps.get_model("spare_part", "SparePartCount")
+    today = datetime.date.today()
+    SparePartCount.objects.filter(expiration_dt__lt=today).update(is_overdue=True)
+    SparePartCount.objects.filter(
+        Q(expiration_dt__isnull=True) | Q(expiration_dt__gte=today)
+    ).update(is_overdue=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spare_part', '0011_sparepartcostlayer'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sparepartcount',
+            name='is_overdue',
+            field=models.BooleanField(db_comment='Флаг указывающий, что запчасть просрочена', default=False, help_text='Флаг указывающий, что запчасть просрочена. Обновляется ежедневно (manage.py sweep_expired_stock)', verbose_name='Просрочено'),
+        ),
+        migrations.RunPython(recompute_is_overdue, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='sparepartcount',
+            index=models.Index(condition=models.Q(('is_overdue', False)), fields=['expiration_dt'], name='spare_part_count_not_overdue'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spare_part', '0012_sparepartcount_is_overdue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sparepartshipmentv2',
+            name='label',
+            field=models.TextField(blank=True, db_comment='Подпись для списков выбора: номер документа и отгруженные запчасти', default='', editable=False, verbose_name='Подпись'),
+        ),
+    ]
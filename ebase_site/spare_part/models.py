@@ -3,10 +3,12 @@ import uuid
 import logging
 from decimal import Decimal
 
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
 
 from directory.models import get_instance_unit
+from utils.labels import LabelMixin
 
 
 logger = logging.getLogger("SPARE_PART_SIGNALS")
@@ -35,6 +37,28 @@ class SparePartAbs(models.Model):
         abstract = True
 
 
+class StockSourceMixin:
+    """Запоминает загруженные из БД запчасть, срок годности и количество.
+
+    Сигналы учёта остатков считают по ним движение при изменении строки
+    без повторного SELECT старой записи.
+    """
+
+    stock_quantity_field = "quantity"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_stock_values()
+        return instance
+
+    def remember_stock_values(self):
+        fields = ("spare_part_id", "expiration_dt", self.stock_quantity_field)
+        if any(field in self.get_deferred_fields() for field in fields):
+            return
+        self._loaded_stock = tuple(getattr(self, field) for field in fields)
+
+
 class SparePartAccessories(models.Model):
     """Комплектующие для подменного оборудования."""
 
@@ -127,6 +151,15 @@ class SparePart(SparePartAbs):
         verbose_name="ID Ремонта",
         help_text="В каком ремонте использовалась эта запчасть",
     )
+    search_document = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name="Поисковый документ",
+        db_comment="tsvector для поиска: наименование, артикул, оборудование",
+    )
+
+    # Связи для поискового документа (см. utils.search)
+    search_prefetch_related = ("equipment",)
 
     class Meta:
         db_table = f'{company}."spare_part"'
@@ -157,8 +190,26 @@ class SparePart(SparePartAbs):
     def __repr__(self):
         return f"<SparePart {self.name=!r}>"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_label_fields()
+        return instance
+
+    def remember_label_fields(self):
+        """Запоминает наименование и единицу измерения — для подписей отгрузок."""
+        fields = ("name", "unit_id")
+        if any(field in self.get_deferred_fields() for field in fields):
+            return
+        self._label_fields = tuple(getattr(self, field) for field in fields)
+
+    def search_document_parts(self):
+        parts = [(self.name, "A"), (self.article, "A"), (self.comment, "C")]
+        parts += [(equipment.full_name, "B") for equipment in self.equipment.all()]
+        return parts
+
 
-class SparePartCount(SparePartAbs):
+class SparePartCount(StockSourceMixin, SparePartAbs):
     """Общее количество запчастей (чтобы не делать сложные запросы для вывода этой инфы)"""
 
     spare_part = models.ForeignKey(
@@ -186,20 +237,38 @@ class SparePartCount(SparePartAbs):
         # choices=(SparePartShipment.objects.)
     )
     is_overdue = models.BooleanField(
-        default=True,
-        verbose_name="Не просрочено",
+        default=False,
+        verbose_name="Просрочено",
         db_comment="Флаг указывающий, что запчасть просрочена",
-        help_text="Флаг указывающий, что запчасть просрочена",
+        help_text="Флаг указывающий, что запчасть просрочена. "
+        "Обновляется ежедневно (manage.py sweep_expired_stock)",
     )
 
+    stock_quantity_field = "amount"
+
     class Meta:
         db_table = f'{company}."spare_part_count"'
         db_table_comment = "Общее количество запчастей на остатке.\n\n-- BMatyushin"
         verbose_name = "Остаток запчастей"
         verbose_name_plural = "Остаток запчастей"
         unique_together = ("spare_part", "expiration_dt")
+        constraints = [
+            # unique_together не ограничивает строки с NULL, а upsert остатка
+            # без срока годности опирается на единственность такой строки
+            models.UniqueConstraint(
+                fields=["spare_part"],
+                condition=models.Q(expiration_dt__isnull=True),
+                name="spare_part_count_no_expiration_uniq",
+            ),
+        ]
         indexes = [
             models.Index(fields=["spare_part"]),
+            # Ежедневный поиск новых просроченных остатков
+            models.Index(
+                fields=["expiration_dt"],
+                condition=models.Q(is_overdue=False),
+                name="spare_part_count_not_overdue",
+            ),
         ]
 
     def check_expiration(self):
@@ -219,7 +288,83 @@ class SparePartCount(SparePartAbs):
         return f"<SparePartCount {self.spare_part=!r} {self.amount=!r}>"
 
 
-class SparePartShipmentM2M(models.Model):
+class SparePartStockMovement(models.Model):
+    """Журнал движения запчастей. Записи только добавляются:
+    остаток SparePartCount равен сумме движений по запчасти и сроку годности."""
+
+    KIND_CHOICES = (
+        ("opening", "Начальный остаток"),
+        ("supply", "Поставка"),
+        ("shipment", "Отгрузка"),
+        ("correction", "Корректировка остатка"),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    spare_part = models.ForeignKey(
+        "SparePart",
+        on_delete=models.CASCADE,
+        related_name="stock_movements",
+        verbose_name="Запчасть",
+        db_comment="ID запчасти",
+    )
+    expiration_dt = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name="Годен до",
+        db_comment="Срок годности партии",
+    )
+    quantity = models.FloatField(
+        verbose_name="Кол-во",
+        db_comment="Изменение остатка: приход со знаком +, расход со знаком -",
+    )
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        verbose_name="Вид движения",
+        db_comment="Вид движения: opening, supply, shipment, correction",
+    )
+    source_model = models.CharField(
+        max_length=50,
+        blank=True,
+        default="",
+        verbose_name="Документ",
+        db_comment="Модель строки-основания (поставка, отгрузка и т.д.)",
+    )
+    source_id = models.CharField(
+        max_length=36,
+        blank=True,
+        default="",
+        verbose_name="ID документа",
+        db_comment="ID строки-основания",
+    )
+    create_dt = models.DateTimeField(
+        auto_now_add=True,
+        editable=False,
+        verbose_name="Дата создания",
+        db_comment="Дата создания записи.",
+    )
+
+    class Meta:
+        db_table = f'{company}."spare_part_stock_movement"'
+        db_table_comment = (
+            "Журнал движения запчастей (только добавление). Остатки spare_part_count "
+            "сверяются с ним командой verify_stock.\n\n-- BMatyushin"
+        )
+        verbose_name = "Движение запчастей"
+        verbose_name_plural = "Движение запчастей"
+        indexes = [
+            models.Index(fields=["spare_part", "expiration_dt"]),
+            models.Index(fields=["source_model", "source_id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.quantity:+g}"
+
+    def __repr__(self):
+        return f"<SparePartStockMovement {self.spare_part_id=!r} {self.quantity=!r}>"
+
+
+class SparePartShipmentM2M(StockSourceMixin, models.Model):
     spare_part = models.ForeignKey(
         "spare_part.SparePart",
         on_delete=models.CASCADE,
@@ -293,7 +438,7 @@ class SparePartShipmentM2M(models.Model):
         super().save(*args, **kwargs)
 
 
-class SparePartShipmentV2(SparePartAbs):
+class SparePartShipmentV2(LabelMixin, SparePartAbs):
     """Обновленная талица для отгрузки запчастей.
     Чтобы в одной отгрузке учитывать несколько видов запчастей"""
 
@@ -360,6 +505,23 @@ class SparePartShipmentV2(SparePartAbs):
         db_comment="true если коммент был создано на стороне django, "
         "если пользователем - false",
     )
+    label = models.TextField(
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Подпись",
+        db_comment="Подпись для списков выбора: номер документа и отгруженные запчасти",
+    )
+
+    # Связи для подписи (см. utils.labels)
+    label_prefetch_related = (
+        models.Prefetch(
+            "shipment_m2m",
+            queryset=SparePartShipmentM2M.objects.select_related("spare_part__unit").order_by(
+                "create_dt", "pk"
+            ),
+        ),
+    )
 
     class Meta:
         db_table = f'{company}."spare_part_shipment_v2"'
@@ -376,10 +538,13 @@ class SparePartShipmentV2(SparePartAbs):
             models.Index(fields=["user"]),
         ]
 
-    def __str__(self):
+    def build_label(self):
+        lines = self.shipment_m2m.all()
+        if "shipment_m2m" not in getattr(self, "_prefetched_objects_cache", {}):
+            lines = lines.select_related("spare_part__unit").order_by("create_dt", "pk")
         spare_parts = [
             (f"{part.spare_part.name} - {part.quantity} " f"{part.spare_part.unit}")
-            for part in self.shipment_m2m.all()
+            for part in lines
         ]
         return f"Отгрузка #{self.doc_num}: {', '.join(spare_parts)}"
 
@@ -597,7 +762,7 @@ class SparePartSupplyV2(SparePartAbs):
         return f'Поставка #{self.doc_num or "б/н"} от {self.supply_dt}'
 
 
-class SparePartSupplyItem(models.Model):
+class SparePartSupplyItem(StockSourceMixin, models.Model):
     """Строка поставки: запчасть + количество + цена + сумма."""
 
     supply = models.ForeignKey(
@@ -666,6 +831,74 @@ class SparePartSupplyItem(models.Model):
         super().save(*args, **kwargs)
 
 
+class SparePartCostLayer(models.Model):
+    """Слой себестоимости FIFO: остаток строки поставки по её цене.
+
+    Отгрузки списывают слои от старой поставки к новой (spare_part.fifo),
+    текущая закупочная цена — цена первого слоя с ненулевым остатком.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    supply_item = models.OneToOneField(
+        SparePartSupplyItem,
+        on_delete=models.CASCADE,
+        related_name="cost_layer",
+        verbose_name="Строка поставки",
+        db_comment="ID строки поставки",
+    )
+    spare_part = models.ForeignKey(
+        SparePart,
+        on_delete=models.CASCADE,
+        related_name="cost_layers",
+        verbose_name="Запчасть",
+        db_comment="ID запчасти",
+    )
+    expiration_dt = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name="Годен до",
+        db_comment="Срок годности партии",
+    )
+    supply_dt = models.DateField(
+        verbose_name="Дата поставки",
+        db_comment="Дата поставки (порядок списания FIFO)",
+    )
+    price = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        default=0,
+        verbose_name="Цена",
+        db_comment="Цена закупки за единицу",
+    )
+    quantity = models.FloatField(
+        verbose_name="Кол-во",
+        db_comment="Количество в строке поставки",
+    )
+    remaining = models.FloatField(
+        verbose_name="Не списано",
+        db_comment="Сколько из поставки ещё не списано отгрузками",
+    )
+
+    class Meta:
+        db_table = f'{company}."spare_part_cost_layer"'
+        db_table_comment = (
+            "Слои себестоимости FIFO по строкам поставок запчастей.\n\n-- BMatyushin"
+        )
+        verbose_name = "Слой себестоимости"
+        verbose_name_plural = "Слои себестоимости"
+        indexes = [
+            models.Index(
+                fields=["spare_part", "expiration_dt", "supply_dt", "id"],
+                condition=models.Q(remaining__gt=0),
+                name="spare_part_cost_layer_open",
+            ),
+            models.Index(fields=["spare_part", "supply_dt"]),
+        ]
+
+    def __repr__(self):
+        return f"<SparePartCostLayer {self.spare_part_id=!r} {self.price=!r} {self.remaining=!r}>"
+
+
 class SparePartPhoto(SparePartAbs):
     """Набор фото связанных с запчастями"""
 
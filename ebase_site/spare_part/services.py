@@ -0,0 +1,413 @@
+"""Учёт остатков запчастей через журнал движений.
+
+Каждая поставка, отгрузка или корректировка записывается в журнал
+``SparePartStockMovement`` (записи только добавляются), а остаток
+``SparePartCount`` по ключу (запчасть, срок годности) меняется одним
+upsert-ом ``INSERT ... ON CONFLICT DO UPDATE`` на всю пачку движений.
+
+Внутри ``stock_batch()`` движения копятся и проводятся одним INSERT
+в журнал и одним upsert-ом остатков на выходе из внешнего batch.
+``MainModelAdmin`` открывает его внутри транзакции сохранения формы
+(utils.deferred), так что строки-основания, журнал и остатки фиксируются
+или откатываются вместе.
+
+``verify_stock_balances``/``rebuild_stock_balances`` сверяют остатки
+с журналом (``manage.py verify_stock``).
+
+``sync_shipment_lines`` записывает новые и изменённые строки отгрузки
+ремонта пачкой, минуя посрочные сигналы; себестоимость строк считает spare_part.fifo,
+подпись отгрузки пересобирает ``shipment_labels``.
+"""
+import datetime
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import (
+    Aggregate,
+    Exists,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    TextField,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from contracts.services import schedule_contract_recalc
+from utils.deferred import register_batch
+from utils.labels import label_scheduler
+from . import fifo
+from .models import (
+    SparePart,
+    SparePartCount,
+    SparePartPhoto,
+    SparePartShipmentM2M,
+    SparePartShipmentV2,
+    SparePartStockMovement,
+)
+
+logger = logging.getLogger("SPARE_PART_SIGNALS")
+
+_local = threading.local()
+
+# Подпись отгрузки (label) собирается из строк: при сохранении отгрузки
+# с N строками из админки она пересобирается один раз.
+shipment_labels = label_scheduler(SparePartShipmentV2)
+
+
+def stock_key(spare_part_id, expiration_dt):
+    """Ключ остатка; ID запчасти приводится к UUID, срок годности — к date
+    (из JSON формы ремонта оба приходят строками)."""
+    part_field = SparePartShipmentM2M._meta.get_field("spare_part").target_field
+    date_field = SparePartCount._meta.get_field("expiration_dt")
+    return part_field.to_python(spare_part_id), date_field.to_python(expiration_dt)
+
+
+def movement(source, spare_part_id, expiration_dt, quantity, kind):
+    """Несохранённое движение по строке-основанию ``source``."""
+    spare_part_id, expiration_dt = stock_key(spare_part_id, expiration_dt)
+    return SparePartStockMovement(
+        spare_part_id=spare_part_id,
+        expiration_dt=expiration_dt,
+        quantity=float(quantity or 0),
+        kind=kind,
+        source_model=source._meta.model_name if source is not None else "",
+        source_id=str(source.pk) if source is not None else "",
+    )
+
+
+def _state():
+    if not hasattr(_local, "depth"):
+        _local.depth = 0
+        _local.pending = []
+    return _local
+
+
+@register_batch
+@contextmanager
+def stock_batch():
+    """Копит движения и проводит их одной пачкой на выходе.
+
+    Batch должен быть открыт внутри транзакции, в которой меняются
+    строки-основания: тогда при исключении — в том числе при проведении
+    движений — откатываются и они. Накопленные движения при исключении
+    отбрасываются.
+    """
+    state = _state()
+    state.depth += 1
+    try:
+        yield
+    except BaseException:
+        if state.depth == 1:
+            state.pending = []
+        raise
+    finally:
+        state.depth -= 1
+    if not state.depth and state.pending:
+        movements, state.pending = state.pending, []
+        post_movements(movements)
+
+
+def record_movements(*movements):
+    """Проводит движения сразу или откладывает до конца stock_batch()."""
+    movements = [item for item in movements if item.quantity]
+    if not movements:
+        return
+    state = _state()
+    if state.depth:
+        state.pending.extend(movements)
+    else:
+        post_movements(movements)
+
+
+def post_movements(movements, update_balances=True):
+    """Пишет движения в журнал и применяет их к остаткам.
+
+    Один INSERT в журнал и не больше двух upsert-ов остатков
+    (со сроком годности и без) независимо от числа движений.
+    """
+    movements = [item for item in movements if item.quantity]
+    if not movements:
+        return
+    # Журнал и остатки меняются вместе или не меняются вовсе
+    with transaction.atomic():
+        SparePartStockMovement.objects.bulk_create(movements)
+        if not update_balances:
+            return
+        deltas = {}
+        for item in movements:
+            key = (item.spare_part_id, item.expiration_dt)
+            deltas[key] = deltas.get(key, 0) + item.quantity
+        _upsert_balances(deltas)
+    logger.info("Posted %s stock movements for %s balances", len(movements), len(deltas))
+
+
+def _upsert_balances(deltas):
+    dated = {key: delta for key, delta in deltas.items() if key[1] is not None}
+    undated = {key: delta for key, delta in deltas.items() if key[1] is None}
+    if dated:
+        _upsert(dated, "(spare_part_id, expiration_dt)")
+    if undated:
+        # Совпадает с условием UniqueConstraint spare_part_count_no_expiration_uniq
+        _upsert(undated, "(spare_part_id) WHERE expiration_dt IS NULL")
+
+
+def _upsert(deltas, conflict_target):
+    opts = SparePartCount._meta
+    fields = [
+        opts.pk,
+        opts.get_field("spare_part"),
+        opts.get_field("expiration_dt"),
+        opts.get_field("amount"),
+        opts.get_field("is_overdue"),
+        opts.get_field("create_dt"),
+    ]
+    now = timezone.now()
+    today = timezone.localdate()
+    params = []
+    for (spare_part_id, expiration_dt), delta in deltas.items():
+        is_overdue = expiration_dt is not None and expiration_dt < today
+        values = (uuid.uuid4(), spare_part_id, expiration_dt, delta, is_overdue, now)
+        params.extend(
+            field.get_db_prep_value(value, connection)
+            for field, value in zip(fields, values)
+        )
+    row = "(%s)" % ", ".join(["%s"] * len(fields))
+    if connection.vendor == "postgresql":
+        new_amount = "ROUND((amount + EXCLUDED.amount)::numeric, 2)"
+    else:
+        new_amount = "ROUND(amount + EXCLUDED.amount, 2)"
+    sql = (
+        f"INSERT INTO {opts.db_table} ({', '.join(field.column for field in fields)}) "
+        f"VALUES {', '.join([row] * len(deltas))} "
+        f"ON CONFLICT {conflict_target} DO UPDATE SET amount = {new_amount}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def post_count_correction(count, loaded=None, deleted=False):
+    """Записывает в журнал ручную правку остатка ``SparePartCount``.
+
+    Сам остаток уже сохранён, поэтому балансы не трогаем.
+    loaded — значения строки до правки (``_loaded_stock``).
+    """
+    movements = []
+    if loaded:
+        movements.append(movement(count, loaded[0], loaded[1], -(loaded[2] or 0), "correction"))
+    if not deleted:
+        movements.append(
+            movement(count, count.spare_part_id, count.expiration_dt, count.amount, "correction")
+        )
+    post_movements(movements, update_balances=False)
+    if not deleted:
+        count.remember_stock_values()
+
+
+def sweep_expired_stock(today=None) -> int:
+    """Отмечает остатки с истёкшим сроком годности (is_overdue).
+
+    Ищет только среди непросроченных строк (частичный индекс
+    spare_part_count_not_overdue) и снимает отметку со строк, у которых
+    срок годности исправили. Возвращает число изменённых строк.
+    """
+    today = today or timezone.localdate()
+    expired = SparePartCount.objects.filter(
+        is_overdue=False, expiration_dt__lt=today
+    ).update(is_overdue=True)
+    revived = SparePartCount.objects.filter(is_overdue=True).filter(
+        Q(expiration_dt__isnull=True) | Q(expiration_dt__gte=today)
+    ).update(is_overdue=False)
+    if expired or revived:
+        logger.info("Expiry sweep: %s overdue, %s restored", expired, revived)
+    return expired + revived
+
+
+def expiring_stock(days=None, today=None):
+    """Непросроченные остатки, срок годности которых истекает в ближайшие days дней."""
+    today = today or timezone.localdate()
+    days = settings.STOCK_EXPIRING_DAYS if days is None else days
+    return (
+        SparePartCount.objects.filter(
+            is_overdue=False,
+            amount__gt=0,
+            expiration_dt__gte=today,
+            expiration_dt__lte=today + datetime.timedelta(days=days),
+        )
+        .select_related("spare_part__unit")
+        .order_by("expiration_dt", "spare_part__name")
+    )
+
+
+class _GroupConcat(Aggregate):
+    """GROUP_CONCAT для SQLite (тесты); на PostgreSQL — StringAgg."""
+
+    function = "GROUP_CONCAT"
+    output_field = TextField()
+
+
+def _string_agg(path, delimiter):
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.aggregates import StringAgg
+
+        return StringAgg(path, delimiter, ordering=path)
+    return _GroupConcat(path, Value(delimiter))
+
+
+def with_stock_totals(queryset):
+    """Аннотирует запчасти для списка и выгрузки, без запросов на строку.
+
+    stock_amount — общий остаток, has_photo — есть ли фото,
+    equipment_names — оборудование через запятую. Каждое значение —
+    коррелированный подзапрос, поэтому JOIN-ы поиска их не размножают.
+    """
+    stock = (
+        SparePartCount.objects.filter(spare_part=OuterRef("pk"))
+        .order_by()
+        .values("spare_part")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    through = SparePart.equipment.through
+    equipment = (
+        through.objects.filter(sparepart=OuterRef("pk"))
+        .order_by()
+        .values("sparepart")
+        .annotate(names=_string_agg("equipment__full_name", ", "))
+        .values("names")
+    )
+    return queryset.annotate(
+        stock_amount=Coalesce(
+            Subquery(stock, output_field=FloatField()), Value(0.0), output_field=FloatField()
+        ),
+        has_photo=Exists(SparePartPhoto.objects.filter(spare_part=OuterRef("pk"))),
+        equipment_names=Coalesce(
+            Subquery(equipment, output_field=TextField()), Value(""), output_field=TextField()
+        ),
+    )
+
+
+def ledger_totals() -> dict:
+    """Остатки по журналу: {(spare_part_id, expiration_dt): количество}."""
+    rows = (
+        SparePartStockMovement.objects.values("spare_part_id", "expiration_dt")
+        .annotate(total=Sum("quantity"))
+        .values_list("spare_part_id", "expiration_dt", "total")
+    )
+    return {(part_id, exp_dt): round(total, 2) for part_id, exp_dt, total in rows}
+
+
+def verify_stock_balances() -> list:
+    """Расхождения остатков с журналом: [(запчасть, срок, остаток, по журналу)]."""
+    expected = ledger_totals()
+    mismatches = []
+    for count in SparePartCount.objects.only("spare_part_id", "expiration_dt", "amount"):
+        key = (count.spare_part_id, count.expiration_dt)
+        ledger = expected.pop(key, 0)
+        if round(count.amount, 2) != ledger:
+            mismatches.append((*key, count.amount, ledger))
+    mismatches.extend((*key, None, ledger) for key, ledger in expected.items() if ledger)
+    return mismatches
+
+
+def rebuild_stock_balances() -> int:
+    """Выставляет остатки по журналу. Возвращает число исправленных ключей."""
+    mismatches = verify_stock_balances()
+    deltas = {
+        (spare_part_id, expiration_dt): ledger - (amount or 0)
+        for spare_part_id, expiration_dt, amount, ledger in mismatches
+    }
+    if deltas:
+        _upsert_balances(deltas)
+    return len(deltas)
+
+
+def _set_line_sum(line):
+    line.sum = Decimal(str(line.quantity or 0)) * Decimal(str(line.price or 0))
+
+
+def sync_shipment_lines(shipment, lines):
+    """Приводит строки отгрузки ``shipment`` к списку ``lines``.
+
+    lines — данные формы ремонта: ``[{"id": ID запчасти, "quantity": ...,
+    "expiration_dt": ...}]``. Строки сопоставляются по запчасти и сроку
+    годности: совпавшие с другим количеством обновляются одним bulk_update,
+    новые создаются одним bulk_create — без посрочных сигналов, остатки
+    меняются движениями на разницу, контракт отгрузки пересчитывается
+    один раз. Лишние строки удаляются обычным ``delete()``: количество
+    в остатки и слои FIFO возвращают их сигналы. Все движения проводятся
+    одной пачкой (``stock_batch``).
+
+    Возвращает (создано, изменено, удалено).
+    """
+    existing = {}
+    for line in SparePartShipmentM2M.objects.filter(shipment=shipment).order_by("create_dt", "pk"):
+        existing.setdefault(stock_key(line.spare_part_id, line.expiration_dt), []).append(line)
+
+    to_create, to_update, movements = [], [], []
+    # Слои FIFO: что вернуть и что списать (строка, количество)
+    released, consumed = [], []
+    for data in lines:
+        key = stock_key(data["id"], data.get("expiration_dt") or None)
+        quantity = float(data["quantity"] or 0)
+        matched = existing.get(key)
+        if matched:
+            line = matched.pop(0)
+            if line.quantity != quantity:
+                delta = round(quantity - line.quantity, 2)
+                movements.append(movement(line, *key, -delta, "shipment"))
+                if delta > 0:
+                    consumed.append((line, delta))
+                else:
+                    released.append((*key, -delta))
+                line.quantity = quantity
+                to_update.append(line)
+        else:
+            line = SparePartShipmentM2M(
+                shipment=shipment,
+                spare_part_id=key[0],
+                expiration_dt=key[1],
+                quantity=quantity,
+            )
+            consumed.append((line, quantity))
+            to_create.append(line)
+    to_delete = [line for rest in existing.values() for line in rest]
+
+    # Движения строк (в т.ч. из сигналов удаления) проводятся одной пачкой
+    with stock_batch():
+        if to_delete:
+            # До списания: возвращённые слои FIFO доступны новым строкам
+            SparePartShipmentM2M.objects.filter(pk__in=[line.pk for line in to_delete]).delete()
+
+        fifo.release(released)
+        costs = fifo.consume(
+            (line.spare_part_id, line.expiration_dt, quantity) for line, quantity in consumed
+        )
+        for (line, quantity), cost in zip(consumed, costs):
+            if not line.price:
+                line.price = fifo.line_price(cost, quantity)
+        for line in to_create + to_update:
+            _set_line_sum(line)
+
+        if to_update:
+            SparePartShipmentM2M.objects.bulk_update(to_update, ["quantity", "price", "sum"])
+        if to_create:
+            SparePartShipmentM2M.objects.bulk_create(to_create)
+            movements.extend(
+                movement(line, line.spare_part_id, line.expiration_dt, -line.quantity, "shipment")
+                for line in to_create
+            )
+        record_movements(*movements)
+
+    if to_create or to_update or to_delete:
+        schedule_contract_recalc(shipment.contract_id)
+        shipment_labels.schedule(shipment.pk)
+    return len(to_create), len(to_update), len(to_delete)
@@ -1,323 +1,256 @@
 import logging
 from decimal import Decimal
 
-from django.db.models import F
-from django.db.models.functions.math import Round
 from django.dispatch import receiver
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
 
-from ebase.signals import get_fifo_price
+from directory.models import Unit
+from ebase.models import Equipment
+from utils.labels import refresh_labels
+from utils.search import refresh_search_documents
+from . import fifo
 from .models import *
+from .services import movement, record_movements, shipment_labels, stock_key
 
 logger = logging.getLogger("SPARE_PART_SIGNALS")
 
 
+# Остатки SparePartCount меняются только через журнал движений
+# (spare_part.services): одна запись журнала и один upsert остатка
+# на строку, внутри stock_batch() — одна пачка на всю операцию.
+
+
+def _stock_change(instance, created, sign, kind):
+    """Движения по изменённой строке: сторно загруженных значений и проводка новых.
+
+    sign: +1 для прихода (поставка), -1 для расхода (отгрузка).
+    """
+    movements = []
+    if not created:
+        loaded = getattr(instance, "_loaded_stock", None)
+        if loaded is None:
+            loaded = (
+                type(instance)
+                .objects.filter(pk=instance.pk)
+                .values_list("spare_part_id", "expiration_dt", "quantity")
+                .first()
+            )
+        if loaded:
+            old_part_id, old_exp_dt, old_quantity = loaded
+            movements.append(
+                movement(instance, old_part_id, old_exp_dt, -sign * (old_quantity or 0), kind)
+            )
+    movements.append(
+        movement(
+            instance,
+            instance.spare_part_id,
+            instance.expiration_dt,
+            sign * (instance.quantity or 0),
+            kind,
+        )
+    )
+    # Сторно и проводка по одному ключу с тем же количеством гасят друг друга
+    if len(movements) == 2 and (
+        movements[0].spare_part_id,
+        movements[0].expiration_dt,
+        movements[0].quantity,
+    ) == (
+        movements[1].spare_part_id,
+        movements[1].expiration_dt,
+        -movements[1].quantity,
+    ):
+        movements = []
+    record_movements(*movements)
+    instance.remember_stock_values()
+
+
+def _stock_delete(instance, sign, kind):
+    loaded = getattr(instance, "_loaded_stock", None)
+    spare_part_id, expiration_dt, quantity = loaded or (
+        instance.spare_part_id,
+        instance.expiration_dt,
+        instance.quantity,
+    )
+    record_movements(movement(instance, spare_part_id, expiration_dt, -sign * (quantity or 0), kind))
+
+
 @receiver(post_save, sender=SparePartSupply)
 def spare_part_supply_post_save(sender, instance, created, **kwargs):
-    if created:
-        if instance.count_supply > 0:
-            part = SparePartCount.objects.filter(
-                spare_part=instance.spare_part,
-                expiration_dt=instance.expiration_dt,
+    if created and instance.count_supply > 0:
+        record_movements(
+            movement(
+                instance,
+                instance.spare_part_id,
+                instance.expiration_dt,
+                instance.count_supply,
+                "supply",
             )
-            if part.exists():
-                SparePartCount.objects.filter(
-                    spare_part=instance.spare_part,
-                    expiration_dt=instance.expiration_dt,
-                ).update(amount=Round(F("amount") + instance.count_supply, 2))
-                logger.info(
-                    "New Supply spare part. Updated amount for spare_part_id %s",
-                    instance.spare_part,
-                )
-            else:
-                SparePartCount.objects.create(
-                    spare_part=instance.spare_part,
-                    amount=instance.count_supply,
-                    expiration_dt=instance.expiration_dt,
-                )
-                logger.info(
-                    "New Supply spare part. Created new amount for spare part %s",
-                    instance.spare_part,
-                )
+        )
 
 
 @receiver(post_delete, sender=SparePartSupply)
 def spare_part_supply_post_delete(sender, instance, **kwargs):
     if instance.count_supply > 0:
-        part = SparePartCount.objects.filter(
-            spare_part=instance.spare_part,
-            expiration_dt=instance.expiration_dt,
-        )
-        if part.exists():
-            SparePartCount.objects.filter(
-                spare_part=instance.spare_part,
-                expiration_dt=instance.expiration_dt,
-            ).update(amount=Round(F("amount") - instance.count_supply, 2))
-            logger.info(
-                "Deleted Supply spare part. Updated amount for spare_part_id %s",
-                instance.spare_part,
+        record_movements(
+            movement(
+                instance,
+                instance.spare_part_id,
+                instance.expiration_dt,
+                -instance.count_supply,
+                "supply",
             )
-
-
-@receiver(pre_save, sender=SparePartShipmentM2M)
-def spare_part_m2m_pre_save(sender, instance, **kwargs):
-    """
-    Сохраняем старые значения перед сохранением, чтобы в post_save
-    можно было вычислить дельту изменений (количество, запчасть, срок годности).
-    """
-    if instance.pk:
-        try:
-            old = SparePartShipmentM2M.objects.get(pk=instance.pk)
-            instance._old_quantity = old.quantity
-            instance._old_expiration_dt = old.expiration_dt
-            instance._old_spare_part_id = old.spare_part_id
-        except SparePartShipmentM2M.DoesNotExist:
-            instance._old_quantity = 0
-            instance._old_expiration_dt = None
-            instance._old_spare_part_id = None
-    else:
-        instance._old_quantity = 0
-        instance._old_expiration_dt = None
-        instance._old_spare_part_id = None
+        )
 
 
 @receiver(post_save, sender=SparePartShipmentM2M)
 def spare_part_quantity_post_save(sender, instance, created, **kwargs):
-    """
-    Обновляет остатки SparePartCount при создании/изменении записи отгрузки.
-
-    - Новая запись (created=True): списывает quantity со склада.
-    - Изменение существующей (created=False):
-        1. Возвращает старый остаток (old_quantity, old_part, old_expiration).
-        2. Списывает новый остаток (new_quantity, new_part, new_expiration).
-      Такой подход корректно обрабатывает изменение количества, запчасти и срока.
-    """
-    new_quantity = instance.quantity
-    new_exp_dt = instance.expiration_dt
-    new_spare_part = instance.spare_part
-
-    old_quantity = getattr(instance, "_old_quantity", 0)
-    old_exp_dt = getattr(instance, "_old_expiration_dt", None)
-    old_spare_part_id = getattr(instance, "_old_spare_part_id", None)
-
-    if created:
-        # --- Новая запись: просто списываем ---
-        if new_quantity > 0:
-            SparePartCount.objects.filter(
-                spare_part=new_spare_part, expiration_dt=new_exp_dt
-            ).update(amount=Round(F("amount") - new_quantity, 2))
-            logger.info(
-                "Created M2M shipment. Part: %s, Qty: %s, Exp: %s, Shipment: %s",
-                new_spare_part.name,
-                new_quantity,
-                new_exp_dt,
-                instance.shipment_id,
-            )
-    else:
-        # --- Изменение существующей: возвращаем старое, списываем новое ---
-        # Шаг 1: возвращаем старый остаток
-        if old_quantity > 0 and old_spare_part_id:
-            try:
-                old_spare_part = SparePart.objects.get(pk=old_spare_part_id)
-                SparePartCount.objects.filter(
-                    spare_part=old_spare_part, expiration_dt=old_exp_dt
-                ).update(amount=Round(F("amount") + old_quantity, 2))
-                logger.info(
-                    "Returned old stock. Part: %s, Qty: %s, Exp: %s",
-                    old_spare_part.name,
-                    old_quantity,
-                    old_exp_dt,
-                )
-            except SparePart.DoesNotExist:
-                logger.error(
-                    "Old spare part (pk=%s) not found during update", old_spare_part_id
-                )
-
-        # Шаг 2: списываем новый остаток
-        if new_quantity > 0:
-            SparePartCount.objects.filter(
-                spare_part=new_spare_part, expiration_dt=new_exp_dt
-            ).update(amount=Round(F("amount") - new_quantity, 2))
-            logger.info(
-                "Deducted new stock. Part: %s, Qty: %s, Exp: %s, Shipment: %s",
-                new_spare_part.name,
-                new_quantity,
-                new_exp_dt,
-                instance.shipment_id,
-            )
+    """Списывает отгрузку; при изменении строки возвращает старое и списывает новое."""
+    _stock_change(instance, created, sign=-1, kind="shipment")
 
 
 @receiver(post_delete, sender=SparePartShipmentM2M)
 def spare_part_shipment_m2m_post_delete(sender, instance, **kwargs):
-    """
-    Восстанавливает количество запчастей при удалении связи ShipmentM2M.
-    """
-    spare_part = instance.spare_part
-    quantity = instance.quantity
-    expiration_dt = instance.expiration_dt
-
-    try:
-        # Восстанавливаем остаток с учетом срока годности
-        SparePartCount.objects.filter(
-            spare_part=spare_part, expiration_dt=expiration_dt
-        ).update(amount=Round(F("amount") + quantity, 2))
-
-        logger.info(
-            f"Restored {quantity} items of {spare_part.name} (exp: {expiration_dt}) after M2M deletion"
-        )
-
-    except SparePartCount.DoesNotExist:
-        logger.error(
-            f"SparePartCount not found for part {spare_part.name} with expiration {expiration_dt}"
-        )
-    except Exception as e:
-        logger.exception(f"Error restoring SparePartCount: {str(e)}")
+    """Возвращает на склад количество удалённой строки отгрузки."""
+    _stock_delete(instance, sign=-1, kind="shipment")
 
 
 # Сигналы post_save/post_delete для SparePartShipmentV2 удалены.
-# Учёт остатков полностью обслуживается сигналами модели SparePartShipmentM2M:
-#   - spare_part_quantity_post_save (списание при создании M2M-связи)
-#   - spare_part_shipment_m2m_post_delete (возврат при удалении M2M-связи)
+# Учёт остатков полностью обслуживается сигналами модели SparePartShipmentM2M.
 # Каскадное удаление SparePartShipmentV2 → SparePartShipmentM2M автоматически
 # восстанавливает остатки через сигнал post_delete на M2M.
 
 
+def _shipment_v1_movement(instance, sign):
+    count = (
+        SparePartCount.objects.filter(pk=instance.spare_part_count_id)
+        .values_list("spare_part_id", "expiration_dt")
+        .first()
+    )
+    if count is None:
+        return
+    record_movements(movement(instance, *count, sign * instance.count_shipment, "shipment"))
+
+
 @receiver(post_save, sender=SparePartShipment)
 def spare_part_shipment_post_save(sender, instance, created, **kwargs):
-    if created:
-        if instance.spare_part_count is None:
-            return
-        if instance.count_shipment > 0:
-            part = instance.spare_part_count
-            part_name = part.spare_part.name
-            part.amount = round(part.amount - instance.count_shipment, 2)
-            part.save()
-            logger.info(
-                "New Shipment spare part. Updated amount for spare_part %s", part_name
-            )
+    if created and instance.spare_part_count_id and instance.count_shipment > 0:
+        _shipment_v1_movement(instance, sign=-1)
 
 
 @receiver(post_delete, sender=SparePartShipment)
 def spare_part_shipment_post_delete(sender, instance, **kwargs):
-    if instance.spare_part_count is None:
-        return
-    if instance.count_shipment > 0:
-        part = instance.spare_part_count
-        part_name = part.spare_part.name
-        part.amount = round(part.amount + instance.count_shipment, 2)
-        part.save()
-        logger.info(
-            "Deleted Shipment spare part. Updated amount for spare_part_id %s",
-            part_name,
-        )
+    if instance.spare_part_count_id and instance.count_shipment > 0:
+        _shipment_v1_movement(instance, sign=+1)
 
 
 # --- SparePartSupplyItem signals (V2 supply) ---
 
 
-@receiver(pre_save, sender=SparePartSupplyItem)
-def supply_item_pre_save(sender, instance, **kwargs):
-    """Сохраняем старые значения для вычисления дельты при обновлении."""
-    if instance.pk:
-        try:
-            old = SparePartSupplyItem.objects.get(pk=instance.pk)
-            instance._old_quantity = old.quantity
-            instance._old_expiration_dt = old.expiration_dt
-            instance._old_spare_part_id = old.spare_part_id
-        except SparePartSupplyItem.DoesNotExist:
-            instance._old_quantity = 0
-            instance._old_expiration_dt = None
-            instance._old_spare_part_id = None
-    else:
-        instance._old_quantity = 0
-        instance._old_expiration_dt = None
-        instance._old_spare_part_id = None
-
-
 @receiver(post_save, sender=SparePartSupplyItem)
 def supply_item_post_save(sender, instance, created, **kwargs):
-    """Увеличивает остатки при поставке."""
-    new_quantity = instance.quantity
-    new_exp_dt = instance.expiration_dt
-    new_spare_part = instance.spare_part
-
-    old_quantity = getattr(instance, "_old_quantity", 0)
-    old_exp_dt = getattr(instance, "_old_expiration_dt", None)
-    old_spare_part_id = getattr(instance, "_old_spare_part_id", None)
-
-    if created:
-        if new_quantity > 0:
-            _add_supply_stock(new_spare_part, new_exp_dt, new_quantity)
-            logger.info(
-                "Supply item created. Part: %s, Qty: %s, Exp: %s",
-                new_spare_part.name,
-                new_quantity,
-                new_exp_dt,
-            )
-    else:
-        # Возвращаем старый остаток
-        if old_quantity > 0 and old_spare_part_id:
-            try:
-                old_spare_part = SparePart.objects.get(pk=old_spare_part_id)
-                SparePartCount.objects.filter(
-                    spare_part=old_spare_part, expiration_dt=old_exp_dt
-                ).update(amount=Round(F("amount") - old_quantity, 2))
-            except SparePart.DoesNotExist:
-                pass
-        # Добавляем новый остаток
-        if new_quantity > 0:
-            _add_supply_stock(new_spare_part, new_exp_dt, new_quantity)
-        logger.info(
-            "Supply item updated. Reversed old: Part=%s Qty=%s; Added new: Part=%s Qty=%s",
-            old_spare_part_id,
-            old_quantity,
-            new_spare_part.name,
-            new_quantity,
-        )
+    """Увеличивает остатки при поставке; при изменении строки — на разницу."""
+    _stock_change(instance, created, sign=+1, kind="supply")
 
 
 @receiver(post_delete, sender=SparePartSupplyItem)
 def supply_item_post_delete(sender, instance, **kwargs):
     """Уменьшает остатки при удалении строки поставки."""
-    quantity = instance.quantity
-    expiration_dt = instance.expiration_dt
-    spare_part = instance.spare_part
-
-    updated = SparePartCount.objects.filter(
-        spare_part=spare_part, expiration_dt=expiration_dt
-    ).update(amount=Round(F("amount") - quantity, 2))
-
-    if updated:
-        logger.info(
-            "Supply item deleted. Part: %s, Qty: %s, Exp: %s",
-            spare_part.name,
-            quantity,
-            expiration_dt,
-        )
-    else:
-        logger.warning(
-            "SparePartCount not found for part %s with expiration %s during supply item deletion",
-            spare_part.name,
-            expiration_dt,
+    _stock_delete(instance, sign=+1, kind="supply")
+
+
+@receiver(pre_save, sender=SparePartShipmentM2M)
+def spare_part_shipment_m2m_pre_save(sender, instance, **kwargs):
+    """Списывает слои FIFO под строку отгрузки и заполняет price по себестоимости.
+
+    Цена, введённая вручную, не меняется. При изменении строки
+    старое количество возвращается в слои, новое списывается.
+    """
+    part_id, exp_dt = stock_key(instance.spare_part_id, instance.expiration_dt)
+    loaded = None
+    if not instance._state.adding:
+        loaded = getattr(instance, "_loaded_stock", None) or (
+            SparePartShipmentM2M.objects.filter(pk=instance.pk)
+            .values_list("spare_part_id", "expiration_dt", "quantity")
+            .first()
         )
+    if loaded is not None:
+        old_key = stock_key(loaded[0], loaded[1])
+        if old_key == (part_id, exp_dt) and loaded[2] == instance.quantity and instance.price:
+            return
+        fifo.release([(*old_key, loaded[2])])
+    [cost] = fifo.consume([(part_id, exp_dt, instance.quantity)])
+    if instance.price is None or instance.price == 0:
+        instance.price = fifo.line_price(cost, instance.quantity)
+    instance.sum = Decimal(str(instance.quantity or 0)) * Decimal(str(instance.price or 0))
 
 
-def _add_supply_stock(spare_part, expiration_dt, quantity):
-    """Вспомогательная функция: увеличивает остаток запчасти."""
-    part = SparePartCount.objects.filter(
-        spare_part=spare_part, expiration_dt=expiration_dt
+@receiver(post_delete, sender=SparePartShipmentM2M)
+def spare_part_shipment_m2m_release_layers(sender, instance, **kwargs):
+    loaded = getattr(instance, "_loaded_stock", None) or (
+        instance.spare_part_id,
+        instance.expiration_dt,
+        instance.quantity,
     )
-    if part.exists():
-        part.update(amount=Round(F("amount") + quantity, 2))
-    else:
-        SparePartCount.objects.create(
-            spare_part=spare_part, amount=quantity, expiration_dt=expiration_dt
+    fifo.release([(*stock_key(loaded[0], loaded[1]), loaded[2])])
+
+
+@receiver(post_save, sender=SparePartSupplyItem)
+def supply_item_cost_layer(sender, instance, **kwargs):
+    fifo.sync_cost_layer(instance)
+
+
+@receiver(post_save, sender=SparePartSupplyV2)
+def supply_cost_layers_date(sender, instance, created, **kwargs):
+    """Дата поставки задаёт порядок списания слоёв FIFO."""
+    if not created:
+        SparePartCostLayer.objects.filter(supply_item__supply=instance).exclude(
+            supply_dt=instance.supply_dt
+        ).update(supply_dt=instance.supply_dt)
+
+
+@receiver(post_save, sender=SparePart)
+def spare_part_search_document(sender, instance, **kwargs):
+    refresh_search_documents(SparePart.objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=SparePart.equipment.through)
+def spare_part_equipment_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Наименования оборудования входят в поисковый документ запчасти."""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        refresh_search_documents(SparePart.objects.filter(pk=instance.pk))
+    elif pk_set:
+        refresh_search_documents(SparePart.objects.filter(pk__in=pk_set))
+
+
+@receiver(post_save, sender=Equipment)
+def equipment_spare_part_search_document(sender, instance, created, **kwargs):
+    if not created:
+        refresh_search_documents(SparePart.objects.filter(equipment=instance))
+
+
+@receiver(post_save, sender=SparePartShipmentM2M)
+@receiver(post_delete, sender=SparePartShipmentM2M)
+def spare_part_shipment_m2m_label(sender, instance, **kwargs):
+    shipment_labels.schedule(instance.shipment_id)
+
+
+@receiver(post_save, sender=SparePart)
+def spare_part_shipment_labels(sender, instance, created, **kwargs):
+    # Значения при загрузке из БД (SparePart.from_db); без них (запись не
+    # загружалась или поля были отложены) подписи пересчитываются всегда.
+    loaded = getattr(instance, "_label_fields", None)
+    if not created and loaded != (instance.name, instance.unit_id):
+        refresh_labels(
+            SparePartShipmentV2.objects.filter(shipment_m2m__spare_part=instance).distinct()
         )
+    instance.remember_label_fields()
 
 
-@receiver(pre_save, sender=SparePartShipmentM2M)
-def spare_part_shipment_m2m_pre_save(sender, instance, **kwargs):
-    """Заполняет price по FIFO и пересчитывает sum перед сохранением."""
-    if instance.price is None or instance.price == 0:
-        instance.price = get_fifo_price(instance.spare_part_id, instance.expiration_dt)
-    instance.sum = Decimal(str(instance.quantity or 0)) * Decimal(str(instance.price or 0))
+@receiver(post_save, sender=Unit)
+def unit_shipment_labels(sender, instance, created, **kwargs):
+    if not created:
+        refresh_labels(
+            SparePartShipmentV2.objects.filter(shipment_m2m__spare_part__unit=instance).distinct()
+        )
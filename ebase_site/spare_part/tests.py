@@ -1,6 +1,11 @@
+from datetime import date, timedelta
 from decimal import Decimal
+from unittest import mock
 
+from django.contrib import admin
+from django.db import DatabaseError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 
 from directory.models import Unit, City
@@ -9,8 +14,24 @@ from spare_part.models import (
     SparePart,
     SparePartSupplyV2,
     SparePartSupplyItem,
+    SparePartCostLayer,
     SparePartCount,
+    SparePartShipmentM2M,
+    SparePartShipmentV2,
+    SparePartStockMovement,
 )
+from spare_part.fifo import current_price, rebuild_cost_layers
+from spare_part.services import (
+    expiring_stock,
+    post_count_correction,
+    rebuild_stock_balances,
+    stock_batch,
+    sweep_expired_stock,
+    sync_shipment_lines,
+    verify_stock_balances,
+    with_stock_totals,
+)
+from utils.counts import row_counts
 
 
 User = get_user_model()
@@ -98,3 +119,362 @@ class SparePartSupplyV2Tests(TestCase):
         item.save()
         count.refresh_from_db()
         self.assertEqual(count.amount, 8)
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="pass")
+        self.unit = Unit.objects.create(short_name="шт.", full_name="штука")
+        self.part = SparePart.objects.create(
+            article="ART-002", name="Лампа", unit=self.unit
+        )
+        self.supply = SparePartSupplyV2.objects.create(
+            doc_num="SUP-010", supply_dt="2026-01-10", user=self.user
+        )
+
+    def add_item(self, quantity, expiration_dt=None):
+        return SparePartSupplyItem.objects.create(
+            supply=self.supply,
+            spare_part=self.part,
+            quantity=quantity,
+            price=100,
+            expiration_dt=expiration_dt,
+        )
+
+    def test_no_expiration_stock_is_single_row(self):
+        """Поставки без срока годности копятся в одной строке остатка."""
+        self.add_item(2)
+        self.add_item(3)
+        count = SparePartCount.objects.get(spare_part=self.part)
+        self.assertIsNone(count.expiration_dt)
+        self.assertEqual(count.amount, 5)
+        self.assertEqual(
+            SparePartStockMovement.objects.filter(spare_part=self.part).count(), 2
+        )
+
+    def test_batch_posts_movements_on_exit(self):
+        """Внутри stock_batch() остатки меняются только на выходе, одной пачкой."""
+        with stock_batch():
+            self.add_item(1, "2027-01-01")
+            self.add_item(2, "2027-01-01")
+            self.add_item(4)
+            self.assertFalse(SparePartCount.objects.exists())
+            self.assertFalse(SparePartStockMovement.objects.exists())
+        amounts = dict(
+            SparePartCount.objects.values_list("expiration_dt", "amount")
+        )
+        self.assertEqual(amounts, {date(2027, 1, 1): 3, None: 4})
+        self.assertEqual(SparePartStockMovement.objects.count(), 3)
+
+    def test_failed_posting_rolls_back_admin_save(self):
+        """Ошибка проведения движений в админке откатывает и строки поставки."""
+        model_admin = admin.site._registry[SparePartSupplyV2]
+        with mock.patch(
+            "spare_part.services._upsert_balances", side_effect=DatabaseError("сбой")
+        ), self.assertRaises(DatabaseError):
+            with model_admin._batch():
+                self.add_item(5)
+
+        self.assertFalse(SparePartSupplyItem.objects.exists())
+        self.assertFalse(SparePartStockMovement.objects.exists())
+        self.assertFalse(SparePartCount.objects.exists())
+
+    def test_update_moves_stock_between_expirations(self):
+        """Смена срока годности строки переносит количество между остатками."""
+        item = self.add_item(5, "2027-01-01")
+        item = SparePartSupplyItem.objects.get(pk=item.pk)
+        item.expiration_dt = "2027-02-01"
+        item.save()
+        amounts = dict(
+            SparePartCount.objects.values_list("expiration_dt", "amount")
+        )
+        self.assertEqual(amounts, {date(2027, 1, 1): 0, date(2027, 2, 1): 5})
+        self.assertEqual(verify_stock_balances(), [])
+
+    def test_unchanged_save_writes_no_movements(self):
+        item = self.add_item(5)
+        item.price = 200
+        item.save()
+        self.assertEqual(SparePartStockMovement.objects.count(), 1)
+
+    def test_verify_and_rebuild(self):
+        """Сверка находит остаток, изменённый мимо журнала, и исправляет его."""
+        self.add_item(5)
+        SparePartCount.objects.filter(spare_part=self.part).update(amount=7)
+        self.assertEqual(verify_stock_balances(), [(self.part.pk, None, 7, 5)])
+
+        self.assertEqual(rebuild_stock_balances(), 1)
+        self.assertEqual(SparePartCount.objects.get(spare_part=self.part).amount, 5)
+        self.assertEqual(verify_stock_balances(), [])
+
+    def test_manual_correction_is_logged(self):
+        """Ручная правка остатка записывается в журнал корректировкой."""
+        self.add_item(5)
+        count = SparePartCount.objects.get(spare_part=self.part)
+        loaded = count._loaded_stock
+        count.amount = 4
+        count.save()
+        post_count_correction(count, loaded)
+        self.assertEqual(verify_stock_balances(), [])
+        self.assertEqual(
+            SparePartStockMovement.objects.filter(kind="correction").count(), 2
+        )
+
+
+class SyncShipmentLinesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="pass")
+        self.unit = Unit.objects.create(short_name="шт.", full_name="штука")
+        self.parts = [
+            SparePart.objects.create(article=f"ART-1{i}", name=f"Фильтр {i}", unit=self.unit)
+            for i in range(3)
+        ]
+        supply = SparePartSupplyV2.objects.create(
+            doc_num="SUP-020", supply_dt="2026-01-10", user=self.user
+        )
+        for part in self.parts:
+            SparePartSupplyItem.objects.create(
+                supply=supply, spare_part=part, quantity=10, price=200
+            )
+        self.shipment = SparePartShipmentV2.objects.create(
+            doc_num="АВ-010", shipment_dt="2026-02-01", user=self.user
+        )
+
+    def amounts(self):
+        return dict(SparePartCount.objects.values_list("spare_part_id", "amount"))
+
+    def line(self, part, quantity):
+        # Форма ремонта передаёт строки JSON-ом: ID запчасти — строка
+        return {"id": str(part.pk), "quantity": quantity, "expiration_dt": ""}
+
+    def test_create_lines_with_fifo_price(self):
+        result = sync_shipment_lines(
+            self.shipment, [self.line(self.parts[0], 2), self.line(self.parts[1], 3)]
+        )
+        self.assertEqual(result, (2, 0, 0))
+        line = SparePartShipmentM2M.objects.get(spare_part=self.parts[1])
+        self.assertEqual(line.price, Decimal("200"))
+        self.assertEqual(line.sum, Decimal("600"))
+        self.assertEqual(
+            self.amounts(),
+            {self.parts[0].pk: 8, self.parts[1].pk: 7, self.parts[2].pk: 10},
+        )
+
+    def test_diff_updates_only_changed_lines(self):
+        """Повторное сохранение меняет только отличающиеся строки и остатки на разницу."""
+        sync_shipment_lines(
+            self.shipment, [self.line(self.parts[0], 2), self.line(self.parts[1], 3)]
+        )
+        kept = SparePartShipmentM2M.objects.get(spare_part=self.parts[0])
+
+        result = sync_shipment_lines(
+            self.shipment, [self.line(self.parts[0], 5), self.line(self.parts[2], 1)]
+        )
+        self.assertEqual(result, (1, 1, 1))
+        self.assertEqual(SparePartShipmentM2M.objects.get(spare_part=self.parts[0]).pk, kept.pk)
+        self.assertEqual(
+            set(self.shipment.shipment_m2m.values_list("spare_part_id", "quantity")),
+            {(self.parts[0].pk, 5), (self.parts[2].pk, 1)},
+        )
+        self.assertEqual(
+            self.amounts(),
+            {self.parts[0].pk: 5, self.parts[1].pk: 10, self.parts[2].pk: 9},
+        )
+        self.assertEqual(verify_stock_balances(), [])
+        # Удалённая строка вернула количество в слой FIFO через сигнал
+        self.assertEqual(
+            dict(SparePartCostLayer.objects.values_list("spare_part_id", "remaining")),
+            {self.parts[0].pk: 5, self.parts[1].pk: 10, self.parts[2].pk: 9},
+        )
+
+    def test_unchanged_lines_write_nothing(self):
+        lines = [self.line(part, 1) for part in self.parts]
+        sync_shipment_lines(self.shipment, lines)
+        line_ids = set(self.shipment.shipment_m2m.values_list("pk", flat=True))
+        remaining = sorted(SparePartCostLayer.objects.values_list("remaining", flat=True))
+        self.assertEqual(remaining, [9, 9, 9])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(sync_shipment_lines(self.shipment, lines), (0, 0, 0))
+        self.assertEqual(set(self.shipment.shipment_m2m.values_list("pk", flat=True)), line_ids)
+        self.assertEqual(
+            sorted(SparePartCostLayer.objects.values_list("remaining", flat=True)), remaining
+        )
+
+    def test_shipment_label_follows_lines(self):
+        sync_shipment_lines(
+            self.shipment, [self.line(self.parts[0], 2), self.line(self.parts[1], 3)]
+        )
+        self.shipment.refresh_from_db()
+        self.assertEqual(
+            self.shipment.label, "Отгрузка #АВ-010: Фильтр 0 - 2.0 шт., Фильтр 1 - 3.0 шт."
+        )
+
+        self.parts[1].name = "Фильтр тонкой очистки"
+        self.parts[1].save()
+        SparePartShipmentM2M.objects.get(spare_part=self.parts[0]).delete()
+        self.shipment.refresh_from_db()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                str(self.shipment), "Отгрузка #АВ-010: Фильтр тонкой очистки - 3.0 шт."
+            )
+
+    def test_part_save_reads_label_fields_from_load(self):
+        sync_shipment_lines(self.shipment, [self.line(self.parts[0], 2)])
+        part = SparePart.objects.get(pk=self.parts[0].pk)
+
+        # только UPDATE: прежние наименование и единица запомнены при загрузке
+        part.comment = "Без изменения подписи"
+        with self.assertNumQueries(1):
+            part.save()
+
+        part.name = "Фильтр грубой очистки"
+        part.save()
+        self.shipment.refresh_from_db()
+        self.assertEqual(self.shipment.label, "Отгрузка #АВ-010: Фильтр грубой очистки - 2.0 шт.")
+
+    def test_query_count_does_not_grow_with_lines(self):
+        # строки, слои FIFO (SELECT + UPDATE в savepoint), bulk_create,
+        # журнал и upsert остатков (в savepoint), подпись отгрузки
+        # (отгрузка, строки, UPDATE)
+        with self.assertNumQueries(13):
+            sync_shipment_lines(self.shipment, [self.line(part, 1) for part in self.parts])
+
+
+class FifoCostLayerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="tester", password="pass")
+        self.unit = Unit.objects.create(short_name="шт.", full_name="штука")
+        self.part = SparePart.objects.create(
+            article="ART-030", name="Кювета", unit=self.unit
+        )
+        for doc_num, supply_dt, price in (
+            ("SUP-031", "2026-02-01", 200),
+            ("SUP-030", "2026-01-01", 100),
+        ):
+            supply = SparePartSupplyV2.objects.create(
+                doc_num=doc_num, supply_dt=supply_dt, user=self.user
+            )
+            SparePartSupplyItem.objects.create(
+                supply=supply, spare_part=self.part, quantity=5, price=price
+            )
+        self.shipment = SparePartShipmentV2.objects.create(
+            doc_num="АВ-030", shipment_dt="2026-03-01", user=self.user
+        )
+
+    def ship(self, quantity):
+        return SparePartShipmentM2M.objects.create(
+            shipment=self.shipment, spare_part=self.part, quantity=quantity
+        )
+
+    def test_price_is_oldest_open_layer(self):
+        self.assertEqual(current_price(self.part.pk), Decimal("100"))
+
+    def test_shipment_consumes_layers_in_order(self):
+        """Строка, перекрывающая два слоя, получает среднюю себестоимость."""
+        line = self.ship(7)
+        self.assertEqual(line.price, Decimal("128.57"))
+        self.assertEqual(current_price(self.part.pk), Decimal("200"))
+        self.assertEqual(
+            list(self.part.cost_layers.order_by("supply_dt").values_list("remaining", flat=True)),
+            [0, 3],
+        )
+
+    def test_delete_and_update_return_stock_to_layers(self):
+        line = self.ship(7)
+        line = SparePartShipmentM2M.objects.get(pk=line.pk)
+        line.quantity = 3
+        line.save()
+        self.assertEqual(current_price(self.part.pk), Decimal("100"))
+        self.assertEqual(
+            list(self.part.cost_layers.order_by("supply_dt").values_list("remaining", flat=True)),
+            [2, 5],
+        )
+        line.delete()
+        self.assertEqual(
+            list(self.part.cost_layers.order_by("supply_dt").values_list("remaining", flat=True)),
+            [5, 5],
+        )
+
+    def test_rebuild_replays_shipments(self):
+        self.ship(6)
+        self.part.cost_layers.update(remaining=0)
+        self.assertEqual(rebuild_cost_layers(), 2)
+        self.assertEqual(
+            list(self.part.cost_layers.order_by("supply_dt").values_list("remaining", flat=True)),
+            [0, 4],
+        )
+
+
+class ExpirySweepTests(TestCase):
+    def setUp(self):
+        self.unit = Unit.objects.create(short_name="шт.", full_name="штука")
+        self.part = SparePart.objects.create(article="ART-040", name="Реагент", unit=self.unit)
+        self.today = date(2026, 5, 10)
+
+    def count(self, expiration_dt, amount=1, **kwargs):
+        return SparePartCount.objects.create(
+            spare_part=self.part, expiration_dt=expiration_dt, amount=amount, **kwargs
+        )
+
+    def test_sweep_flags_expired_once(self):
+        expired = self.count(self.today - timedelta(days=1))
+        fresh = self.count(self.today)
+        undated = self.count(None, is_overdue=True)
+
+        self.assertEqual(sweep_expired_stock(self.today), 2)
+        expired.refresh_from_db()
+        fresh.refresh_from_db()
+        undated.refresh_from_db()
+        self.assertTrue(expired.is_overdue)
+        self.assertFalse(fresh.is_overdue)
+        self.assertFalse(undated.is_overdue)
+        self.assertEqual(sweep_expired_stock(self.today), 0)
+
+    def test_expiring_report(self):
+        soon = self.count(self.today + timedelta(days=5))
+        self.count(self.today + timedelta(days=60))
+        self.count(self.today + timedelta(days=3), amount=0)
+        self.count(self.today - timedelta(days=1), is_overdue=True)
+        self.assertEqual(list(expiring_stock(30, self.today)), [soon])
+
+
+class SparePartStockTotalsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="admin", password="pass")
+        self.unit = Unit.objects.create(short_name="шт.", full_name="штука")
+        self.analyzer = Equipment.objects.create(full_name="Анализатор", short_name="А")
+        self.centrifuge = Equipment.objects.create(full_name="Центрифуга", short_name="Ц")
+        self.part = SparePart.objects.create(article="ART-050", name="Ротор", unit=self.unit)
+        self.part.equipment.add(self.analyzer, self.centrifuge)
+        SparePartCount.objects.create(spare_part=self.part, amount=1.5, expiration_dt=None)
+        SparePartCount.objects.create(
+            spare_part=self.part, amount=2, expiration_dt=date(2027, 1, 1)
+        )
+        self.empty = SparePart.objects.create(article="ART-051", name="Крышка", unit=self.unit)
+
+    def test_annotations(self):
+        with self.assertNumQueries(1):
+            parts = {part.pk: part for part in with_stock_totals(SparePart.objects.all())}
+        self.assertEqual(parts[self.part.pk].stock_amount, 3.5)
+        self.assertFalse(parts[self.part.pk].has_photo)
+        self.assertEqual(
+            sorted(parts[self.part.pk].equipment_names.split(", ")),
+            ["Анализатор", "Центрифуга"],
+        )
+        self.assertEqual(parts[self.empty.pk].stock_amount, 0)
+        self.assertEqual(parts[self.empty.pk].equipment_names, "")
+
+    def test_changelist_query_count_does_not_grow(self):
+        self.client.force_login(self.user)
+        url = "/admin/spare_part/sparepart/"
+        self.client.get(url)  # прогрев кэшей сессии и справочников
+        # Счётчики строк сбрасываются записью; оба замера — без их кэша
+        row_counts.clear()
+        with CaptureQueriesContext(connection) as before:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        for i in range(5):
+            SparePart.objects.create(article=f"ART-06{i}", name=f"Деталь {i}", unit=self.unit)
+        with CaptureQueriesContext(connection) as after:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(after), len(before))
@@ -1,6 +1,64 @@
+from contextlib import ExitStack
+
 from django.contrib import admin
+from django.db import router, transaction
+from utils.counts import CountedChangeList, CountedPaginator
+from utils.deferred import deferred_batch
 from utils.export_to_xlsx import export_to_excel_formatted
+from utils.keyset import KeysetPaginator
+from utils.list_filters import AutocompleteListFilter
 
 class MainModelAdmin(admin.ModelAdmin):
     list_per_page = 20
-    actions = [export_to_excel_formatted]
\ No newline at end of file
+    actions = [export_to_excel_formatted]
+    # Колонки list_display, которые при выгрузке в Excel берутся напрямую
+    # из поля (в т.ч. связанной модели): {"метод_админки": "путь__к__полю"}
+    export_fields = {}
+    # Листание больших списков курсором по колонкам сортировки и оценка
+    # числа строк планировщиком вместо COUNT(*) (utils.keyset)
+    keyset_pagination = False
+    # Число строк списка считается через utils.counts (кэш, оценка)
+    paginator = CountedPaginator
+
+    # Сохранение формы с инлайнами, удаление и действия над списком меняют
+    # много строк за раз: пересчёты из сигналов (итоги контрактов и т.п.)
+    # копятся и выполняются один раз после коммита (utils.deferred).
+    # Batch открывается внутри транзакции: накопленные движения остатков
+    # (spare_part.services.stock_batch) проводятся в той же транзакции,
+    # что и строки-основания, и откатываются вместе с ними.
+    def _batch(self):
+        stack = ExitStack()
+        stack.enter_context(transaction.atomic(using=router.db_for_write(self.model)))
+        stack.enter_context(deferred_batch())
+        return stack
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        with self._batch():
+            return super().changeform_view(request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        with self._batch():
+            return super().delete_view(request, object_id, extra_context)
+
+    def changelist_view(self, request, extra_context=None):
+        with self._batch():
+            return super().changelist_view(request, extra_context)
+
+    @property
+    def media(self):
+        media = super().media
+        # select2 для фильтров с поиском (utils.list_filters)
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, type) and issubclass(list_filter, AutocompleteListFilter):
+                media += list_filter.filter_media(self)
+        return media
+
+    def get_changelist(self, request, **kwargs):
+        return CountedChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if self.keyset_pagination:
+            return KeysetPaginator(
+                queryset, per_page, orphans, allow_empty_first_page, request=request
+            )
+        return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
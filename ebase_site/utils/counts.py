@@ -0,0 +1,208 @@
+"""Счётчики строк для списков админки и выгрузок.
+
+Каждый рендер списка админки делает минимум два ``COUNT(*)``: по
+отфильтрованному queryset и по всей таблице (``show_full_result_count``).
+На аннотированных queryset с JOIN-ами каждый такой COUNT стоит столько же,
+сколько выборка самой страницы.
+
+``row_counts.count(queryset)`` сначала спрашивает статистику PostgreSQL:
+для таблицы без условий — ``pg_class.reltuples``, для queryset с условиями
+— оценку планировщика (``EXPLAIN``). Если строк больше
+``settings.COUNT_ESTIMATE_THRESHOLD``, возвращается оценка. Иначе делается
+точный COUNT, и он кэшируется в процессе по (модель, отпечаток SQL-запроса)
+на ``settings.COUNT_CACHE_TTL`` секунд. В кэше не больше
+``settings.COUNT_CACHE_SIZE`` запросов: при записи вытесняются
+просроченные и самые старые счётчики.
+
+Кэш модели сбрасывается сигналами post_save/post_delete в том процессе,
+где запись изменили; массовые ``update()`` и другие воркеры gunicorn
+подхватываются по истечении TTL.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import EmptyResultSet
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.paginator import InvalidPage, Paginator
+from django.db import connections
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import cached_property
+
+
+class RowCounts:
+    def __init__(self):
+        # (модель, отпечаток) -> (время, число); порядок — по времени записи
+        self._counts = OrderedDict()
+        # модель -> её ключи в ``_counts``, чтобы сброс не обходил весь кэш
+        self._keys_by_model = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.estimates = 0
+
+    @staticmethod
+    def _label(model):
+        return model._meta.label
+
+    def _key(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        fingerprint = hashlib.sha1(f"{queryset.db}:{sql}:{params!r}".encode()).hexdigest()
+        return self._label(queryset.model), fingerprint
+
+    def _discard(self, key):
+        self._counts.pop(key, None)
+        keys = self._keys_by_model.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_model[key[0]]
+
+    def _store(self, key, value):
+        now = time.monotonic()
+        self._discard(key)
+        self._counts[key] = (now, value)
+        self._keys_by_model.setdefault(key[0], set()).add(key)
+        # Записи упорядочены по времени: просроченные и лишние — в начале
+        while self._counts:
+            oldest, (stored, _) = next(iter(self._counts.items()))
+            expired = now - stored >= settings.COUNT_CACHE_TTL
+            if not expired and len(self._counts) <= settings.COUNT_CACHE_SIZE:
+                break
+            self._discard(oldest)
+
+    @staticmethod
+    def estimate(queryset):
+        """Оценка числа строк по статистике PostgreSQL или None."""
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return None
+        if not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # -1 — таблица ещё ни разу не анализировалась
+            if row and row[0] >= 0:
+                return int(row[0])
+        plan = json.loads(queryset.explain(format="json"))
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def count(self, queryset, estimate=True):
+        """Число строк queryset: (значение, это оценка).
+
+        :param estimate: можно ли вернуть оценку вместо точного числа
+        """
+        queryset = queryset.order_by()
+        try:
+            key = self._key(queryset)
+        except EmptyResultSet:
+            return 0, False
+
+        entry = self._counts.get(key)
+        if entry is not None and time.monotonic() - entry[0] < settings.COUNT_CACHE_TTL:
+            self.hits += 1
+            return entry[1], False
+
+        if estimate:
+            rows = self.estimate(queryset)
+            if rows is not None and rows > settings.COUNT_ESTIMATE_THRESHOLD:
+                self.estimates += 1
+                return rows, True
+
+        value = queryset.count()
+        with self._lock:
+            self.misses += 1
+            self._store(key, value)
+        return value, False
+
+    def invalidate(self, model):
+        label = self._label(model)
+        # Сигналы приходят на запись любой модели; без счётчиков — без блокировки
+        if label not in self._keys_by_model:
+            return
+        with self._lock:
+            for key in self._keys_by_model.pop(label, ()):
+                self._counts.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+            self._keys_by_model.clear()
+        self.hits = self.misses = self.estimates = 0
+
+    def stats(self) -> dict:
+        """Сколько раз ответ взят из кэша, посчитан COUNT-ом или оценён."""
+        return {"hits": self.hits, "misses": self.misses, "estimates": self.estimates}
+
+
+row_counts = RowCounts()
+
+
+def invalidate_row_counts(sender, **kwargs):
+    row_counts.invalidate(sender)
+
+
+post_save.connect(invalidate_row_counts, dispatch_uid="utils.counts")
+post_delete.connect(invalidate_row_counts, dispatch_uid="utils.counts")
+
+
+class CountedPaginator(Paginator):
+    """Paginator, считающий строки через ``row_counts``.
+
+    Оценка вместо точного числа допустима только при листании курсором
+    (``allow_estimate``): номера страниц OFFSET-пагинации по оценке
+    не дошли бы до последних строк.
+    """
+
+    allow_estimate = False
+    estimated = False
+
+    @cached_property
+    def count(self):
+        value, self.estimated = row_counts.count(self.object_list, self.allow_estimate)
+        return value
+
+
+class CountedChangeList(ChangeList):
+    """ChangeList, считающий всю таблицу через ``row_counts``.
+
+    Повторяет ``ChangeList.get_results``: там ``root_queryset.count()``
+    вызывается напрямую.
+    """
+
+    def get_results(self, request):
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        result_count = paginator.count
+
+        if self.model_admin.show_full_result_count:
+            full_result_count = row_counts.count(self.root_queryset)[0]
+        else:
+            full_result_count = None
+        can_show_all = result_count <= self.list_max_show_all
+        multi_page = result_count > self.list_per_page
+
+        if (self.show_all and can_show_all) or not multi_page:
+            result_list = self.queryset._clone()
+        else:
+            try:
+                result_list = paginator.page(self.page_num).object_list
+            except InvalidPage:
+                raise IncorrectLookupParameters
+
+        self.result_count = result_count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.show_admin_actions = not self.show_full_result_count or bool(
+            full_result_count
+        )
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = can_show_all
+        self.multi_page = multi_page
+        self.paginator = paginator
@@ -0,0 +1,100 @@
+"""Отложенные пересчёты с объединением повторов.
+
+Сигналы моделей часто вызывают один и тот же тяжёлый пересчёт много раз
+за одну операцию: сохранение ремонта с N строками отгрузки пересчитывает
+один и тот же контракт 2N+2 раз. ``CoalescingScheduler`` внутри ``batch()``
+только запоминает ключи (например, ID контрактов), а на выходе
+из внешнего ``batch()`` вызывает обработчик один раз со всеми ключами —
+в ``transaction.on_commit``, если идёт транзакция, иначе сразу.
+
+Вне ``batch()`` пересчёт выполняется сразу, как и раньше.
+Состояние хранится в ``threading.local`` (под gevent — на гринлет).
+"""
+import threading
+from contextlib import ExitStack, contextmanager
+
+from django.db import transaction
+
+# Фабрики batch-контекстов, которые открывает deferred_batch()
+_batch_factories = []
+
+
+def register_batch(factory):
+    """Регистрирует контекстный менеджер для deferred_batch()."""
+    _batch_factories.append(factory)
+    return factory
+
+
+class CoalescingScheduler:
+    def __init__(self, name, handler):
+        """
+        :param name: имя для логов и статистики.
+        :param handler: handler(keys) — выполняет пересчёт для набора ключей.
+        """
+        self.name = name
+        self.handler = handler
+        self._local = threading.local()
+        # Счётчики процесса: сколько ключей запланировано, сколько повторов
+        # поглотил batch и сколько раз реально вызван обработчик.
+        self.scheduled = 0
+        self.coalesced = 0
+        self.flushes = 0
+        register_batch(self.batch)
+
+    def _state(self):
+        local = self._local
+        if not hasattr(local, "depth"):
+            local.depth = 0
+            local.pending = set()
+        return local
+
+    @property
+    def active(self) -> bool:
+        return self._state().depth > 0
+
+    def schedule(self, *keys):
+        keys = {key for key in keys if key is not None}
+        if not keys:
+            return
+        state = self._state()
+        self.scheduled += len(keys)
+        if not state.depth:
+            self._run(keys)
+            return
+        self.coalesced += len(keys & state.pending)
+        state.pending |= keys
+
+    @contextmanager
+    def batch(self):
+        state = self._state()
+        state.depth += 1
+        try:
+            yield self
+        finally:
+            state.depth -= 1
+            if not state.depth and state.pending:
+                keys, state.pending = state.pending, set()
+                transaction.on_commit(lambda: self._run(keys))
+
+    def _run(self, keys):
+        self.flushes += 1
+        self.handler(keys)
+
+    def stats(self) -> dict:
+        return {
+            "scheduled": self.scheduled,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+        }
+
+    def reset_stats(self):
+        self.scheduled = self.coalesced = self.flushes = 0
+
+
+@contextmanager
+def deferred_batch():
+    """Открывает все зарегистрированные batch-контексты."""
+    with ExitStack() as stack:
+        for factory in _batch_factories:
+            stack.enter_context(factory())
+        yield
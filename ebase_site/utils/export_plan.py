@@ -0,0 +1,231 @@
+"""План колонок выгрузки в Excel для ModelAdmin.
+
+План строится один раз на класс админки и ``list_display``: для каждой
+колонки заранее определяются заголовок, способ получения значения
+и форматтер по типу поля. Колонки-методы админки, которые лишь
+показывают поле связанной модели, выгружаются напрямую по пути к полю
+из ``ModelAdmin.export_fields``, например::
+
+    export_fields = {"client_display": "client__name"}
+
+По путям к полям план сам собирает ``select_related``/``prefetch_related``,
+чтобы выгрузка не делала запросов на каждую строку.
+"""
+from typing import Callable, NamedTuple
+
+from django.contrib.admin.utils import label_for_field
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils.html import strip_tags
+
+# Разделитель значений многозначных связей (M2M, обратные FK)
+MULTI_VALUE_SEPARATOR = "; "
+
+
+def format_value(value) -> str:
+    """Приводит значение произвольного типа к строке выгрузки."""
+    if hasattr(value, "strftime"):  # date и datetime
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "Да" if value else "Нет"
+    if hasattr(value, "__html__"):  # Для mark_safe объектов
+        return strip_tags(str(value))
+    return str(value)
+
+
+def _format_date(value) -> str:
+    return "" if value is None else value.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _format_bool(value) -> str:
+    if value is None:
+        return ""
+    return "Да" if value else "Нет"
+
+
+def _format_str(value) -> str:
+    return "" if value is None else str(value)
+
+
+def _formatter_for_field(field) -> Callable:
+    if field.choices:
+        labels = {key: str(label) for key, label in field.flatchoices}
+        return lambda value: "" if value is None else labels.get(value, str(value))
+    if isinstance(field, (models.DateField, models.DateTimeField)):
+        return _format_date
+    if isinstance(field, models.BooleanField):
+        return _format_bool
+    return _format_str
+
+
+class ExportColumn(NamedTuple):
+    header: str
+    # getter(modeladmin, obj) -> значение ячейки до форматирования
+    getter: Callable
+    formatter: Callable
+
+
+class ExportPlan:
+    """Скомпилированный план колонок и нужные им связи."""
+
+    def __init__(self, columns, select_related, prefetch_related):
+        self.columns = columns
+        self.select_related = tuple(sorted(select_related))
+        self.prefetch_related = tuple(sorted(prefetch_related))
+
+    @property
+    def headers(self) -> list:
+        return [column.header for column in self.columns]
+
+    def apply(self, queryset):
+        """Добавляет в queryset связи, которые нужны колонкам плана."""
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
+    def row(self, modeladmin, obj) -> list:
+        row = []
+        for column in self.columns:
+            try:
+                row.append(column.formatter(column.getter(modeladmin, obj)))
+            except Exception as e:
+                row.append(f"Error: {str(e)}")
+        return row
+
+
+def _path_getter(parts, multi_flags):
+    """Getter по пути ``a__b__c``: None в цепочке даёт None,
+    многозначные связи собираются в строку через разделитель."""
+
+    def resolve(obj, index):
+        for i in range(index, len(parts)):
+            if obj is None:
+                return None
+            if multi_flags[i]:
+                values = (
+                    resolve(related, i + 1) for related in getattr(obj, parts[i]).all()
+                )
+                return [value for value in values if value not in (None, "")]
+            obj = getattr(obj, parts[i])
+        return obj
+
+    def getter(modeladmin, obj):
+        return resolve(obj, 0)
+
+    return getter
+
+
+def _compile_path(model, path):
+    """Разбирает путь к полю модели.
+
+    Возвращает getter, форматтер и связи для select_related/prefetch_related.
+    """
+    parts = path.split("__")
+    multi_flags = []
+    select_related, prefetch_related = set(), set()
+    is_multi = False
+    field = None
+    for i, part in enumerate(parts):
+        field = model._meta.get_field(part)
+        multi = field.many_to_many or field.one_to_many
+        multi_flags.append(multi)
+        is_multi = is_multi or multi
+        if field.is_relation:
+            lookup = "__".join(parts[: i + 1])
+            if is_multi:
+                prefetch_related.discard("__".join(parts[:i]))
+                prefetch_related.add(lookup)
+            else:
+                select_related.add(lookup)
+            model = field.related_model
+
+    formatter = _format_str if field.is_relation else _formatter_for_field(field)
+    if is_multi:
+        item_formatter = formatter
+        formatter = lambda values: MULTI_VALUE_SEPARATOR.join(  # noqa: E731
+            item_formatter(value) for value in values
+        )
+    # select_related нужен только на самую длинную цепочку
+    select_related = {
+        lookup
+        for lookup in select_related
+        if not any(other.startswith(lookup + "__") for other in select_related)
+    }
+    return _path_getter(parts, multi_flags), formatter, select_related, prefetch_related
+
+
+def _admin_attr_getter(attr):
+    if callable(attr):
+        return lambda modeladmin, obj: attr(modeladmin, obj)
+    return lambda modeladmin, obj: attr
+
+
+def _callable_getter(func):
+    return lambda modeladmin, obj: func(obj)
+
+
+def _model_attr_getter(name):
+    def getter(modeladmin, obj):
+        value = getattr(obj, name)
+        return value() if callable(value) else value
+
+    return getter
+
+
+def build_export_plan(modeladmin) -> ExportPlan:
+    model = modeladmin.model
+    export_fields = getattr(modeladmin, "export_fields", {}) or {}
+    columns = []
+    select_related, prefetch_related = set(), set()
+
+    for name in modeladmin.list_display:
+        if name == "action_checkbox":
+            continue  # Пропускаем чекбокс для выбора
+        header = str(label_for_field(name, model, modeladmin))
+
+        path = export_fields.get(name)
+        if path is None and isinstance(name, str):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                pass
+            else:
+                if field.concrete and not field.many_to_many:
+                    path = name
+
+        if path is not None:
+            getter, formatter, sr, pr = _compile_path(model, path)
+            select_related |= sr
+            prefetch_related |= pr
+        elif callable(name):
+            getter, formatter = _callable_getter(name), format_value
+        elif name == "__str__":
+            getter, formatter = _callable_getter(str), _format_str
+        elif hasattr(type(modeladmin), name):
+            attr = getattr(type(modeladmin), name)
+            getter = _admin_attr_getter(attr)
+            formatter = _format_bool if getattr(attr, "boolean", False) else format_value
+        elif hasattr(model, name):
+            getter, formatter = _model_attr_getter(name), format_value
+        else:
+            getter, formatter = _admin_attr_getter(None), format_value
+
+        columns.append(ExportColumn(header, getter, formatter))
+
+    return ExportPlan(columns, select_related, prefetch_related)
+
+
+_plans = {}
+
+
+def get_export_plan(modeladmin) -> ExportPlan:
+    """План для админки; строится один раз на процесс."""
+    key = (type(modeladmin), tuple(modeladmin.list_display))
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = build_export_plan(modeladmin)
+    return plan
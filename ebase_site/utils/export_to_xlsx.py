@@ -1,111 +1,238 @@
-from django.http import HttpResponse
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
-from django.contrib import admin
+"""Выгрузка записей changelist-а админки в Excel.
+
+Файл формируется потоково: записи читаются из БД порциями
+(``queryset.iterator``), каждая строка сразу сериализуется в XML листа
+и через zip-поток отдаётся клиенту ``StreamingHttpResponse``. В памяти
+держится только текущая порция записей, поэтому выгрузка десятков тысяч
+строк не раздувает воркер, а первые байты уходят клиенту сразу и gunicorn
+не обрывает запрос по таймауту.
+
+Книга пишется в режиме "только запись" без openpyxl-объектов ячеек:
+строки — inline-строки, стиль один (жирный заголовок по центру).
+"""
+import zipfile
+from itertools import chain, islice
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.html import format_html
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter
+
+from utils.counts import row_counts
+from utils.export_plan import get_export_plan
+
+
+XLSX_CONTENT_TYPE = (
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+)
+# Сколько записей забирать из БД за один запрос.
+EXPORT_CHUNK_SIZE = 2000
+# По скольким первым строкам считается ширина колонок: в XML листа блок
+# <cols> стоит до данных, поэтому ширину нужно знать до первой строки.
+WIDTH_SAMPLE_ROWS = EXPORT_CHUNK_SIZE
+MAX_COLUMN_WIDTH = 50
+# Через сколько строк сбрасывать накопленные байты клиенту.
+FLUSH_EVERY_ROWS = 500
+
+SHEET_TITLE = "Data"
+SHEET_PATH = "xl/worksheets/sheet1.xml"
+
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+_STATIC_PARTS = (
+    (
+        "[Content_Types].xml",
+        _XML_HEAD
+        + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        "</Types>",
+    ),
+    (
+        "_rels/.rels",
+        _XML_HEAD
+        + f'<Relationships xmlns="{_PKG_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>",
+    ),
+    (
+        "xl/workbook.xml",
+        _XML_HEAD
+        + f'<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}"><sheets>'
+        f'<sheet name="{SHEET_TITLE}" sheetId="1" r:id="rId1"/>'
+        "</sheets></workbook>",
+    ),
+    (
+        "xl/_rels/workbook.xml.rels",
+        _XML_HEAD
+        + f'<Relationships xmlns="{_PKG_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{_REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{_REL_NS}/styles" Target="styles.xml"/>'
+        "</Relationships>",
+    ),
+    (
+        "xl/styles.xml",
+        _XML_HEAD
+        + f'<styleSheet xmlns="{_MAIN_NS}">'
+        '<fonts count="2">'
+        '<font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="12"/><name val="Calibri"/></font>'
+        "</fonts>"
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1" applyAlignment="1">'
+        '<alignment horizontal="center"/></xf>'
+        "</cellXfs>"
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        "</styleSheet>",
+    ),
+)
+
+_HEADER_STYLE = 1
+
+
+class ZipStream:
+    """Непозиционируемый приёмник для ``zipfile``: копит байты до выдачи.
+
+    ``zipfile`` умеет писать в поток без ``seek`` (размеры пишутся
+    в data descriptor после каждого файла), поэтому архив можно отдавать
+    клиенту по мере формирования.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _cell_text(value) -> str:
+    return ILLEGAL_CHARACTERS_RE.sub("", str(value))
+
+
+def _row_xml(row_num: int, values, style: int = 0) -> str:
+    style_attr = f' s="{style}"' if style else ""
+    cells = "".join(
+        f'<c r="{get_column_letter(col)}{row_num}" t="inlineStr"{style_attr}>'
+        f'<is><t xml:space="preserve">{escape(_cell_text(value))}</t></is></c>'
+        for col, value in enumerate(values, 1)
+    )
+    return f'<row r="{row_num}">{cells}</row>'
+
+
+def _cols_xml(widths) -> str:
+    cols = "".join(
+        f'<col min="{col}" max="{col}" width="{width}" customWidth="1"/>'
+        for col, width in enumerate(widths, 1)
+    )
+    return f"<cols>{cols}</cols>" if cols else ""
+
+
+def iter_xlsx(headers, rows):
+    """Генерирует байты xlsx-файла с одним листом.
+
+    :param headers: заголовки колонок.
+    :param rows: итерируемое строк (списков строковых значений); читается
+        один раз и целиком в память не загружается.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _STATIC_PARTS:
+            archive.writestr(name, content)
+        yield stream.drain()
+
+        # Ширина колонок набирается по заголовку и первой порции строк.
+        rows = iter(rows)
+        head = list(islice(rows, WIDTH_SAMPLE_ROWS))
+        widths = [len(str(header)) for header in headers]
+        for row in head:
+            for col, value in enumerate(row):
+                widths[col] = max(widths[col], len(value))
+        widths = [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+        with archive.open(SHEET_PATH, "w", force_zip64=True) as sheet:
+            sheet.write(
+                (
+                    _XML_HEAD
+                    + f'<worksheet xmlns="{_MAIN_NS}">'
+                    + _cols_xml(widths)
+                    + "<sheetData>"
+                    + _row_xml(1, headers, style=_HEADER_STYLE)
+                ).encode()
+            )
+            for row_num, row in enumerate(chain(head, rows), 2):
+                sheet.write(_row_xml(row_num, row).encode())
+                if row_num % FLUSH_EVERY_ROWS == 0:
+                    yield stream.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield stream.drain()
+
+
+def get_export_headers(modeladmin) -> list:
+    """Заголовки колонок выгрузки по ``list_display`` админки."""
+    return get_export_plan(modeladmin).headers
+
+
+def export_rows(modeladmin, objects):
+    """Строки выгрузки для итерируемого объектов."""
+    plan = get_export_plan(modeladmin)
+    for obj in objects:
+        yield plan.row(modeladmin, obj)
+
+
+def iter_export_rows(modeladmin, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Строки выгрузки; записи читаются из БД порциями по ``chunk_size``."""
+    queryset = get_export_plan(modeladmin).apply(queryset)
+    return export_rows(modeladmin, queryset.iterator(chunk_size=chunk_size))
 
 
 def export_to_excel_formatted(modeladmin, request, queryset):
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="medsil_service.xlsx"'
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Data"
-
-    # Стили для заголовков
-    header_font = Font(bold=True, size=12)
-    center_aligned = Alignment(horizontal='center')
-
-    # Получаем заголовки из list_display модели админки
-    headers = []
-    for field_name in modeladmin.list_display:
-        if field_name == 'action_checkbox':
-            continue  # Пропускаем чекбокс для выбора
-        
-        # Получаем читаемое название поля
-        try:
-            field = modeladmin.model._meta.get_field(field_name)
-            header = field.verbose_name
-        except:
-            # Для методов или специальных полей
-            if hasattr(modeladmin, field_name):
-                attr = getattr(modeladmin, field_name)
-                if hasattr(attr, 'short_description'):
-                    header = attr.short_description
-                else:
-                    header = field_name.replace('_', ' ').title()
-            else:
-                header = field_name.replace('_', ' ').title()
-        
-        headers.append(str(header))
-
-    # Записываем заголовки
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=str(header))
-        cell.font = header_font
-        cell.alignment = center_aligned
-
-    # Данные
-    for row, obj in enumerate(queryset, 2):
-        col_num = 1
-        for field_name in modeladmin.list_display:
-            if field_name == 'action_checkbox':
-                continue
-            
-            try:
-                # Для полей, которые являются методами админ-класса, получаем полные данные из модели
-                if field_name == 'comment_short':
-                    # Получаем полный комментарий напрямую из поля модели
-                    value = obj.comment if hasattr(obj, 'comment') else ''
-                else:
-                    # Пытаемся получить значение через метод админ-класса
-                    if hasattr(modeladmin, field_name):
-                        admin_method = getattr(modeladmin, field_name)
-                        if callable(admin_method):
-                            value = admin_method(obj)
-                        else:
-                            value = admin_method
-                    # Если нет метода в админ-классе, получаем значение из объекта
-                    elif hasattr(obj, field_name):
-                        value = getattr(obj, field_name)
-                        # Если это callable (метод модели), вызываем его
-                        if callable(value):
-                            value = value()
-                    else:
-                        value = None
-                
-                # Форматируем специальные типы данных
-                if hasattr(value, 'strftime'):  # datetime объекты
-                    value = value.strftime('%Y-%m-%d %H:%M:%S')
-                elif value is None:
-                    value = ''
-                elif isinstance(value, bool):
-                    value = 'Да' if value else 'Нет'
-                elif hasattr(value, '__html__'):  # Для mark_safe объектов
-                    from django.utils.html import strip_tags
-                    value = strip_tags(str(value))
-                
-                ws.cell(row=row, column=col_num, value=str(value))
-                
-            except Exception as e:
-                ws.cell(row=row, column=col_num, value=f"Error: {str(e)}")
-            
-            col_num += 1
-
-    # Авто-ширина колонок
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)  # Ограничиваем максимальную ширину
-        ws.column_dimensions[column_letter].width = adjusted_width
-
-    wb.save(response)
+    # Большие выгрузки не держат веб-воркер: задание уходит в очередь,
+    # файл формирует `manage.py run_export_worker`.
+    if row_counts.count(queryset)[0] > settings.EXPORT_BACKGROUND_THRESHOLD:
+        from exports.services import enqueue_export
+
+        enqueue_export(modeladmin, request, queryset)
+        modeladmin.message_user(
+            request,
+            format_html(
+                "Выгрузка поставлена в очередь. Файл появится в разделе "
+                '<a href="{}">«Выгрузки в Excel»</a>.',
+                reverse("admin:exports_exportjob_changelist"),
+            ),
+        )
+        return None
+
+    response = StreamingHttpResponse(
+        iter_xlsx(
+            get_export_headers(modeladmin),
+            iter_export_rows(modeladmin, queryset),
+        ),
+        content_type=XLSX_CONTENT_TYPE,
+    )
+    response["Content-Disposition"] = 'attachment; filename="medsil_service.xlsx"'
     return response
 
 
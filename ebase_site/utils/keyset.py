@@ -0,0 +1,238 @@
+"""Keyset-пагинация (seek) для больших списков админки.
+
+Стандартный Paginator листает через ``OFFSET`` — чем дальше страница, тем
+больше строк база перебирает впустую — и на каждый запрос делает полный
+``COUNT(*)`` по отфильтрованному queryset с его JOIN-ами. ``KeysetPaginator``
+вместо номера страницы передаёт в параметре ``p`` курсор — значения
+колонок сортировки последней (или первой) строки страницы — и следующая
+страница выбирается условием ``WHERE (колонки) > (курсор)``. Время выборки
+не зависит от глубины страницы.
+
+Общее число строк берётся из ``utils.counts``: для больших выборок —
+оценка по статистике PostgreSQL, для небольших — кэшированный ``COUNT``.
+
+Курсор живёт в ``p``: ChangeList сам убирает этот параметр из фильтров
+и из ссылок фильтров, сортировки и ``date_hierarchy``, так что при их
+смене список начинается с первой страницы. Если сортировка не сводится
+к колонкам (выражения, ранг поиска), листание идёт обычным ``OFFSET``.
+"""
+import base64
+import binascii
+import json
+
+from django.core.paginator import InvalidPage, Page
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+
+from utils.counts import CountedPaginator
+
+PAGE_VAR = "p"
+# Направления курсора: строки после курсора и строки до него
+NEXT, PREVIOUS = "n", "b"
+
+
+def _expand_ordering(opts, name, descending, seen=()):
+    """Раскрывает часть сортировки до колонок.
+
+    Сортировка по связи (``equipment_accounting``) в Django означает
+    сортировку по ``Meta.ordering`` связанной модели, а без неё — по её pk.
+    """
+    *path, last = name.split("__")
+    model_opts = opts
+    for part in path:
+        model_opts = model_opts.get_field(part).related_model._meta
+    if last == "pk":
+        return [(name, descending)]
+    field = model_opts.get_field(last)
+    if not field.is_relation or last == field.attname != field.name:
+        return [(name, descending)]
+    if not field.concrete:
+        raise ValueError(name)
+
+    related = field.related_model._meta
+    if related.ordering and related.label not in seen:
+        result = []
+        for item in related.ordering:
+            if not isinstance(item, str) or item == "?":
+                raise ValueError(item)
+            sub_desc = item.startswith("-")
+            result += _expand_ordering(
+                opts,
+                f"{name}__{item.lstrip('-')}",
+                descending != sub_desc,
+                (*seen, related.label),
+            )
+        return result
+    return [(f"{name}__pk", descending)]
+
+
+def keyset_columns(queryset):
+    """Колонки сортировки queryset: [(путь, по убыванию)] или None.
+
+    None — сортировка содержит выражения или аннотации и для keyset
+    не подходит.
+    """
+    query = queryset.query
+    if not query.order_by or not query.standard_ordering:
+        return None
+    columns = []
+    for item in query.order_by:
+        if not isinstance(item, str) or item == "?":
+            return None
+        name = item.lstrip("-")
+        if name.split("__")[0] in query.annotations:
+            return None
+        try:
+            columns += _expand_ordering(query.model._meta, name, item.startswith("-"))
+        except Exception:
+            return None
+    return columns
+
+
+def _after(path, value, descending, nulls_largest):
+    """Условие «строка идёт после ``value``» для одной колонки."""
+    nothing = Q(pk__in=[])
+    # NULL при сортировке — наибольшее или наименьшее значение в зависимости
+    # от СУБД; «после» по возрастанию совпадает с «больше»
+    null_is_after = nulls_largest != descending
+    if value is None:
+        return nothing if null_is_after else Q(**{f"{path}__isnull": False})
+    lookup = "lt" if descending else "gt"
+    condition = Q(**{f"{path}__{lookup}": value})
+    if null_is_after:
+        condition |= Q(**{f"{path}__isnull": True})
+    return condition
+
+
+def _equal(path, value):
+    if value is None:
+        return Q(**{f"{path}__isnull": True})
+    return Q(**{path: value})
+
+
+def seek_condition(columns, values, nulls_largest, forward=True) -> Q:
+    """Условие для строк после (``forward``) или до курсора ``values``."""
+    condition = Q(pk__in=[])
+    equal = Q()
+    for (path, descending), value in zip(columns, values):
+        after = _after(path, value, descending != (not forward), nulls_largest)
+        condition |= equal & after
+        equal &= _equal(path, value)
+    return condition
+
+
+def encode_cursor(direction, values) -> str:
+    data = json.dumps(values, cls=DjangoJSONEncoder, separators=(",", ":"))
+    return direction + base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """(направление, значения) из параметра ``p`` или None, если это не курсор."""
+    if not token or token[0] not in (NEXT, PREVIOUS) or len(token) < 2:
+        return None
+    data = token[1:]
+    try:
+        values = json.loads(base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)))
+    except (binascii.Error, ValueError) as e:
+        raise InvalidPage("Некорректный курсор страницы") from e
+    if not isinstance(values, list):
+        raise InvalidPage("Некорректный курсор страницы")
+    return token[0], values
+
+
+class KeysetPage(Page):
+    def __init__(self, object_list, number, paginator, next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, number, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class KeysetPaginator(CountedPaginator):
+    """Paginator для ChangeList: курсор берётся из ``request.GET["p"]``.
+
+    Запрошенная по номеру страница, кроме первой, отдаётся обычным OFFSET.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, request=None):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.request = request
+        self.columns = keyset_columns(object_list)
+        self.current_page = None
+
+    @property
+    def keyset(self) -> bool:
+        """Листание курсором (иначе — обычный OFFSET)."""
+        return self.columns is not None
+
+    @property
+    def allow_estimate(self):
+        return self.keyset
+
+    def page(self, number):
+        token = self.request.GET.get(PAGE_VAR) if self.request else None
+        cursor = decode_cursor(token)
+        # Номер страницы вместо курсора: старые ссылки ChangeList (?p=3)
+        # и autocomplete админки, который листает своим параметром page
+        if not self.keyset or (cursor is None and str(number) != "1"):
+            self.current_page = super().page(number)
+            return self.current_page
+
+        direction, values = cursor or (NEXT, None)
+        if values is not None and len(values) != len(self.columns):
+            raise InvalidPage("Курсор не соответствует сортировке")
+        queryset = self.object_list.annotate(
+            **{f"_keyset_{i}": F(path) for i, (path, _) in enumerate(self.columns)}
+        )
+        if values is not None:
+            nulls_largest = connections[queryset.db].features.nulls_order_largest
+            queryset = queryset.filter(
+                seek_condition(self.columns, values, nulls_largest, direction == NEXT)
+            )
+        if direction == PREVIOUS:
+            queryset = queryset.reverse()
+        rows = list(queryset[: self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if direction == PREVIOUS:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            first, last = self._values(rows[0]), self._values(rows[-1])
+            if more or direction == PREVIOUS:
+                next_cursor = encode_cursor(NEXT, last)
+            if values is not None and (more or direction == NEXT):
+                previous_cursor = encode_cursor(PREVIOUS, first)
+        self.current_page = KeysetPage(rows, 1, self, next_cursor, previous_cursor)
+        return self.current_page
+
+    def _values(self, obj):
+        return [getattr(obj, f"_keyset_{i}") for i in range(len(self.columns))]
+
+    def _query(self, token):
+        params = self.request.GET.copy()
+        params.pop(PAGE_VAR, None)
+        if token:
+            params[PAGE_VAR] = token
+        return "?" + params.urlencode()
+
+    @property
+    def first_query(self):
+        return self._query(None)
+
+    @property
+    def next_query(self):
+        page = self.current_page
+        return self._query(getattr(page, "next_cursor", None)) if page else ""
+
+    @property
+    def previous_query(self):
+        page = self.current_page
+        return self._query(getattr(page, "previous_cursor", None)) if page else ""
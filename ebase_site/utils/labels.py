@@ -0,0 +1,69 @@
+"""Предвычисленные подписи записей (колонка ``label``).
+
+``__str__`` некоторых моделей собирает текст из связанных записей:
+подменный прибор — из оборудования и списка комплектующих, ремонт —
+из единицы учёта и вида работ, отгрузка — из строк с запчастями. В
+выпадающих списках, заголовках inline-форм, журнале админки и выгрузках
+это давало запросы на каждую запись. Такие модели хранят готовую подпись
+в поле ``label``, а ``__str__`` отдаёт её без обращения к БД.
+
+Текст подписи модель отдаёт методом ``build_label()``, связи для него
+перечисляет в ``label_select_related`` и ``label_prefetch_related``.
+Своя подпись записи собирается в ``save()``. При изменении связанных
+записей подписи пересобираются сигналами (строки отгрузки и комплектующие
+— через ``label_scheduler``, один раз на всё сохранение из админки),
+а целиком — командой ``manage.py rebuild_labels``.
+"""
+from utils.deferred import CoalescingScheduler
+
+
+class LabelMixin:
+    """``__str__`` из поля ``label``; пока подпись не собрана — из ``build_label()``."""
+
+    label_select_related = ()
+    label_prefetch_related = ()
+
+    def build_label(self) -> str:
+        raise NotImplementedError
+
+    def __str__(self):
+        return self.label or self.build_label()
+
+    def save(self, *args, **kwargs):
+        self.label = self.build_label()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {"label"}
+        super().save(*args, **kwargs)
+
+
+def refresh_labels(queryset, batch_size=500) -> int:
+    """Пересобирает подписи записей queryset-а, сохраняя только изменённые.
+
+    Возвращает количество обновлённых записей.
+    """
+    model = queryset.model
+    # select_related() без аргументов подтянул бы все связи
+    if model.label_select_related:
+        queryset = queryset.select_related(*model.label_select_related)
+    queryset = queryset.prefetch_related(*model.label_prefetch_related)
+    changed, total = [], 0
+    for obj in queryset.iterator(chunk_size=batch_size):
+        label = obj.build_label()
+        if label != obj.label:
+            obj.label = label
+            changed.append(obj)
+        if len(changed) >= batch_size:
+            total += model._default_manager.bulk_update(changed, ["label"])
+            changed = []
+    if changed:
+        total += model._default_manager.bulk_update(changed, ["label"])
+    return total
+
+
+def label_scheduler(model) -> CoalescingScheduler:
+    """Планировщик пересборки подписей записей ``model`` по их ID."""
+    return CoalescingScheduler(
+        f"{model._meta.model_name}_labels",
+        lambda pks: refresh_labels(model._default_manager.filter(pk__in=pks)),
+    )
@@ -0,0 +1,121 @@
+"""Фильтры боковой панели списков админки без запросов на каждый показ.
+
+``CachedChoicesFilter`` — варианты фильтра (например, сотрудники из
+командировок) строятся запросом один раз и дальше берутся из процессного
+кэша ``filter_choices``. Кэш фильтра сбрасывается сигналами post_save,
+post_delete и m2m_changed моделей из ``choices_models`` в том процессе,
+где запись изменили; другие воркеры увидят изменение не позже чем через
+``settings.FILTER_CHOICES_CACHE_TTL`` секунд. Фильтрам по справочникам
+из ``directory.cache`` свой кэш не нужен — варианты строятся из
+``directory_cache``.
+
+``AutocompleteListFilter`` — фильтр по связи с большим справочником
+(контракты). Варианты не выводятся списком: значение выбирается в поле
+select2, которое подгружает их постранично по мере ввода через autocomplete
+админки, поэтому стоимость боковой панели не растёт вместе с реестром.
+"""
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import ValidationError
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from utils.ttl_cache import TTLCache
+
+
+filter_choices = TTLCache("FILTER_CHOICES_CACHE_TTL")
+
+
+class CachedChoicesFilter(admin.SimpleListFilter):
+    """SimpleListFilter с вариантами из ``filter_choices``.
+
+    Подкласс строит варианты в ``load_choices()`` и перечисляет
+    в ``choices_models`` модели (в т.ч. промежуточные модели M2M),
+    от которых они зависят.
+    """
+
+    choices_models = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        key = cls.choices_key()
+
+        def invalidate(sender, **kwargs):
+            filter_choices.invalidate(key)
+
+        for model in cls.choices_models:
+            for signal in (post_save, post_delete, m2m_changed):
+                signal.connect(
+                    invalidate, sender=model, weak=False, dispatch_uid=f"filter_choices:{key}"
+                )
+
+    @classmethod
+    def choices_key(cls) -> str:
+        return f"{cls.__module__}.{cls.__qualname__}"
+
+    def load_choices(self):
+        """[(значение, подпись)] для списка фильтра."""
+        raise NotImplementedError
+
+    def lookups(self, request, model_admin):
+        return list(filter_choices.get(self.choices_key(), lambda: tuple(self.load_choices())))
+
+
+class AutocompleteListFilter(admin.SimpleListFilter):
+    """Фильтр по связи ``field_name`` с поиском вместо списка вариантов.
+
+    У ModelAdmin связанной модели должны быть ``search_fields``. Ссылками
+    выводятся только ``static_choices`` (например, «Без контракта»), для них
+    фильтр сам реализует ``queryset()``. Скрипты select2 подключает
+    ``MainModelAdmin.media``.
+    """
+
+    template = "admin/autocomplete_filter.html"
+    field_name = None
+    static_choices = ()
+
+    def __init__(self, request, params, model, model_admin):
+        self.field = model._meta.get_field(self.field_name)
+        self.admin_site = model_admin.admin_site
+        super().__init__(request, params, model, model_admin)
+
+    @classmethod
+    def filter_media(cls, model_admin) -> forms.Media:
+        field = model_admin.model._meta.get_field(cls.field_name)
+        return AutocompleteSelect(field, model_admin.admin_site).media + forms.Media(
+            js=("admin/js/jquery.init.js", "ebase/js/autocomplete_filter.js")
+        )
+
+    def lookups(self, request, model_admin):
+        return list(self.static_choices)
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        self.query_string = changelist.get_query_string(remove=[self.parameter_name])
+        yield from super().choices(changelist)
+
+    def search_widget(self) -> str:
+        """Поле select2; выбранная запись подставляется одним запросом по pk."""
+        value = self.value()
+        if value in dict(self.static_choices):
+            value = None
+        try:
+            self.field.target_field.to_python(value)
+        except ValidationError:
+            value = None
+        field = forms.ModelChoiceField(
+            queryset=self.field.related_model._default_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(
+                self.field,
+                self.admin_site,
+                attrs={
+                    "class": "autocomplete-filter",
+                    "data-parameter-name": self.parameter_name,
+                    "data-query-string": getattr(self, "query_string", "?"),
+                },
+            ),
+        )
+        return field.widget.render(self.parameter_name, value)
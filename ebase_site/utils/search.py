@@ -0,0 +1,168 @@
+"""Полнотекстовый и триграммный поиск в админке (PostgreSQL).
+
+У моделей с поиском есть поле ``search_document`` (tsvector) — поисковый
+документ из названий, номеров и комментариев с весами A/B/C и русским
+стеммингом. Текст документа модель отдаёт методом
+``search_document_parts()``, пересобирается он сигналами при изменении
+записи и связанных с ней записей, а целиком — командой
+``manage.py rebuild_search_documents``.
+
+Поиск в админке (``FullTextSearchMixin``) находит запись, если каждое
+слово запроса совпало с документом по префиксу («анализатор» найдёт
+«анализаторы») или встречается как подстрока в одном из ``search_fields``
+(серийные номера, артикулы). Подстроки ищутся через ILIKE, который
+на Postgres обслуживают GIN-индексы pg_trgm. Результаты сортируются
+по релевантности, пока пользователь не выбрал сортировку по колонке.
+
+На других СУБД (SQLite в тестах) работает стандартный поиск Django.
+"""
+import operator
+import re
+from functools import reduce
+
+from django.contrib.admin.utils import lookup_spawns_duplicates
+from django.contrib.admin.views.main import ORDER_VAR
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+)
+from django.db import connection
+from django.db.models import F, FloatField, Q, TextField, Value
+from django.db.models.functions import Coalesce
+from django.utils.text import smart_split, unescape_string_literal
+
+from utils.counts import CountedChangeList
+
+SEARCH_CONFIG = "russian"
+SEARCH_WEIGHTS = ("A", "B", "C", "D")
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def search_supported() -> bool:
+    return connection.vendor == "postgresql"
+
+
+def split_search_terms(search_term) -> list:
+    """Слова запроса так же, как их разбирает поиск Django (с фразами в кавычках)."""
+    terms = []
+    for bit in smart_split(search_term):
+        if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+            bit = unescape_string_literal(bit)
+        if bit:
+            terms.append(bit)
+    return terms
+
+
+def tsquery_text(term) -> str:
+    """Префиксный tsquery для слова запроса: ``AB-12`` -> ``AB:* & 12:*``."""
+    return " & ".join(f"{word}:*" for word in _WORD_RE.findall(term))
+
+
+def build_search_vector(parts):
+    """Выражение tsvector из пар (текст, вес); None, если текста нет."""
+    texts = {}
+    for text, weight in parts:
+        if text:
+            texts.setdefault(weight, []).append(str(text))
+    vector = None
+    for weight in SEARCH_WEIGHTS:
+        if weight not in texts:
+            continue
+        part = SearchVector(
+            Value(" ".join(texts[weight]), output_field=TextField()),
+            config=SEARCH_CONFIG,
+            weight=weight,
+        )
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def refresh_search_documents(queryset, batch_size=500) -> int:
+    """Пересобирает ``search_document`` у записей queryset-а.
+
+    Связи, нужные документу, модель перечисляет в атрибутах
+    ``search_select_related`` и ``search_prefetch_related``.
+    Документ пишется через ``update()``, сигналы модели не вызываются.
+    """
+    if not search_supported():
+        return 0
+    model = queryset.model
+    queryset = queryset.select_related(
+        *getattr(model, "search_select_related", ())
+    ).prefetch_related(*getattr(model, "search_prefetch_related", ()))
+    total = 0
+    for obj in queryset.iterator(chunk_size=batch_size):
+        model._default_manager.filter(pk=obj.pk).update(
+            search_document=build_search_vector(obj.search_document_parts())
+        )
+        total += 1
+    return total
+
+
+class SearchRankChangeList(CountedChangeList):
+    """Сначала самые релевантные результаты поиска."""
+
+    def get_ordering(self, request, queryset):
+        ordering = super().get_ordering(request, queryset)
+        if "search_rank" in queryset.query.annotations and ORDER_VAR not in self.params:
+            ordering = ["-search_rank", *ordering]
+        return ordering
+
+
+class FullTextSearchMixin:
+    """Поиск по ``search_document`` и ``search_fields`` с ранжированием.
+
+    ``search_similarity_field`` — поле, похожесть на которое (pg_trgm)
+    добавляется к рангу: обычно название или серийный номер.
+    """
+
+    search_document_field = "search_document"
+    search_similarity_field = None
+
+    def get_changelist(self, request, **kwargs):
+        return SearchRankChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        search_fields = self.get_search_fields(request)
+        terms = split_search_terms(search_term)
+        if not (terms and search_supported()):
+            return super().get_search_results(request, queryset, search_term)
+
+        query = None
+        condition = Q()
+        for term in terms:
+            term_match = reduce(
+                operator.or_,
+                (self._substring_match(field, term) for field in search_fields),
+                Q(),
+            )
+            word = tsquery_text(term)
+            if word:
+                term_query = SearchQuery(word, config=SEARCH_CONFIG, search_type="raw")
+                term_match |= Q(**{self.search_document_field: term_query})
+                query = term_query if query is None else query & term_query
+            condition &= term_match
+
+        rank = Value(0.0, output_field=FloatField())
+        if query is not None:
+            rank = Coalesce(
+                SearchRank(F(self.search_document_field), query),
+                rank,
+                output_field=FloatField(),
+            )
+        if self.search_similarity_field:
+            rank = rank + TrigramSimilarity(self.search_similarity_field, search_term)
+
+        queryset = queryset.filter(condition).annotate(search_rank=rank)
+        return queryset, False
+
+    def _substring_match(self, field, term):
+        lookup = Q(**{f"{field}__icontains": term})
+        if lookup_spawns_duplicates(self.opts, field):
+            # Многозначные связи — подзапросом, чтобы не было дублей
+            # и changelist не терял аннотацию ранга на distinct
+            return Q(pk__in=self.model._default_manager.filter(lookup).values("pk"))
+        return lookup
@@ -0,0 +1,201 @@
+from io import BytesIO
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, TestCase, override_settings
+from openpyxl import load_workbook
+
+from clients.models import Client
+from contracts.models import Contract
+from directory.models import City, Unit
+from ebase.models import Equipment
+from spare_part.models import SparePart
+from utils.counts import RowCounts, row_counts
+from utils.export_plan import get_export_plan
+from utils.export_to_xlsx import export_to_excel_formatted, iter_export_rows
+from utils.search import (
+    build_search_vector,
+    split_search_terms,
+    tsquery_text,
+)
+
+
+class ExportToExcelTests(TestCase):
+    def setUp(self):
+        self.modeladmin = admin.site._registry[Equipment]
+        self.request = RequestFactory().get("/")
+
+    def _export(self, queryset):
+        response = export_to_excel_formatted(self.modeladmin, self.request, queryset)
+        content = b"".join(response.streaming_content)
+        return load_workbook(BytesIO(content)).active
+
+    def test_streamed_file_contains_headers_and_rows(self):
+        """Потоковая выгрузка открывается openpyxl и содержит все строки."""
+        for i in range(3):
+            Equipment.objects.create(full_name=f"Прибор {i}", short_name=f"П{i}")
+
+        ws = self._export(Equipment.objects.order_by("full_name"))
+
+        rows = list(ws.iter_rows(values_only=True))
+        self.assertEqual(rows[0][0], "Полное наименование")
+        self.assertEqual([row[0] for row in rows[1:]], ["Прибор 0", "Прибор 1", "Прибор 2"])
+        self.assertTrue(ws["A1"].font.bold)
+
+    def test_column_width_and_special_characters(self):
+        """Ширина колонки ограничена, спецсимволы XML экранируются."""
+        Equipment.objects.create(full_name="<A & B>" + "x" * 100, short_name="\x01A")
+
+        ws = self._export(Equipment.objects.all())
+
+        self.assertEqual(ws["A2"].value, "<A & B>" + "x" * 100)
+        self.assertEqual(ws["B2"].value, "A")
+        self.assertEqual(ws.column_dimensions["A"].width, 50)
+
+
+class ExportPlanTests(TestCase):
+    def setUp(self):
+        self.modeladmin = admin.site._registry[Contract]
+        self.request = RequestFactory().get("/")
+        city, _ = City.objects.get_or_create(name="Москва", region=None)
+        for i in range(3):
+            client = Client.objects.create(
+                name=f"Клиент {i}", city=city, inn=f"12345678900{i}"
+            )
+            Contract.objects.create(
+                client=client,
+                contract_number=f"CNT-{i}",
+                conclusion_date="2026-01-15",
+                contract_amount=1000,
+            )
+
+    def test_proxy_columns_read_fields_directly(self):
+        """Колонки из export_fields выгружаются по пути к полю, без HTML."""
+        plan = get_export_plan(self.modeladmin)
+        headers = plan.headers
+
+        self.assertIn("client", plan.select_related)
+        rows = list(
+            iter_export_rows(self.modeladmin, Contract.objects.order_by("contract_number"))
+        )
+        row = dict(zip(headers, rows[0]))
+        self.assertEqual(row["Клиент"], "Клиент 0")
+        self.assertEqual(row["Оплата?"], "поступлений нет")
+        self.assertEqual(row["Дата заключения"], "2026-01-15 00:00:00")
+
+    def test_export_query_count_does_not_depend_on_rows(self):
+        """Связанные данные подтягиваются одним запросом, а не на каждую строку."""
+        with self.assertNumQueries(1):
+            rows = list(iter_export_rows(self.modeladmin, Contract.objects.all()))
+        self.assertEqual(len(rows), 3)
+
+    def test_plan_is_cached_per_admin(self):
+        self.assertIs(
+            get_export_plan(self.modeladmin), get_export_plan(self.modeladmin)
+        )
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.modeladmin = admin.site._registry[SparePart]
+        self.request = RequestFactory().get("/", {"q": "фильтр"})
+        Unit.objects.create(short_name="шт.", full_name="штука")
+
+    def test_query_helpers(self):
+        self.assertEqual(split_search_terms('"лампа накаливания" AB-12'), ["лампа накаливания", "AB-12"])
+        self.assertEqual(tsquery_text("AB-12"), "AB:* & 12:*")
+        self.assertEqual(tsquery_text("'&!"), "")
+        self.assertIsNone(build_search_vector([(None, "A"), ("", "B")]))
+
+    def test_falls_back_to_default_search_without_postgres(self):
+        SparePart.objects.create(name="фильтр воздушный", article="F-1")
+        SparePart.objects.create(name="Лампа", article="L-1")
+
+        queryset, _ = self.modeladmin.get_search_results(
+            self.request, SparePart.objects.all(), "фильтр"
+        )
+
+        self.assertEqual([part.article for part in queryset], ["F-1"])
+        self.assertNotIn("search_rank", queryset.query.annotations)
+
+    def test_postgres_search_is_ranked_without_duplicates(self):
+        with mock.patch("utils.search.search_supported", return_value=True):
+            queryset, may_have_duplicates = self.modeladmin.get_search_results(
+                self.request, SparePart.objects.all(), "фильтр AB-12"
+            )
+
+        self.assertFalse(may_have_duplicates)
+        self.assertIn("search_rank", queryset.query.annotations)
+        self.assertIn("@@", str(queryset.query))
+
+
+class RowCountsTests(TestCase):
+    def setUp(self):
+        row_counts.clear()
+        self.addCleanup(row_counts.clear)
+        for i in range(3):
+            Equipment.objects.create(full_name=f"Прибор {i}", short_name=f"П{i}")
+
+    def test_exact_count_is_cached_per_filter(self):
+        queryset = Equipment.objects.filter(full_name__startswith="Прибор")
+        self.assertEqual(row_counts.count(queryset), (3, False))
+        with self.assertNumQueries(0):
+            self.assertEqual(row_counts.count(queryset.order_by("-full_name")), (3, False))
+
+        self.assertEqual(row_counts.count(queryset.filter(short_name="П1")), (1, False))
+        self.assertEqual(row_counts.stats(), {"hits": 1, "misses": 2, "estimates": 0})
+
+    def test_write_to_model_invalidates_counts(self):
+        row_counts.count(Equipment.objects.all())
+        Equipment.objects.create(full_name="Прибор 3", short_name="П3")
+
+        self.assertEqual(row_counts.count(Equipment.objects.all()), (4, False))
+
+    @override_settings(COUNT_CACHE_SIZE=2)
+    def test_cache_is_bounded(self):
+        for i in range(3):
+            row_counts.count(Equipment.objects.filter(short_name=f"П{i}"))
+
+        self.assertEqual(len(row_counts._counts), 2)
+        # Вытеснен самый старый счётчик
+        with self.assertNumQueries(1):
+            row_counts.count(Equipment.objects.filter(short_name="П0"))
+
+    def test_expired_counts_are_dropped_on_write(self):
+        with mock.patch("utils.counts.time.monotonic", return_value=0):
+            row_counts.count(Equipment.objects.all())
+            row_counts.count(Unit.objects.all())
+        with mock.patch("utils.counts.time.monotonic", return_value=1000):
+            row_counts.count(Equipment.objects.filter(short_name="П0"))
+
+        self.assertEqual(len(row_counts._counts), 1)
+        self.assertEqual(list(row_counts._keys_by_model), ["ebase.Equipment"])
+
+    def test_invalidation_touches_only_the_saved_model(self):
+        row_counts.count(Equipment.objects.all())
+        row_counts.count(Unit.objects.all())
+        Unit.objects.create(short_name="шт")
+
+        self.assertEqual([key[0] for key in row_counts._counts], ["ebase.Equipment"])
+
+    def test_estimate_above_threshold(self):
+        with mock.patch.object(RowCounts, "estimate", return_value=50000):
+            self.assertEqual(row_counts.count(Equipment.objects.all()), (50000, True))
+            self.assertEqual(
+                row_counts.count(Equipment.objects.all(), estimate=False), (3, False)
+            )
+        with mock.patch.object(RowCounts, "estimate", return_value=10):
+            self.assertEqual(row_counts.count(Equipment.objects.filter(pk__gt=0)), (3, False))
+
+    def test_changelist_counts_are_reused(self):
+        user = get_user_model().objects.create_superuser(username="admin", password="pass")
+        self.client.force_login(user)
+        self.client.get("/admin/ebase/equipment/")
+
+        with mock.patch("django.db.models.query.QuerySet.count") as count:
+            response = self.client.get("/admin/ebase/equipment/")
+
+        self.assertEqual(response.status_code, 200)
+        count.assert_not_called()
+        self.assertEqual(response.context["cl"].result_count, 3)
@@ -0,0 +1,50 @@
+"""Процессный кэш значений с ограниченным сроком жизни.
+
+Общая основа кэшей, которые сбрасываются сигналами в том процессе, где
+изменили данные: справочников (``directory.cache``) и вариантов фильтров
+админки (``utils.list_filters``). Другие воркеры gunicorn не получают
+сигналов, поэтому значение перечитывается не реже, чем раз в срок из
+настройки ``ttl_setting``.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+
+class TTLCache:
+    def __init__(self, ttl_setting: str):
+        # Срок читается из настроек при каждом обращении (override_settings в тестах)
+        self.ttl_setting = ttl_setting
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+
+    def get(self, key, loader):
+        """Значение ``key``; при промахе или по истечении срока — ``loader()``."""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < getattr(settings, self.ttl_setting):
+            self.hits[key] = self.hits.get(key, 0) + 1
+            return entry[1]
+        with self._lock:
+            self.misses[key] = self.misses.get(key, 0) + 1
+            value = loader()
+            self._entries[key] = (time.monotonic(), value)
+        return value
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits.clear()
+        self.misses.clear()
+
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов по ключам."""
+        keys = sorted(set(self.hits) | set(self.misses))
+        return {
+            key: {"hits": self.hits.get(key, 0), "misses": self.misses.get(key, 0)}
+            for key in keys
+        }